@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+
+class AssetNameResolver:
+    """
+    Resolves ticker symbols to asset names and metadata (currency, exchange, ...).
+
+    Results are kept in an LRU cache with a time to live, optionally persisted to a JSON file so they
+    survive restarts. Cache misses are fetched concurrently on a bounded thread pool, and callers only
+    wait up to a timeout: symbols that are still resolving fall back to the ticker itself and land in
+    the cache for the next call. Failed lookups are cached too, for a shorter time, so that unknown or
+    delisted symbols are not fetched again on every call.
+    """
+
+    def __init__(self, fetch: Callable[[str], dict], cache_path: str = None, max_entries: int = 10000,
+                 ttl: float = 7 * 24 * 3600, failure_ttl: float = 3600, max_workers: int = 8, timeout: float = 2.0):
+        """
+        :param fetch: Function returning the metadata dict of a ticker, e.g. yfinance's Ticker(t).info.
+        :param cache_path: Optional JSON file used to persist the cache.
+        :param max_entries: Maximum number of tickers kept, least recently used ones are evicted first.
+        :param ttl: Time to live of a cached entry, in seconds.
+        :param failure_ttl: Time to live of the fallback entry of a failed lookup, in seconds.
+        :param max_workers: Maximum number of concurrent fetches.
+        :param timeout: Default number of seconds resolve() waits for cache misses.
+        """
+        self._fetch = fetch
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asset-names')
+        self._entries: 'OrderedDict[str, dict]' = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # Serializes the writes of the cache file, without blocking the lookups
+        self._save_lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str], dict]) -> 'AssetNameResolver':
+        """
+        Build a resolver persisted to ASSET_NAME_CACHE if set, or to the price store directory if
+        PRICE_STORE_DIR is set. Otherwise the cache only lives in memory.
+        """
+        cache_path = os.environ.get('ASSET_NAME_CACHE')
+        if not cache_path and os.environ.get('PRICE_STORE_DIR'):
+            cache_path = os.path.join(os.environ['PRICE_STORE_DIR'], 'asset_names.json')
+        return cls(fetch, cache_path=cache_path)
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                self._entries = OrderedDict(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load asset name cache {self.cache_path}: {e}")
+
+    def _save(self):
+        # Must be called without the lock held: only the snapshot of the entries is taken under it
+        if not self.cache_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                entries = dict(self._entries)
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.cache_path)
+
+    def _cached(self, ticker: str) -> Optional[dict]:
+        # Must be called with the lock held
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        ttl = self.failure_ttl if entry.get('failed') else self.ttl
+        if entry['fetched_at'] + ttl < time.time():
+            del self._entries[ticker]
+            return None
+        self._entries.move_to_end(ticker)
+        return entry
+
+    def _resolve_one(self, ticker: str) -> dict:
+        try:
+            info = self._fetch(ticker) or {}
+            entry = {
+                'name': info.get('longName') or info.get('shortName') or ticker,
+                'currency': info.get('currency'),
+                'exchange': info.get('exchange'),
+                'quote_type': info.get('quoteType'),
+                'fetched_at': time.time(),
+            }
+        except Exception as e:
+            logging.warning(f"Could not fetch name for {ticker}: {e}")
+            entry = {'name': ticker, 'currency': None, 'exchange': None, 'quote_type': None,
+                     'fetched_at': time.time(), 'failed': True}
+
+        with self._lock:
+            self._entries[ticker] = entry
+            self._entries.move_to_end(ticker)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._pending.pop(ticker, None)
+            # Persist once a batch of fetches is done rather than after every single ticker
+            done = not self._pending
+        if done:
+            self._save()
+        return entry
+
+    def _submit_misses(self, tickers: List[str]) -> Dict[str, Future]:
+        futures = {}
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                if self._cached(ticker) is not None:
+                    continue
+                if ticker not in self._pending:
+                    self._pending[ticker] = self._executor.submit(self._resolve_one, ticker)
+                futures[ticker] = self._pending[ticker]
+        return futures
+
+    def warm_up(self, tickers: List[str]) -> List[Future]:
+        """
+        Start resolving every ticker that is not cached yet, without waiting for the results.
+        Meant to be called at start-up with the standard universe, or as soon as a request's tickers are known.
+
+        :return: The futures of the fetches that were started or already running.
+        """
+        return list(self._submit_misses(tickers).values())
+
+    def metadata(self, tickers: List[str], timeout: float = None) -> Dict[str, dict]:
+        """
+        Get the cached metadata of several tickers, fetching the missing ones for at most `timeout` seconds.
+
+        :return: A dictionary {ticker: metadata} holding only the tickers resolved in time. The metadata of a
+                 failed lookup is the ticker as name, flagged with 'failed'.
+        """
+        futures = self._submit_misses(tickers)
+        if futures:
+            wait(futures.values(), timeout=self.timeout if timeout is None else timeout)
+
+        result = {}
+        with self._lock:
+            for ticker in tickers:
+                entry = self._cached(ticker)
+                if entry is not None:
+                    result[ticker] = entry
+        return result
+
+    def resolve(self, tickers: List[str], timeout: float = None) -> Dict[str, str]:
+        """
+        Get the full name of several tickers.
+
+        :return: A dictionary {ticker: full_name}, falling back to the ticker when it could not be resolved in time.
+        """
+        metadata = self.metadata(tickers, timeout=timeout)
+        return {ticker: metadata[ticker]['name'] if ticker in metadata else ticker for ticker in tickers}
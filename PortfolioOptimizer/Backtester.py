@@ -0,0 +1,274 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.BlackLitterman import BlackLitterman
+from PortfolioOptimizer.CovarianceCalculator import CovarianceCalculator, SampleCovarianceCalculator, risk_factor
+from PortfolioOptimizer.ExpectedReturnCalculator import MarketInputs
+from PortfolioOptimizer.HRPCalculator import HRPCalculator
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+from PortfolioOptimizer.PriceStore import PriceStore
+from PortfolioOptimizer.ProblemCache import PortfolioProblem
+from PortfolioOptimizer.RiskMetrics import RiskMetrics
+from PortfolioOptimizer.ViewCompiler import ViewCompiler
+
+
+class Backtester:
+    """
+    Walk-forward backtest of a strategy: on every rebalance date the weights are optimized on the returns of the
+    previous `lookback` days only, then held (drifting with prices) until the next rebalance date.
+
+    The lookback window is rolled from one rebalance date to the next (MarketState.rolled), and the max Sharpe and
+    minimum volatility problems are built once with their inputs as parameters, then re-solved warm-started from
+    the previous weights. Rebalance dates are split into contiguous blocks run in parallel across processes, every
+    block starting from a fresh window.
+    """
+    STRATEGIES = ("max_sharpe", "min_volatility", "hrp", "black_litterman")
+    # Pandas periods of every rebalance frequency
+    REBALANCE_FREQUENCIES = {"weekly": "W", "monthly": "M", "quarterly": "Q", "yearly": "Y"}
+
+    def __init__(self, prices: Union[pd.DataFrame, PricePanel], strategy: str = "max_sharpe", lookback: int = 252,
+                 rebalance: str = "monthly", risk_free_rate: float = 0.02,
+                 covariance_calculator: CovarianceCalculator = None, constraints: dict = None,
+                 linkage_method: str = "single", views: List[dict] = None, market_prices: pd.Series = None,
+                 min_observations: int = None, initial_value: float = 10000, frequency: int = 252):
+        """
+        :param prices: Daily prices, one column per asset. Assets may start and end at any date.
+        :param strategy: max_sharpe, min_volatility, hrp or black_litterman.
+        :param lookback: Number of daily returns the weights are estimated on.
+        :param rebalance: weekly, monthly, quarterly or yearly (last trading day of each period).
+        :param risk_free_rate: Annual risk-free rate, for the Sharpe ratios and the Black-Litterman prior.
+        :param covariance_calculator: Covariance estimator, sample covariance if None.
+        :param constraints: Maximum weight of some assets, e.g. {"GLD": 0.15}.
+        :param linkage_method: Clustering linkage of HRP.
+        :param views: Black-Litterman views (see BlackLitterman.user_input_to_pq). Views on assets that are not
+                      investable on a rebalance date are ignored on that date.
+        :param market_prices: Daily prices of the market benchmark, required by Black-Litterman's CAPM prior.
+        :param min_observations: Returns an asset needs within the window to be investable, lookback / 2 by default.
+        :param initial_value: Value of the portfolio on the first rebalance date.
+        :param frequency: Number of returns per year.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(self.STRATEGIES)}")
+        if rebalance not in self.REBALANCE_FREQUENCIES:
+            raise ValueError(f"rebalance must be one of {', '.join(self.REBALANCE_FREQUENCIES)}")
+        if strategy == "black_litterman" and market_prices is None:
+            raise ValueError("market_prices are required by the Black-Litterman prior")
+
+        prices = as_frame(prices)
+        self.prices = prices
+        self.returns = prices.astype(float, copy=False).ffill().pct_change(fill_method=None).iloc[1:]
+        self.tickers = list(prices.columns)
+        self.strategy = strategy
+        self.lookback = lookback
+        self.rebalance = rebalance
+        self.risk_free_rate = risk_free_rate
+        self.covariance_calculator = covariance_calculator or SampleCovarianceCalculator(frequency)
+        self.constraints = constraints or {}
+        self.linkage_method = linkage_method
+        self.views = views or []
+        self.market_prices = market_prices
+        self.min_observations = min_observations if min_observations is not None else max(2, lookback // 2)
+        self.initial_value = initial_value
+        self.frequency = frequency
+
+    @classmethod
+    def from_price_store(cls, store: PriceStore, tickers: List[str], start_date, end_date,
+                         field: str = 'Adj Close', benchmark: str = None, dtype=np.float32,
+                         **kwargs) -> 'Backtester':
+        """
+        Backtest over the prices held by a PriceStore, without any download.
+
+        :param benchmark: Ticker of the market benchmark in the store, e.g. '^GSPC' for Black-Litterman.
+        :param dtype: Precision the prices are held in, see PricePanel.
+        """
+        prices = store.read_panel(tickers, field, start_date, end_date, dtype=dtype)
+        if prices.empty:
+            raise ValueError("The price store has no data for the requested tickers and dates")
+        if benchmark is not None:
+            market_prices = store.read([benchmark], field, start_date, end_date)
+            kwargs['market_prices'] = market_prices[benchmark] if not market_prices.empty else None
+        return cls(prices, **kwargs)
+
+    def rebalance_positions(self) -> np.ndarray:
+        """
+        :return: Positions, in the returns, of the rebalance dates: the last trading day of every period, once the
+                 lookback window is full.
+        """
+        dates = self.returns.index
+        periods = dates.to_period(self.REBALANCE_FREQUENCIES[self.rebalance])
+        last_of_period = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+        return last_of_period[last_of_period >= self.lookback - 1]
+
+    def run(self, max_workers: int = 1, executor: Executor = None) -> Dict:
+        """
+        :param max_workers: Number of workers the rebalance dates are split across.
+        :param executor: Executor running the workers, a process pool is created for the call if None.
+        :return: Dictionary with the equity curve, the weights and turnover of every rebalance, the performance of
+                 the backtest and the time it took.
+        """
+        started = time.perf_counter()
+        positions = self.rebalance_positions()
+        if len(positions) == 0:
+            raise ValueError(f"Not enough history: the first rebalance needs {self.lookback} daily returns")
+
+        num_blocks = max(1, min(max_workers, len(positions)))
+        bounds = [len(positions) * i // num_blocks for i in range(num_blocks + 1)]
+        blocks = [positions[bounds[i]:bounds[i + 1]] for i in range(num_blocks)]
+        if len(blocks) == 1:
+            results = [self._run_block(positions)]
+        elif executor is not None:
+            results = list(executor.map(self._run_block, blocks))
+        else:
+            with ProcessPoolExecutor(max_workers=len(blocks), mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = list(pool.map(self._run_block, blocks))
+        weights = np.vstack([block_weights for block_weights, _ in results])
+        failed = [date for _, block_failed in results for date in block_failed]
+
+        result = self._evaluate(positions, weights)
+        result["failed_rebalances"] = failed
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        result["workers"] = len(blocks)
+        logging.info(f"Backtested {self.strategy} on {len(self.tickers)} assets over {len(positions)} rebalances "
+                     f"in {result['seconds']} s on {len(blocks)} worker(s)")
+        return result
+
+    def _run_block(self, positions: np.ndarray):
+        """
+        Weights of a contiguous block of rebalance dates, rolling the lookback window from one date to the next.
+
+        :return: The weights (rebalance dates x assets) and the dates where the optimization failed, where the
+                 previous weights are kept.
+        """
+        # Problems over all the tickers, with a zero upper bound for the assets not investable on a date. They are
+        # kept for the block rather than shared through the problem cache, whose dense problems stop at a hundred
+        # assets: a backtest re-solves them at every rebalance date, which repays the compilation at any size.
+        problems = {kind: PortfolioProblem(kind, len(self.tickers)) for kind in ("max_sharpe", "min_volatility")} \
+            if self.strategy in ("max_sharpe", "min_volatility") else None
+        weights = np.zeros((len(positions), len(self.tickers)))
+        failed = []
+        state, end = None, None
+        for i, position in enumerate(positions):
+            start = position + 1 - self.lookback
+            if state is None or start >= end:
+                state = MarketState(returns=self.returns.iloc[start:position + 1], frequency=self.frequency)
+            else:
+                state = state.rolled(self.returns.iloc[end:position + 1], dropped=start - (end - self.lookback))
+            end = position + 1
+
+            counts = state.counts
+            investable = counts.index[counts >= self.min_observations].tolist()
+            try:
+                weights[i] = self._optimize(state, investable, problems, slice(start, end))
+            except Exception as e:
+                date = self.returns.index[position]
+                logging.warning(f"Rebalance of {date.date()} failed, keeping the previous weights: {e}")
+                failed.append(date.date().isoformat())
+                weights[i] = weights[i - 1] if i > 0 else 0.0
+        return weights, failed
+
+    def _optimize(self, state: MarketState, investable: List[str], problems: Optional[Dict[str, PortfolioProblem]],
+                  rows: slice):
+        """
+        :param rows: Rows of the returns in the window.
+        :return: The weights of the strategy on a window, an array over all the tickers (0 if not investable).
+        """
+        weights = np.zeros(len(self.tickers))
+        if not investable:
+            return weights
+        index = [self.tickers.index(ticker) for ticker in investable]
+        window = state.subset(investable)
+
+        if self.strategy == "hrp":
+            hrp = HRPCalculator(linkage_method=self.linkage_method, market_state=window,
+                                covariance_calculator=self.covariance_calculator)
+            hrp_weights = hrp.calculate_weights(constraints=self.constraints, cutoff=0, rounding=None)
+            weights[index] = [hrp_weights[ticker] for ticker in investable]
+            return weights
+
+        if self.strategy == "black_litterman":
+            # Returns rows [start, end) come from prices rows [start, end + 1)
+            prices = self.prices.iloc[rows.start:rows.stop + 1][investable]
+            market_prices = self.market_prices.loc[prices.index[0]:prices.index[-1]]
+            market_inputs = MarketInputs(prices.index[0], prices.index[-1], risk_free_rate=self.risk_free_rate,
+                                         market_prices=market_prices)
+            # Views on assets not listed yet are left out, or restricted to the listed assets of bulk views
+            views = ViewCompiler(investable).restrict(self.views)
+            bl = BlackLitterman(prices, investable, views=views, market_inputs=market_inputs, market_state=window,
+                                covariance_calculator=self.covariance_calculator)
+            bl_weights = bl.optimize_with_black_litterman(risk_free_rate=self.risk_free_rate)[0]
+            weights[index] = [bl_weights[ticker] for ticker in investable]
+            return weights
+
+        covariance = np.asarray(self.covariance_calculator.calculate_covariance(None, market_state=window), dtype=float)
+        G = np.zeros((len(self.tickers), len(self.tickers)))
+        G[np.ix_(index, index)] = risk_factor(covariance)
+        upper = np.zeros(len(self.tickers))
+        upper[index] = [self.constraints.get(ticker, 1.0) for ticker in investable]
+        mu = np.zeros(len(self.tickers))
+        mu[index] = window.mean_historical_return().to_numpy()
+
+        if self.strategy == "max_sharpe" and np.any(mu[index] > self.risk_free_rate):
+            solution, _ = problems["max_sharpe"].solve(np.zeros(len(upper)), upper, mu=mu - self.risk_free_rate, G=G)
+        else:
+            # Minimum volatility, also when no asset beats the risk-free rate and there is no max Sharpe portfolio
+            solution, _ = problems["min_volatility"].solve(np.zeros(len(upper)), upper, G=G)
+        if solution is None:
+            raise cp.error.SolverError(f"{self.strategy} problem could not be solved")
+        return solution / solution.sum()
+
+    def _evaluate(self, positions: np.ndarray, weights: np.ndarray) -> Dict:
+        """
+        Hold the weights of every rebalance date until the next one, the holdings drifting with the prices.
+        """
+        returns = np.nan_to_num(self.returns.to_numpy(dtype=float))
+        daily = []
+        turnover = []
+        holdings = None
+        ends = np.append(positions[1:], len(returns) - 1)
+        for position, end, target in zip(positions, ends, weights):
+            # One-way turnover from the drifted holdings to the new weights
+            turnover.append(0.5 * float(np.abs(target - holdings).sum()) if holdings is not None else 1.0)
+            growth = np.cumprod(1 + returns[position + 1:end + 1], axis=0)
+            values = np.concatenate([[target.sum()], growth @ target])
+            daily.append(values[1:] / values[:-1] - 1 if values[0] > 0 else np.zeros(len(growth)))
+            holdings = growth[-1] * target / values[-1] if len(growth) and values[-1] > 0 else target
+
+        daily = np.concatenate(daily)
+        values = self.initial_value * np.cumprod(1 + daily)
+        dates = self.returns.index[positions[0] + 1:]
+        years = len(daily) / self.frequency
+        total_return = float(values[-1] / self.initial_value - 1) if len(values) else 0.0
+        annual_return = float((1 + total_return) ** (1 / years) - 1) if years > 0 else 0.0
+        volatility = float(daily.std(ddof=1) * np.sqrt(self.frequency)) if len(daily) > 1 else 0.0
+        peaks = np.maximum.accumulate(np.concatenate([[self.initial_value], values]))
+        drawdown = float((np.concatenate([[self.initial_value], values]) / peaks - 1).min())
+        risk_metrics = RiskMetrics(daily, expected_return=annual_return, volatility=volatility,
+                                   frequency=self.frequency)
+
+        return {
+            "strategy": self.strategy,
+            "dates": [date.date().isoformat() for date in dates],
+            "values": values.round(2).tolist(),
+            "rebalances": [{
+                "date": self.returns.index[position].date().isoformat(),
+                "weights": {ticker: round(float(w), 5) for ticker, w in zip(self.tickers, target) if w >= 1e-4},
+                "turnover": round(turnover[i], 5),
+            } for i, (position, target) in enumerate(zip(positions, weights))],
+            "performance": {
+                "total_return": total_return,
+                "annualized_return": annual_return,
+                "volatility": volatility,
+                "sharpe_ratio": (annual_return - self.risk_free_rate) / volatility if volatility > 0 else 0.0,
+                "sortino_ratio": risk_metrics.sortino_ratio(annual_return, risk_free_rate=self.risk_free_rate),
+                "max_drawdown": drawdown,
+                "average_turnover": float(np.mean(turnover[1:])) if len(turnover) > 1 else 0.0,
+            },
+        }
@@ -1,70 +1,74 @@
-from typing import List
+import logging
+from typing import List, Tuple, Union
 
-from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator
+from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator, MarketInputs
+from PortfolioOptimizer.CovarianceCalculator import CovarianceCalculator, SampleCovarianceCalculator, risk_factor
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+from PortfolioOptimizer.ProblemCache import problem_cache, summarize_timings
+from PortfolioOptimizer.ViewCompiler import ViewCompiler, idzorek_omega, omega_proportional_to_prior, view_variances
 
+import cvxpy as cp
 import numpy as np
 from pypfopt.efficient_frontier import EfficientFrontier
-from pypfopt import BlackLittermanModel, black_litterman, risk_models
+from pypfopt import black_litterman
 import pandas as pd
+import scipy.linalg
+import scipy.sparse
 
 
 class BlackLitterman:
-    def __init__(self, data: pd.DataFrame, tickers: List[str], views, omega_tau: float = 0.05,
-                 total_portfolio_value=10000):
+    def __init__(self, data: Union[pd.DataFrame, PricePanel], tickers: List[str], views, omega_tau: float = 0.05,
+                 total_portfolio_value=10000, market_inputs: MarketInputs = None, market_state: MarketState = None,
+                 covariance_calculator: CovarianceCalculator = None, tau: float = 0.05,
+                 data_provider: MarketDataProvider = None):
+        """
+        :param views: Investor views, see ViewCompiler.
+        :param omega_tau: Scale of the variance of the views without a confidence.
+        :param tau: Uncertainty of the prior returns, relative to the covariance of the assets.
+        :param data_provider: Provider of the CAPM market inputs, the process-wide one if None.
+        """
+        data = as_frame(data)
         self.data = data
-        self.Sigma = risk_models.sample_cov(self.data)
+        market_state = market_state if market_state is not None else MarketState(data)
+        covariance_calculator = covariance_calculator or SampleCovarianceCalculator()
+        self.Sigma = covariance_calculator.calculate_covariance(data, market_state=market_state)
         self.delta = black_litterman.market_implied_risk_aversion(data.mean())
         # The lower the delta is the more influence the investor’s views has impact on the weights returned
         self.tickers = tickers
         self.total_portfolio_value = total_portfolio_value
         first_date = self.data.index[0].date()
         last_date = self.data.index[-1].date()
-        self.prior = CapmCalculator(first_date, last_date).calculate_expected_return(tickers)  # pi represents the equilibrium expected
+        capm = CapmCalculator(first_date, last_date, market_inputs=market_inputs, data_provider=data_provider)
+        self.market_inputs = capm.market_inputs
+        self.prior = capm.calculate_expected_return(tickers, prices=self.data)  # pi represents the equilibrium expected
         # returns of the assets in the market
 
+        self.tau = tau
         self.P, self.Q = self.user_input_to_pq(views)
-        self.omega = self.set_omega_proportional_to_prior(
-            tau=omega_tau)  # Omega is the covariance matrix of the investor's views
+        self.solver_timing = None
+        # Omega is the covariance matrix of the investor's views, kept as its diagonal: views held with a
+        # confidence get Idzorek's variance, the others a variance proportional to the prior
+        self.omega = self.set_omega_proportional_to_prior(tau=omega_tau)
+        confident = ~np.isnan(self.confidences)
+        if confident.any():
+            self.omega[confident] = idzorek_omega(self.P[np.flatnonzero(confident)], self.Sigma.to_numpy(),
+                                                  self.confidences[confident], tau=self.tau)
 
     def user_input_to_pq(self, views):
         """
-        Convert user inputs into P and Q matrices for the Black-Litterman model.
+        Convert user inputs into P and Q matrices for the Black-Litterman model, see ViewCompiler for the views.
 
         :param views: List of dictionaries containing the user's views.
-        :return: P and Q matrices.
+        :return: P (sparse, views x assets) and Q. The confidences of the views are kept in self.confidences.
 
-        assets = ['AssetA', 'AssetB', 'AssetC']
         views = [
             {'type': 'absolute', 'asset': 'AssetA', 'return': 0.05},
-            {'type': 'relative', 'asset1': 'AssetB', 'asset2': 'AssetC', 'difference': 0.02}
+            {'type': 'relative', 'asset1': 'AssetB', 'asset2': 'AssetC', 'difference': 0.02, 'confidence': 0.6}
         ]
-
-        P, Q = user_input_to_pq(assets, views)
-        print("P Matrix:\n", P)
-        print("Q Matrix:\n", Q)
-
         """
-
-        # Initialize P and Q
-        P = np.zeros((len(views), len(self.tickers)))
-        Q = np.zeros((len(views), 1))
-
-        for i, view in enumerate(views):
-            if view['type'] == 'absolute':
-                # Find the index of the asset
-                asset_index = self.tickers.index(view['asset'])
-                # Set the corresponding values in P and Q
-                P[i, asset_index] = 1
-                Q[i] = view['return']
-            elif view['type'] == 'relative':
-                # Find the indexes of the assets
-                asset_index_1 = self.tickers.index(view['asset1'])
-                asset_index_2 = self.tickers.index(view['asset2'])
-                # Set the corresponding values in P and Q
-                P[i, asset_index_1] = 1
-                P[i, asset_index_2] = -1
-                Q[i] = view['difference']
-
+        P, Q, self.confidences = ViewCompiler(self.tickers).compile(views)
         return P, Q
 
     def set_omega_proportional_to_prior(self, tau=0.05):
@@ -74,47 +78,210 @@ class BlackLitterman:
 
         :param tau: A scaling factor for the variances, representing the uncertainty of the views.
                     A smaller tau indicates higher confidence in the views. Default is 0.05.
+        :return: The diagonal of omega, also set as self.omega.
         """
         if self.P is None:
             raise ValueError("P matrix (picking matrix for the views) must be set before setting omega.")
 
-        # Diagonal elements of the prior covariance matrix
-        diag_prior = np.diag(self.Sigma)  # np.diag() creates a diagonal matrix
-
-        # Scale the diagonal based on the picking matrix P and the scaling factor tau
-        omega_diagonal = np.dot(np.dot(self.P, np.diag(diag_prior)), self.P.T) * tau
+        self.omega = omega_proportional_to_prior(self.P, self.Sigma.to_numpy(), tau=tau)
+        return self.omega
 
-        # Ensuring that omega is a diagonal matrix with the scaled values
-        self.omega = np.diag(np.diag(omega_diagonal))
-
-    def optimize_with_black_litterman(self):
-        """
-        Optimizes the portfolio using the Black-Litterman model.
+    def optimize_with_black_litterman(self, risk_free_rate: float = 0.02):
         """
+        Optimizes the portfolio using the Black-Litterman model. Without views, the posterior is the prior.
 
-        # Initialize the Black-Litterman model
-        # If views are not provided, we can run BL with just the prior (market equilibrium)
-        # But PyPortfolioOpt might require Q and P if we pass them.
-        # If P and Q are None, we should check if we can instantiate BL without them or with empty arrays.
-        
-        if self.P is None or self.Q is None:
-             # If no views, BL model essentially reverts to the prior (CAPM/Market Equilibrium)
-             # We can simulate this by passing empty P and Q or just using the prior directly.
-             # However, to keep using the BL class structure:
-             bl = BlackLittermanModel(self.Sigma, pi=self.prior, absolute_views={}, omega=self.omega)
-        else:
-             bl = BlackLittermanModel(self.Sigma, pi=self.prior, Q=self.Q, P=self.P, omega=self.omega)
-
+        :param risk_free_rate: Risk-free rate of the maximum Sharpe ratio portfolio.
+        """
         # Compute the posterior returns and covariances
-        posterior_rets = bl.bl_returns()
-        posterior_cov = bl.bl_cov()
+        returns, covariance = black_litterman_posterior(self.prior.to_numpy(), self.Sigma.to_numpy(), self.P, self.Q,
+                                                        self.omega, tau=self.tau)
+        posterior_rets = pd.Series(returns, index=self.prior.index)
+        posterior_cov = pd.DataFrame(covariance, index=self.prior.index, columns=self.prior.index)
 
-        # Re-optimize the portfolio with the new posterior estimates
+        # Re-optimize the portfolio with the new posterior estimates, through the problem shared by every universe
+        # of the same size
+        excess = posterior_rets.to_numpy() - risk_free_rate
+        if excess.max() <= 0:
+            raise ValueError("at least one of the assets must have an expected return exceeding the risk-free rate")
+        n = len(excess)
+        weights, self.solver_timing = problem_cache.solve("max_sharpe", np.zeros(n), np.ones(n), mu=excess,
+                                                          G=risk_factor(posterior_cov.to_numpy()))
+        if weights is None:
+            raise cp.error.SolverError("Maximum Sharpe ratio problem could not be solved")
         ef = EfficientFrontier(posterior_rets, posterior_cov)
-        raw_weights = ef.max_sharpe()
+        ef.set_weights(dict(zip(posterior_rets.index, weights)))
         cleaned_weights = ef.clean_weights()
 
         # Compute and return the portfolio performance
-        expected_return, volatility, sharpe_ratio = ef.portfolio_performance(verbose=False)
+        expected_return, volatility, sharpe_ratio = ef.portfolio_performance(verbose=False,
+                                                                             risk_free_rate=risk_free_rate)
 
         return cleaned_weights, expected_return, volatility, sharpe_ratio
+
+    def sensitivity(self, omega_taus: List[float] = (0.05,), deltas: List[float] = None,
+                    confidences: list = None, risk_free_rate: float = 0.02) -> dict:
+        """
+        Maximum Sharpe ratio weights over a grid of scenarios, reusing the prior and the covariance of this model
+        instead of building a model per scenario.
+
+        Every combination of omega_tau and confidences gives a set of view variances, whose posteriors are computed
+        together for every delta (black_litterman_posteriors). The scenarios share one compiled max Sharpe problem,
+        each solve warm-started from the previous one, the deltas of the same covariance following each other.
+
+        :param omega_taus: Scales of the variance of the views without a confidence.
+        :param deltas: Risk aversions of the market. The CAPM prior rf + beta (E(Rm) - rf) has the risk aversion
+                       delta_m = (E(Rm) - rf) / Var(Rm) of the market benchmark, its premiums are scaled by
+                       delta / delta_m. The market's own if None.
+        :param confidences: Confidences of the views in each scenario: one per view (None for a view without a
+                            confidence), or one for all the views. The confidences of the views if None.
+        :param risk_free_rate: Risk-free rate of the maximum Sharpe ratio portfolios.
+        :return: The grid, and the weights as a nested list (omega_taus x deltas x confidences x tickers), None for
+                 the scenarios without a portfolio beating the risk-free rate or that could not be solved.
+        """
+        Sigma = self.Sigma.to_numpy()
+        prior = self.prior.to_numpy()
+        k, n = self.P.shape
+        omega_taus = [float(omega_tau) for omega_tau in omega_taus]
+
+        market_delta = self.market_inputs.market_risk_aversion
+        if deltas is None:
+            # The prior as it is, whatever the sign of the market premium
+            deltas = [float(market_delta)]
+            priors = prior[None]
+        else:
+            deltas = [float(delta) for delta in deltas]
+            if market_delta <= 0:
+                raise ValueError("The market premium is not positive, the prior cannot be scaled to other deltas")
+            prior_rate = self.market_inputs.risk_free_rate
+            priors = prior_rate + np.outer(np.asarray(deltas) / market_delta, prior - prior_rate)
+
+        if confidences is None:
+            confidences = [self.confidences]
+        scenarios = []
+        for scenario in confidences:
+            scenario = np.full(k, np.nan if scenario is None else scenario, dtype=float) \
+                if np.ndim(scenario) == 0 else np.array([np.nan if c is None else c for c in scenario], dtype=float)
+            if len(scenario) != k:
+                raise ValueError(f"Every scenario needs one confidence per view ({k})")
+            if np.any((scenario < 0) | (scenario > 1)):
+                raise ValueError("View confidences must be between 0 and 1")
+            scenarios.append(scenario)
+        scenarios = np.array(scenarios).reshape(len(scenarios), k)
+
+        # View variances of every (omega_tau, confidences) pair
+        proportional = omega_proportional_to_prior(self.P, Sigma, tau=1.0)
+        idzorek = idzorek_omega(self.P, Sigma, np.nan_to_num(scenarios, nan=1.0), tau=self.tau,
+                                variances=view_variances(self.P, Sigma))
+        omegas = np.where(np.isnan(scenarios)[None], np.multiply.outer(omega_taus, proportional)[:, None],
+                          idzorek[None]).reshape(-1, k)
+
+        returns, covariances = black_litterman_posteriors(priors, Sigma, self.P, self.Q, omegas, tau=self.tau)
+        factors = risk_factor(covariances)
+
+        weights = np.full((len(omega_taus), len(scenarios), len(deltas), n), np.nan)
+        timings = []
+        for s in range(len(omegas)):
+            for d in range(len(deltas)):
+                excess = returns[s, d] - risk_free_rate
+                if excess.max() <= 0:
+                    continue
+                solution, timing = problem_cache.solve("max_sharpe", np.zeros(n), np.ones(n), mu=excess,
+                                                       G=factors[s])
+                timings.append(timing)
+                if solution is not None:
+                    weights[s // len(scenarios), s % len(scenarios), d] = solution / solution.sum()
+
+        weights = np.swapaxes(weights, 1, 2).round(5)
+        return {
+            "tickers": list(self.tickers),
+            "omega_taus": omega_taus,
+            "deltas": deltas,
+            "confidences": [[None if np.isnan(c) else float(c) for c in scenario] for scenario in scenarios],
+            "weights": [[[None if np.isnan(w).any() else w.tolist() for w in row] for row in plane]
+                        for plane in weights],
+            "solver_timing": summarize_timings(timings),
+        }
+
+
+def black_litterman_posterior(pi: np.ndarray, Sigma: np.ndarray, P: scipy.sparse.csr_matrix, Q: np.ndarray,
+                              omega: np.ndarray, tau: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Posterior returns and covariance of the Black-Litterman model (the same as pypfopt's bl_returns and bl_cov).
+
+    :param pi: Prior returns.
+    :param Sigma: Covariance of the assets.
+    :param P: Picking matrix of the views.
+    :param Q: Returns of the views.
+    :param omega: Variances of the views (diagonal of Omega). Views of infinite variance are ignored, views of zero
+                  variance are certain.
+    :param tau: Uncertainty of the prior returns, relative to Sigma.
+    :return: Posterior returns, and posterior covariance.
+    """
+    returns, covariances = black_litterman_posteriors(np.asarray(pi, dtype=float)[None], Sigma, P, Q,
+                                                      np.asarray(omega, dtype=float)[None], tau=tau)
+    return returns[0, 0], covariances[0]
+
+
+def black_litterman_posteriors(priors: np.ndarray, Sigma: np.ndarray, P: scipy.sparse.csr_matrix, Q: np.ndarray,
+                               omegas: np.ndarray, tau: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Posteriors of a grid of priors and view variances, computed together: the posterior covariance only depends on
+    the view variances, and the posterior returns are linear in the prior, so every set of view variances costs a
+    single Cholesky factorization, solved against the returns of all the priors and the covariance at once.
+    The uncertainty M of the posterior mean is solved in whichever space is smaller:
+    - views: M = tau Sigma - tau Sigma P' A^-1 P tau Sigma, with A = P tau Sigma P' + Omega (views x views),
+    - assets (Woodbury): M = ((tau Sigma)^-1 + P' Omega^-1 P)^-1 (assets x assets).
+
+    :param priors: Prior returns (priors x assets).
+    :param omegas: Variances of the views (sets x views), see black_litterman_posterior.
+    :return: Posterior returns (sets x priors x assets) and covariances (sets x assets x assets).
+    """
+    priors = np.asarray(priors, dtype=float)
+    Sigma = np.asarray(Sigma, dtype=float)
+    omegas = np.asarray(omegas, dtype=float)
+    P = scipy.sparse.csr_matrix(P)
+    Q = np.asarray(Q, dtype=float)
+    tau_Sigma = tau * Sigma
+    n, k, sets = Sigma.shape[0], len(Q), len(omegas)
+    # Views of infinite variance are ignored: no weight in the assets space, masked out of the views space
+    finite = np.isfinite(omegas)
+    if not finite.any():
+        return np.broadcast_to(priors, (sets,) + priors.shape).copy(), np.broadcast_to(Sigma + tau_Sigma,
+                                                                                       (sets, n, n)).copy()
+
+    if k > n and np.all(omegas > 0):
+        try:
+            prior_precision = scipy.linalg.cho_solve(scipy.linalg.cho_factor(tau_Sigma), np.eye(n))
+            dense_P = P.toarray()
+            precision = prior_precision + (dense_P.T[None] / omegas[:, None, :]) @ dense_P
+            rhs = (prior_precision @ priors.T)[None] + (dense_P.T @ (Q / omegas).T).T[:, :, None]
+            solution = _solve_symmetric(precision, np.concatenate([rhs, np.broadcast_to(np.eye(n), (sets, n, n))],
+                                                                  axis=2))
+            return np.swapaxes(solution[:, :, :len(priors)], 1, 2), Sigma + solution[:, :, len(priors):]
+        except np.linalg.LinAlgError:
+            # Singular covariance (more assets than days): the views space does not need its inverse
+            logging.info("Singular prior covariance, Black-Litterman posterior computed in the views space")
+
+    Sigma_Pt = np.asarray(P @ tau_Sigma).T
+    A = np.where(finite[:, :, None] & finite[:, None, :], np.asarray(P @ Sigma_Pt)[None], 0.0)
+    A[:, np.arange(k), np.arange(k)] += np.where(finite, omegas, 1.0)
+    rhs = np.concatenate([(Q[:, None] - P @ priors.T)[None].repeat(sets, axis=0),
+                          np.broadcast_to(Sigma_Pt.T, (sets, k, n))], axis=2)
+    rhs = np.where(finite[:, :, None], rhs, 0.0)
+    try:
+        solution = _solve_symmetric(A, rhs)
+    except np.linalg.LinAlgError:
+        # Certain views that contradict or repeat each other
+        logging.warning("Black-Litterman views are not independent, solving them in the least squares sense")
+        solution = np.linalg.pinv(A) @ rhs
+    returns = priors[None] + np.swapaxes(Sigma_Pt @ solution[:, :, :len(priors)], 1, 2)
+    return returns, Sigma + tau_Sigma - Sigma_Pt @ solution[:, :, len(priors):]
+
+
+def _solve_symmetric(A: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Solve a stack of symmetric positive definite systems through their Cholesky factors.
+
+    :raise np.linalg.LinAlgError: If one of them is not positive definite.
+    """
+    return np.stack([scipy.linalg.cho_solve(scipy.linalg.cho_factor(a), b_i) for a, b_i in zip(A, b)])
@@ -1,24 +1,181 @@
 from pypfopt import risk_models
 from abc import ABC, abstractmethod
+import numpy as np
 import pandas as pd
+import scipy.linalg
+from typing import Tuple
+
+from PortfolioOptimizer.MarketState import MarketState
 
 
 class CovarianceCalculator(ABC):
+    # True when the estimator has a low-rank plus diagonal form, which the optimizers use directly
+    factored = False
+
+    def __init__(self, frequency: int = 252):
+        """
+        :param frequency: Number of returns per year, used to annualize the covariance.
+        """
+        self.frequency = frequency
+
     @abstractmethod
-    def calculate_covariance(self, data: pd.DataFrame):
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
         """
 		Calculate the covariance matrix
 		:param data: Historical price data as panda DataFrame
+		:param market_state: Returns of data, shared with other calculators. Computed from data if None.
 		"""
 
     pass
 
+    @staticmethod
+    def _returns(data: pd.DataFrame, market_state: MarketState = None) -> pd.DataFrame:
+        return (market_state if market_state is not None else MarketState(data)).returns
+
 
 class SampleCovarianceCalculator(CovarianceCalculator):
-    def calculate_covariance(self, data: pd.DataFrame):
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
         """
 		Calculate the covariance matrix using the sample covariance method
 		:param data: Historical price data as panda DataFrame
+		:param market_state: Returns of data, shared with other calculators
 		:return: The covariance matrix
 		"""
-        return risk_models.sample_cov(data)
\ No newline at end of file
+        if market_state is not None:
+            return market_state.covariance
+        return risk_models.sample_cov(data, frequency=self.frequency)
+
+
+class LedoitWolfCovarianceCalculator(CovarianceCalculator):
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
+        """
+        Calculate the covariance matrix shrunk towards a scaled identity, with the Ledoit-Wolf shrinkage intensity.
+        Well conditioned even with more assets than observations.
+        :param data: Historical price data as panda DataFrame
+        :param market_state: Returns of data, shared with other calculators
+        :return: The covariance matrix
+        """
+        returns = self._returns(data, market_state)
+        return risk_models.CovarianceShrinkage(returns, returns_data=True, frequency=self.frequency).ledoit_wolf()
+
+
+class OASCovarianceCalculator(CovarianceCalculator):
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
+        """
+        Calculate the covariance matrix shrunk towards a scaled identity, with the Oracle Approximating Shrinkage
+        intensity, which is more accurate than Ledoit-Wolf for normally distributed returns.
+        :param data: Historical price data as panda DataFrame
+        :param market_state: Returns of data, shared with other calculators
+        :return: The covariance matrix
+        """
+        returns = self._returns(data, market_state)
+        return risk_models.CovarianceShrinkage(returns, returns_data=True,
+                                               frequency=self.frequency).oracle_approximating()
+
+
+class EWMACovarianceCalculator(CovarianceCalculator):
+    def __init__(self, span: int = 180, frequency: int = 252):
+        """
+        :param span: Span of the exponential weights, in days (recent returns weigh more).
+        :param frequency: Number of returns per year, used to annualize the covariance.
+        """
+        super().__init__(frequency)
+        self.span = span
+
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
+        """
+        Calculate the exponentially weighted covariance matrix. Same estimator as risk_models.exp_cov, computed
+        for every pair at once instead of one pandas ewm per pair.
+        :param data: Historical price data as panda DataFrame
+        :param market_state: Returns of data, shared with other calculators
+        :return: The covariance matrix
+        """
+        returns = self._returns(data, market_state)
+        values = returns.to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        deviations = np.where(present, values - np.nanmean(values, axis=0), 0.0)
+
+        # Weight of each day, as pandas' ewm(span).mean() with adjust=True: the last day weighs 1
+        alpha = 2 / (self.span + 1)
+        weights = (1 - alpha) ** np.arange(len(values) - 1, -1, -1)
+        mask = present.astype(float)
+        covariance = (deviations * weights[:, None]).T @ deviations / ((mask * weights[:, None]).T @ mask)
+        return pd.DataFrame(covariance * self.frequency, index=returns.columns, columns=returns.columns)
+
+
+class PCAFactorCovarianceCalculator(CovarianceCalculator):
+    factored = True
+
+    def __init__(self, n_factors: int = 5, frequency: int = 252):
+        """
+        :param n_factors: Number of statistical factors (principal components) kept.
+        :param frequency: Number of returns per year, used to annualize the covariance.
+        """
+        super().__init__(frequency)
+        self.n_factors = n_factors
+
+    def calculate_factors(self, data: pd.DataFrame, market_state: MarketState = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Fit a statistical factor model: the largest principal components of the sample covariance explain the
+        co-movements, and every asset keeps its own specific variance, so that covariance = B B' + diag(d).
+        :param data: Historical price data as panda DataFrame
+        :param market_state: Returns of data, shared with other calculators
+        :return: The factor loadings B (assets x factors) and the specific variances d, both annualized
+        """
+        market_state = market_state if market_state is not None else MarketState(data)
+        sample = market_state.daily_covariance.to_numpy() * self.frequency
+        if np.isnan(sample).any():
+            raise ValueError("Some assets share fewer than 2 days of returns, their covariance is undefined")
+        n = len(sample)
+        k = max(1, min(self.n_factors, n - 1))
+        eigenvalues, eigenvectors = scipy.linalg.eigh(sample, subset_by_index=[n - k, n - 1])
+        loadings = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+        total = np.diag(sample)
+        specific = np.maximum(total - (loadings ** 2).sum(axis=1), 1e-6 * total)
+        tickers = market_state.tickers
+        return (pd.DataFrame(loadings, index=tickers, columns=[f"factor_{i + 1}" for i in range(k)]),
+                pd.Series(specific, index=tickers))
+
+    def calculate_covariance(self, data: pd.DataFrame, market_state: MarketState = None):
+        """
+        Calculate the covariance matrix implied by the factor model, B B' + diag(d)
+        :param data: Historical price data as panda DataFrame
+        :param market_state: Returns of data, shared with other calculators
+        :return: The covariance matrix
+        """
+        loadings, specific = self.calculate_factors(data, market_state)
+        covariance = loadings.to_numpy() @ loadings.to_numpy().T + np.diag(specific.to_numpy())
+        return pd.DataFrame(covariance, index=loadings.index, columns=loadings.index)
+
+
+COVARIANCE_CALCULATORS = {
+    "sample": SampleCovarianceCalculator,
+    "ledoit_wolf": LedoitWolfCovarianceCalculator,
+    "oas": OASCovarianceCalculator,
+    "ewma": EWMACovarianceCalculator,
+    "pca_factor": PCAFactorCovarianceCalculator,
+}
+
+
+def get_covariance_calculator(method: str = "sample") -> CovarianceCalculator:
+    """
+    :param method: One of sample, ledoit_wolf, oas, ewma or pca_factor.
+    """
+    if method not in COVARIANCE_CALCULATORS:
+        raise ValueError(f"covariance_method must be one of {', '.join(COVARIANCE_CALCULATORS)}")
+    return COVARIANCE_CALCULATORS[method]()
+
+
+def risk_factor(Sigma: np.ndarray) -> np.ndarray:
+    """
+    :param Sigma: A covariance matrix, or a stack of them (..., assets, assets).
+    :return: A matrix G such that G.T @ G == Sigma, so that the portfolio variance w' Sigma w is ||G w||^2 (one per
+             matrix of a stack).
+    """
+    try:
+        # Small jitter so that singular (but positive semidefinite) covariances still factorize
+        return np.swapaxes(np.linalg.cholesky(Sigma + 1e-12 * np.eye(Sigma.shape[-1])), -1, -2)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(Sigma)
+        return np.sqrt(np.clip(eigenvalues, 0, None))[..., :, None] * np.swapaxes(eigenvectors, -1, -2)
@@ -0,0 +1,239 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+
+# Quote currency of the listings of an exchange, from their Yahoo Finance suffix. Other tickers (US listings,
+# futures like NQ=F) are taken to be quoted in US dollars.
+EXCHANGE_CURRENCIES = {
+    ".L": "GBp", ".IL": "USD", ".DE": "EUR", ".F": "EUR", ".PA": "EUR", ".AS": "EUR", ".BR": "EUR", ".MI": "EUR",
+    ".MC": "EUR", ".LS": "EUR", ".HE": "EUR", ".VI": "EUR", ".IR": "EUR", ".SW": "CHF", ".ST": "SEK", ".CO": "DKK",
+    ".OL": "NOK", ".TO": "CAD", ".V": "CAD", ".AX": "AUD", ".NZ": "NZD", ".T": "JPY", ".HK": "HKD", ".SI": "SGD",
+    ".KS": "KRW", ".NS": "INR", ".BO": "INR", ".SA": "BRL", ".MX": "MXN", ".JO": "ZAc", ".TA": "ILA",
+}
+# Minor units some exchanges quote in: (currency, minor units per unit)
+MINOR_CURRENCIES = {"GBp": ("GBP", 100), "GBX": ("GBP", 100), "ZAc": ("ZAR", 100), "ILA": ("ILS", 100)}
+
+
+def currency_of(ticker: str) -> str:
+    """
+    :return: Quote currency of a ticker, guessed from its exchange suffix.
+    """
+    dot = ticker.rfind('.')
+    return EXCHANGE_CURRENCIES.get(ticker[dot:], "USD") if dot > 0 else "USD"
+
+
+class FXRates:
+    """
+    Daily exchange rates, downloaded as Yahoo Finance currency pairs (EURUSD=X is the price of a euro in dollars)
+    through a MarketDataProvider, hence its price store, and kept in memory: the series of a pair is downloaded
+    again only for a window it does not cover yet.
+    """
+
+    def __init__(self, data_provider: MarketDataProvider = None):
+        """
+        :param data_provider: Provider of the rates, the process-wide one if None.
+        """
+        self.data_provider = data_provider
+        self._series: Dict[str, Tuple[pd.Timestamp, pd.Timestamp, pd.Series]] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g. when sending the rates to a worker process
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def rates(self, currency: str, base: str, start, end) -> pd.Series:
+        """
+        :param currency: Currency of the prices, possibly a minor unit such as GBp.
+        :param base: Currency to convert to.
+        :return: Units of base per unit of currency over [start, end], observed on the days the pair traded.
+        :raises ValueError: if the pair has no rate over the window.
+        """
+        currency, units = MINOR_CURRENCIES.get(currency, (currency, 1))
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if currency == base:
+            return pd.Series(1.0 / units, index=pd.DatetimeIndex([start]))
+
+        pair = f"{currency}{base}=X"
+        with self._lock:
+            cached = self._series.get(pair)
+        if cached is None or start < cached[0] or end > cached[1]:
+            if cached is not None:
+                start, end = min(start, cached[0]), max(end, cached[1])
+            provider = self.data_provider or MarketDataProvider()
+            # A week before the window, for a rate on its first days
+            prices = provider.get_data([pair], start_date=(start - timedelta(days=7)).date().isoformat(),
+                                       end_date=(end + timedelta(days=1)).date().isoformat())
+            if prices.empty or pair not in prices.columns:
+                raise ValueError(f"No {pair} exchange rate from {start.date()} to {end.date()}")
+            cached = (start, end, prices[pair].dropna().astype(float))
+            with self._lock:
+                self._series[pair] = cached
+        return cached[2] / units
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+fx_rates = FXRates()
+
+
+class AlignedPrices:
+    """
+    Prices aligned by DataAlignment, with a summary of what was done and their MarketState, which keeps the
+    remaining gaps as missing returns (pairwise-complete statistics).
+    """
+
+    def __init__(self, prices: pd.DataFrame, report: dict, frequency: int = 252):
+        self.prices = prices
+        self.report = report
+        self.frequency = frequency
+
+    @cached_property
+    def market_state(self) -> MarketState:
+        return MarketState(self.prices, frequency=self.frequency, ffill=False)
+
+
+class DataAlignment:
+    """
+    Aligns the prices of a universe listed on several exchanges, with their own trading days and currencies:
+
+    - calendar: 'union' keeps every day where at least one asset traded, 'intersection' only the days where all
+      of them did, as dropna() does.
+    - ffill_limit: on the union calendar, a missing price is the last known one for at most this many rows of the
+      calendar (holidays), then left missing (suspensions, delistings). No limit if None.
+    - base_currency: prices are converted to this currency with the daily rates of FXRates, the currency of every
+      ticker being guessed from its exchange suffix unless given. No conversion if None.
+
+    Everything is done on the whole (dates x assets) array at once.
+    """
+    CALENDARS = ("union", "intersection")
+
+    def __init__(self, calendar: str = "union", ffill_limit: Optional[int] = 5, base_currency: str = None,
+                 currencies: Dict[str, str] = None, fx: FXRates = None):
+        """
+        :param currencies: Quote currency of some tickers, overriding the exchange suffix.
+        :param fx: Exchange rates, the process-wide ones if None.
+        """
+        if calendar not in self.CALENDARS:
+            raise ValueError(f"calendar must be one of {', '.join(self.CALENDARS)}")
+        if ffill_limit is not None and ffill_limit < 0:
+            raise ValueError("ffill_limit must be positive")
+        self.calendar = calendar
+        self.ffill_limit = ffill_limit
+        self.base_currency = base_currency
+        self.currencies = currencies or {}
+        self.fx = fx if fx is not None else fx_rates
+
+    def key(self) -> tuple:
+        return (self.calendar, self.ffill_limit, self.base_currency, tuple(sorted(self.currencies.items())))
+
+    def currency(self, ticker: str) -> str:
+        return self.currencies.get(ticker) or currency_of(ticker)
+
+    def align(self, prices: Union[pd.DataFrame, PricePanel]) -> AlignedPrices:
+        """
+        :param prices: Prices indexed by date, one column per ticker, NaN where a ticker did not trade.
+        :return: The aligned prices, in the precision of the input, and a report of the dates dropped, the prices
+                 filled and the currencies converted.
+        """
+        prices = as_frame(prices)
+        single = len(prices.columns) > 0 and (prices.dtypes == np.float32).all()
+        values = prices.to_numpy(dtype=np.float32 if single else np.float64)
+        dates = prices.index
+        present = ~np.isnan(values)
+
+        if self.calendar == "intersection":
+            keep = present.all(axis=1)
+        else:
+            keep = present.any(axis=1)
+        values, present, dates = values[keep], present[keep], dates[keep]
+
+        filled = np.zeros(values.shape[1], dtype=int)
+        if self.calendar == "union" and (self.ffill_limit is None or self.ffill_limit > 0):
+            # Row of the last known price of every cell, -1 before the first one
+            rows = np.arange(len(values))[:, None]
+            last = np.maximum.accumulate(np.where(present, rows, -1), axis=0)
+            fill = ~present & (last >= 0)
+            if self.ffill_limit is not None:
+                fill &= rows - last <= self.ffill_limit
+            _, columns = np.nonzero(fill)
+            values[fill] = values[last[fill], columns]
+            filled = fill.sum(axis=0)
+
+        converted = {}
+        if self.base_currency is not None and len(dates):
+            for currency, columns in self._columns_by_currency(prices.columns).items():
+                if currency == self.base_currency:
+                    continue
+                rates = self.fx.rates(currency, self.base_currency, dates[0], dates[-1])
+                # Rates of the last day the pair traded, e.g. over the weekend of a market open on Sundays
+                rates = rates[~rates.index.duplicated()].reindex(rates.index.union(dates)).ffill().reindex(dates)
+                values[:, columns] *= rates.to_numpy(dtype=values.dtype)[:, None]
+                converted.update(dict.fromkeys(prices.columns[columns], currency))
+
+        aligned = pd.DataFrame(values, index=dates, columns=prices.columns, copy=False)
+        report = {
+            "calendar": self.calendar,
+            "dates": len(dates),
+            "dropped_dates": int((~keep).sum()),
+            "filled": {ticker: int(count) for ticker, count in zip(prices.columns, filled) if count},
+            "converted": converted,
+            "base_currency": self.base_currency,
+        }
+        return AlignedPrices(aligned, report)
+
+    def _columns_by_currency(self, tickers: pd.Index) -> Dict[str, List[int]]:
+        columns = {}
+        for column, ticker in enumerate(tickers):
+            columns.setdefault(self.currency(ticker), []).append(column)
+        return columns
+
+
+# Process-wide memo of the aligned prices of the last price frames, least recently used ones are evicted first
+_ALIGNED_PRICES_CACHE_SIZE = 32
+_aligned_prices_cache: 'OrderedDict[tuple, Tuple[pd.DataFrame, AlignedPrices]]' = OrderedDict()
+_aligned_prices_lock = threading.Lock()
+
+
+def get_aligned_prices(prices: Union[pd.DataFrame, PricePanel], alignment: DataAlignment) -> AlignedPrices:
+    """
+    Align a price frame once: strategies working on the same prices with the same alignment share the aligned
+    prices, and their MarketState.
+    """
+    prices = as_frame(prices)
+    key = (alignment.key(), tuple(prices.columns), len(prices),
+           prices.index[0] if len(prices) else None, prices.index[-1] if len(prices) else None)
+    with _aligned_prices_lock:
+        cached = _aligned_prices_cache.get(key)
+    if cached is not None and cached[0].equals(prices):
+        aligned = cached[1]
+    else:
+        aligned = alignment.align(prices)
+
+    with _aligned_prices_lock:
+        _aligned_prices_cache[key] = (prices, aligned)
+        _aligned_prices_cache.move_to_end(key)
+        while len(_aligned_prices_cache) > _ALIGNED_PRICES_CACHE_SIZE:
+            _aligned_prices_cache.popitem(last=False)
+    return aligned
+
+
+def clear_aligned_prices_cache():
+    with _aligned_prices_lock:
+        _aligned_prices_cache.clear()
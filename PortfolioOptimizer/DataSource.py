@@ -0,0 +1,256 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+import pandas as pd
+import yfinance as yf
+
+from PortfolioOptimizer.PriceStore import last_bars, period_to_range
+
+
+class DataSource(ABC):
+    """
+    Where daily bars come from. A source returns one field of the bars (yfinance's 'Adj Close', 'Close', 'Open',
+    'High', 'Low' or 'Volume') of several tickers, over a [start_date, end_date) window or a period ending today.
+    """
+
+    @abstractmethod
+    def download(self, tickers: List[str], start_date=None, end_date=None, period: str = None,
+                 field: str = 'Adj Close') -> pd.DataFrame:
+        """
+        :param period: yfinance period string ('5d', '1mo', '2y', ...), overrides start_date and end_date.
+        :return: A DataFrame indexed by date with one column per ticker the source knows, empty if it knows none.
+                 Failures (network, unreadable files) raise.
+        """
+        pass
+
+
+class YFinanceDataSource(DataSource):
+    """
+    Yahoo Finance, through yfinance.
+    """
+
+    def download(self, tickers: List[str], start_date=None, end_date=None, period: str = None,
+                 field: str = 'Adj Close') -> pd.DataFrame:
+        if period:
+            data = yf.download(tickers, period=period, auto_adjust=False)
+        else:
+            data = yf.download(tickers, start=start_date, end=end_date, auto_adjust=False)
+        if data is None or data.empty:
+            return pd.DataFrame()
+        # yfinance always downloads every field: copy the requested one out, as a slice may be a view that keeps
+        # the whole download alive
+        prices = data[field].copy()
+        if isinstance(prices, pd.Series):
+            prices = prices.to_frame(tickers[0])
+        return prices
+
+
+def _window(start_date, end_date, period: str, today: date = None) -> Tuple[Optional[date], Optional[date]]:
+    if period:
+        window = period_to_range(period, today=today)
+        return window if window is not None else (None, None)
+    return (pd.Timestamp(start_date).date() if start_date else None,
+            pd.Timestamp(end_date).date() if end_date else None)
+
+
+def _slice(bars: pd.DataFrame, start: Optional[date], end: Optional[date]) -> pd.DataFrame:
+    # Same window as yfinance: start included, end excluded
+    if start is not None:
+        bars = bars[bars.index >= pd.Timestamp(start)]
+    if end is not None:
+        bars = bars[bars.index < pd.Timestamp(end)]
+    return bars
+
+
+class LocalFileDataSource(DataSource):
+    """
+    Bars exported to a directory, one Parquet or CSV file per ticker (named after the URL-quoted ticker, e.g.
+    %5EGSPC.csv for ^GSPC) with a date index, or a first 'Date' column, and one column per field. Only the requested
+    field is read (Parquet is columnar, CSV columns are skipped by the parser) and kept in memory until the file
+    changes on disk.
+    """
+
+    FORMATS = ("parquet", "csv")
+
+    def __init__(self, directory: str, file_format: str = "parquet"):
+        """
+        :param directory: Directory of the files.
+        :param file_format: parquet (needs pyarrow) or csv.
+        """
+        if file_format not in self.FORMATS:
+            raise ValueError(f"file_format must be one of {', '.join(self.FORMATS)}")
+        self.directory = directory
+        self.file_format = file_format
+        self._bars: Dict[Tuple[str, str], Tuple[float, Optional[pd.Series]]] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g. when sending the source to a worker process
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def path(self, ticker: str) -> str:
+        return os.path.join(self.directory, f"{quote(ticker, safe='')}.{self.file_format}")
+
+    def _read(self, ticker: str, field: str) -> Optional[pd.Series]:
+        """
+        :return: The bars of one field of a ticker, None if there is no file or the file has no such field.
+        """
+        path = self.path(ticker)
+        try:
+            modified = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._bars.get((path, field))
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+
+        if self.file_format == "parquet":
+            import pyarrow.parquet
+            names = pyarrow.parquet.read_schema(path).names
+            if field not in names:
+                bars = None
+            else:
+                bars = pd.read_parquet(path, columns=[field] + (['Date'] if 'Date' in names else []))
+                if 'Date' in bars.columns:
+                    bars = bars.set_index('Date')
+        else:
+            names = pd.read_csv(path, nrows=0).columns
+            bars = pd.read_csv(path, index_col=0, usecols=[names[0], field]) if field in names[1:] else None
+        if bars is not None:
+            bars = bars[field]
+            bars.index = pd.to_datetime(bars.index)
+            bars = bars.sort_index()
+        with self._lock:
+            self._bars[(path, field)] = (modified, bars)
+        return bars
+
+    def write(self, ticker: str, bars: pd.DataFrame):
+        """
+        Export the bars of a ticker (one column per field), e.g. to snapshot another source.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        bars = bars.rename_axis('Date')
+        if self.file_format == "parquet":
+            bars.to_parquet(self.path(ticker))
+        else:
+            bars.to_csv(self.path(ticker))
+
+    def download(self, tickers: List[str], start_date=None, end_date=None, period: str = None,
+                 field: str = 'Adj Close') -> pd.DataFrame:
+        start, end = _window(start_date, end_date, period)
+        columns = {}
+        for ticker in tickers:
+            bars = self._read(ticker, field)
+            if bars is not None:
+                columns[ticker] = _slice(bars, start, end)
+        return last_bars(pd.concat(columns, axis=1).sort_index(), period) if columns else pd.DataFrame()
+
+
+class ReplayDataSource(DataSource):
+    """
+    Bars held in memory, e.g. a snapshot of another source, for deterministic offline runs and benchmarks. Periods
+    end on the last day of the data rather than today, so that replays do not drift with the calendar.
+    """
+
+    def __init__(self, bars: Union[pd.DataFrame, Dict[str, pd.DataFrame]], as_of: date = None):
+        """
+        :param bars: {field: DataFrame indexed by date with one column per ticker}, or the 'Adj Close' frame.
+        :param as_of: Last day of the periods, the last date of the data if None.
+        """
+        if isinstance(bars, pd.DataFrame):
+            bars = {'Adj Close': bars}
+        self.bars = {field: frame.sort_index() for field, frame in bars.items()}
+        if as_of is None:
+            last_dates = [frame.index[-1] for frame in self.bars.values() if len(frame)]
+            as_of = max(last_dates).date() if last_dates else date.today()
+        self.as_of = as_of
+
+    @classmethod
+    def record(cls, source: DataSource, tickers: List[str], start_date, end_date,
+               fields: Tuple[str, ...] = ('Adj Close',)) -> 'ReplayDataSource':
+        """
+        Snapshot the bars of another source over a window.
+        """
+        return cls({field: source.download(tickers, start_date=start_date, end_date=end_date, field=field)
+                    for field in fields})
+
+    def download(self, tickers: List[str], start_date=None, end_date=None, period: str = None,
+                 field: str = 'Adj Close') -> pd.DataFrame:
+        frame = self.bars.get(field)
+        if frame is None:
+            return pd.DataFrame()
+        known = [ticker for ticker in tickers if ticker in frame.columns]
+        if not known:
+            return pd.DataFrame()
+        window = _window(start_date, end_date, period, today=self.as_of)
+        return last_bars(_slice(frame[known], *window), period).copy()
+
+
+class CompositeDataSource(DataSource):
+    """
+    Several sources in order of preference: every ticker is served by the first source that has prices for it,
+    a failing source being skipped, e.g. the internal bar store with a fallback to Yahoo Finance.
+    """
+
+    def __init__(self, sources: List[DataSource]):
+        if not sources:
+            raise ValueError("A composite data source needs at least one source")
+        self.sources = list(sources)
+
+    def download(self, tickers: List[str], start_date=None, end_date=None, period: str = None,
+                 field: str = 'Adj Close') -> pd.DataFrame:
+        remaining = list(tickers)
+        frames = []
+        error = None
+        for source in self.sources:
+            try:
+                data = source.download(remaining, start_date=start_date, end_date=end_date, period=period,
+                                       field=field)
+            except Exception as e:
+                logging.warning(f"{type(source).__name__} failed for {remaining}, trying the next source: {e}")
+                error = e
+                continue
+            found = [ticker for ticker in remaining if ticker in data.columns and data[ticker].notna().any()]
+            if found:
+                frames.append(data[found])
+                remaining = [ticker for ticker in remaining if ticker not in found]
+            if not remaining:
+                break
+        if not frames and error is not None:
+            raise error
+        return pd.concat(frames, axis=1).sort_index() if frames else pd.DataFrame()
+
+
+DATA_SOURCES = ("yfinance", "parquet", "csv")
+
+
+def data_source_from_env() -> DataSource:
+    """
+    Build the data source from MARKET_DATA_SOURCES, a comma separated list of yfinance, parquet or csv (files in
+    MARKET_DATA_DIR) tried in that order, yfinance by default.
+    """
+    names = [name.strip() for name in os.environ.get('MARKET_DATA_SOURCES', 'yfinance').split(',') if name.strip()]
+    sources = []
+    for name in names or ['yfinance']:
+        if name == 'yfinance':
+            sources.append(YFinanceDataSource())
+        elif name in LocalFileDataSource.FORMATS:
+            directory = os.environ.get('MARKET_DATA_DIR')
+            if not directory:
+                raise ValueError(f"MARKET_DATA_DIR must be set to use the {name} data source")
+            sources.append(LocalFileDataSource(directory, file_format=name))
+        else:
+            raise ValueError(f"MARKET_DATA_SOURCES must be a list of {', '.join(DATA_SOURCES)}")
+    return sources[0] if len(sources) == 1 else CompositeDataSource(sources)
@@ -0,0 +1,193 @@
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+
+class DiscreteAllocator:
+    """
+    Converts target weights into whole-share orders at the latest prices, for one account or many at once.
+
+    Every account first buys the shares its weights fully pay for (floor of value / price). What remains of an
+    asset's target value is then always less than one share, so the rest of the cash buys at most one more share
+    of each asset: the greedy pass visits the assets by decreasing shortfall and buys one share of each while the
+    cash lasts, one vectorized step per asset for every account at once, whatever the budgets.
+
+    Choosing those extra shares is a 0/1 knapsack: minimize the distance to the target values plus the leftover
+    cash (the objective of pypfopt's lp_portfolio), i.e. maximize the shortfall covered by the shares bought. The
+    optional milp method solves it exactly with scipy's HiGHS, keeping the greedy solution if it is better when the
+    time limit is hit.
+    """
+    METHODS = ("greedy", "milp")
+
+    def __init__(self, latest_prices: pd.Series, time_limit: float = 1.0):
+        """
+        :param latest_prices: Latest price of every asset.
+        :param time_limit: Seconds the milp method may spend on an account.
+        """
+        self.tickers = list(latest_prices.index)
+        self.prices = latest_prices.to_numpy(dtype=float)
+        self.time_limit = time_limit
+
+    def allocate_many(self, weights: Union[np.ndarray, pd.DataFrame], budgets,
+                      method: str = "greedy") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param weights: Target weights, accounts x assets in the order of the prices (or a DataFrame with the
+                        tickers as columns, missing ones weighing 0), or a single row for all the accounts. Long
+                        only, rows are normalized to sum to 1.
+        :param budgets: Cash of every account, or one budget for all of them.
+        :param method: greedy or milp.
+        :return: Shares to buy (accounts x assets) and the leftover cash of every account.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"method must be one of {', '.join(self.METHODS)}")
+        if isinstance(weights, pd.DataFrame):
+            weights = weights.fillna(0.0)
+            unknown = weights.columns[(weights != 0).any()].difference(self.tickers)
+            if len(unknown):
+                raise ValueError(f"No price for {', '.join(map(str, unknown))}")
+            weights = weights.reindex(columns=self.tickers, fill_value=0.0)
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        budgets = np.atleast_1d(np.asarray(budgets, dtype=float))
+        if len(weights) == 1 and len(budgets) > 1:
+            weights = np.broadcast_to(weights, (len(budgets), weights.shape[1]))
+        accounts, assets = weights.shape
+        if assets != len(self.prices):
+            raise ValueError(f"weights must have one column per asset ({len(self.prices)})")
+        if len(budgets) not in (1, accounts):
+            raise ValueError("Give one budget for every account, or a single one")
+        budgets = np.broadcast_to(budgets, (accounts,)).copy()
+        if np.any(weights < 0):
+            raise ValueError("Discrete allocation is long only: weights must be positive")
+        if np.any(budgets < 0):
+            raise ValueError("Budgets must be positive")
+        held = weights > 0
+        if np.any(held & ~(self.prices > 0)):
+            raise ValueError("Assets with a weight need a positive latest price")
+
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+        # Assets no account holds are never bought
+        prices = np.where(held.any(axis=0), self.prices, np.inf)
+        finite_prices = np.where(held.any(axis=0), self.prices, 0.0)
+
+        target = weights * budgets[:, None]
+        shares = np.floor(target / prices).astype(np.int64)
+        leftover = budgets - shares @ finite_prices
+        # Less than one share of every asset
+        shortfall = target - shares * finite_prices
+
+        if method == "greedy":
+            self._greedy(shares, leftover, shortfall, prices)
+        else:
+            for account in range(accounts):
+                self._milp(shares[account], leftover[account:account + 1], shortfall[account], prices)
+        return shares, np.maximum(leftover, 0.0)
+
+    @staticmethod
+    def _greedy(shares: np.ndarray, leftover: np.ndarray, shortfall: np.ndarray, prices: np.ndarray):
+        """
+        Buy one more share of the assets by decreasing shortfall, whenever the cash of the account pays for it.
+
+        Rather than one step per asset, every step buys the longest run of consecutive assets the cash pays for,
+        from the next affordable one: the number of steps is the number of times an account has to skip an asset.
+        """
+        accounts, assets = shares.shape
+        rows = np.arange(accounts)[:, None]
+        columns = np.arange(assets)
+        order = np.argsort(-shortfall, axis=1)
+        # Price of the assets in the order they are visited, infinite for those without a shortfall
+        cost = np.where(shortfall[rows, order] > 0, prices[order], np.inf)
+        bought = np.zeros((accounts, assets), dtype=bool)
+        position = np.zeros(accounts, dtype=int)
+        # Accounts that may still buy something
+        live = np.arange(accounts)
+        while len(live):
+            affordable = (columns >= position[live, None]) & (cost[live] <= leftover[live, None])
+            live = live[affordable.any(axis=1)]
+            if not len(live):
+                break
+            start = affordable[affordable.any(axis=1)].argmax(axis=1)
+            after = columns >= start[:, None]
+            spent = np.cumsum(np.where(after, cost[live], 0.0), axis=1)
+            run = after & (spent <= leftover[live, None])
+            end = start + run.sum(axis=1)
+            leftover[live] -= spent[np.arange(len(live)), end - 1]
+            bought[live] |= run
+            position[live] = end
+        shares[rows, order] += bought
+
+    def _milp(self, shares: np.ndarray, leftover: np.ndarray, shortfall: np.ndarray, prices: np.ndarray):
+        """
+        Buy the extra shares of one account that cover the most shortfall, as a 0/1 knapsack.
+        """
+        candidates = np.flatnonzero((shortfall > 0) & (prices <= leftover[0]))
+        if not len(candidates):
+            return
+        greedy_shares, greedy_leftover = shares.copy(), leftover.copy()
+        self._greedy(greedy_shares[None], greedy_leftover, shortfall[None], prices)
+
+        result = milp(-shortfall[candidates], integrality=np.ones(len(candidates)), bounds=Bounds(0, 1),
+                      constraints=LinearConstraint(prices[candidates][None, :], -np.inf, leftover[0]),
+                      options={"time_limit": self.time_limit})
+        if result.x is None:
+            logging.warning(f"Integer allocation failed ({result.message}), keeping the greedy one")
+            chosen = np.flatnonzero(greedy_shares - shares)
+        else:
+            chosen = candidates[np.round(result.x).astype(bool)]
+            if shortfall[chosen].sum() < shortfall[np.flatnonzero(greedy_shares - shares)].sum():
+                chosen = np.flatnonzero(greedy_shares - shares)
+        shares[chosen] += 1
+        leftover[0] -= prices[chosen].sum()
+
+    def allocate(self, weights: Dict[str, float], budget: float, method: str = "greedy",
+                 covariance: pd.DataFrame = None) -> dict:
+        """
+        Allocate one account.
+
+        :param weights: Target weight of every ticker.
+        :param covariance: Annual covariance of the assets, to report the tracking error of the allocation.
+        :return: Shares bought and their value per ticker (those with at least one share), the leftover cash, and
+                 the tracking error (None without a covariance).
+        """
+        frame = pd.DataFrame([weights], dtype=float)
+        shares, leftover = self.allocate_many(frame, budget, method=method)
+        values = shares[0] * np.nan_to_num(self.prices)
+        bought = np.flatnonzero(shares[0])
+        return {
+            "shares": {self.tickers[i]: int(shares[0, i]) for i in bought},
+            "values": {self.tickers[i]: float(values[i]) for i in bought},
+            "leftover": float(leftover[0]),
+            "tracking_error": self.tracking_error(shares, frame, budget, covariance)[0].item()
+            if covariance is not None else None,
+        }
+
+    def tracking_error(self, shares: np.ndarray, weights: Union[np.ndarray, pd.DataFrame], budgets,
+                       covariance: Union[np.ndarray, pd.DataFrame]) -> np.ndarray:
+        """
+        :return: Ex-ante tracking error of the allocation of every account against its target weights: the
+                 volatility of the difference of their returns, under the covariance (annual if it is). Leftover
+                 cash counts as an asset without risk.
+        """
+        if isinstance(weights, pd.DataFrame):
+            weights = weights.reindex(columns=self.tickers, fill_value=0.0)
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+        budgets = np.broadcast_to(np.asarray(budgets, dtype=float), (len(weights),))
+        held = np.divide(shares * np.nan_to_num(self.prices), budgets[:, None],
+                         out=np.zeros_like(weights), where=budgets[:, None] > 0)
+        if isinstance(covariance, pd.DataFrame):
+            covariance = covariance.reindex(index=self.tickers, columns=self.tickers, fill_value=0.0)
+        difference = held - weights
+        variance = np.einsum('ai,ij,aj->a', difference, np.asarray(covariance, dtype=float), difference)
+        return np.sqrt(np.maximum(variance, 0.0))
+
+
+def latest_prices(prices: pd.DataFrame) -> pd.Series:
+    """
+    :return: Last known price of every asset of a price frame.
+    """
+    return prices.ffill().iloc[-1] if len(prices) else pd.Series(dtype=float)
@@ -1,43 +1,505 @@
 from pypfopt.efficient_frontier import EfficientFrontier
+import cvxpy as cp
+import numpy as np
 import pandas as pd
-from typing import Tuple
+from typing import Dict, Optional, Tuple, Union
 
 import datetime
 
-from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator, MeanHistoricalReturnCalculator
-from PortfolioOptimizer.CovarianceCalculator import SampleCovarianceCalculator
+from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator, MarketInputs
+from PortfolioOptimizer.CovarianceCalculator import CovarianceCalculator, SampleCovarianceCalculator, risk_factor
+from PortfolioOptimizer.HRPCalculator import InfeasibleConstraintsError
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+from PortfolioOptimizer.ProblemCache import problem_cache, summarize_timings
+
+
+# Weight changes below this are not traded, the cutoff of pypfopt's clean_weights
+TRADE_TOLERANCE = 1e-4
 
 
 class EfficientFrontierCalculator:
-    def __init__(self, data: pd.DataFrame, mu="capm", total_portfolio_value=10000):
+    # Accounts rebalanced by one solve, the last group being padded to reuse the same compiled problem
+    REBALANCE_ACCOUNTS_PER_SOLVE = 64
+    # Reweighted solves approximating fixed transaction costs
+    FIXED_COST_ITERATIONS = 5
+
+    def __init__(self, data: Union[pd.DataFrame, PricePanel], mu="capm", total_portfolio_value=10000, market_inputs: MarketInputs = None,
+                 market_state: MarketState = None, covariance_calculator: CovarianceCalculator = None,
+                 data_provider: MarketDataProvider = None):
+        """
+        :param market_state: Returns statistics of data, shared with other calculators. Computed from data if None.
+        :param covariance_calculator: Covariance estimator, sample covariance if None. Factored estimators are
+                                      passed to the solver as their factors rather than as a dense matrix.
+        :param data_provider: Provider of the CAPM market inputs, the process-wide one if None.
+        """
+        data = as_frame(data)
         self._data = data
+        self._state = market_state if market_state is not None else MarketState(data)
         if mu == "capm":
-            self._mu = CapmCalculator(start_date=data.index[0], end_date=data.index[-1]).calculate_expected_return(data.columns.tolist())
+            capm = CapmCalculator(start_date=data.index[0], end_date=data.index[-1], market_inputs=market_inputs,
+                                  data_provider=data_provider)
+            self._mu = capm.calculate_expected_return(data.columns.tolist(), prices=data)
         elif mu == "mean historical return":
-            self._mu = MeanHistoricalReturnCalculator().calculate_expected_return(data)
+            self._mu = self._state.mean_historical_return()
         self.total_portfolio_value = total_portfolio_value
-        self._Sigma = SampleCovarianceCalculator().calculate_covariance(data)
+        self._covariance_calculator = covariance_calculator or SampleCovarianceCalculator()
+        self._Sigma = self._covariance_calculator.calculate_covariance(data, market_state=self._state)
+        self._risk = None
+        # OSQP struggles with the large, sparse factored problems, where the interior point solver stays fast
+        self._solver = cp.CLARABEL if self._covariance_calculator.factored else None
         self._ef = None
+        self.solver_timings = []
 
     def get_data(self):
         return self._data
 
+    def _risk_inputs(self) -> dict:
+        """
+        :return: The risk model as inputs of the portfolio problems: the loadings and specific volatilities of a
+                 factored covariance estimator, or the dense risk factor G of the covariance matrix.
+        """
+        if self._risk is None:
+            if self._covariance_calculator.factored:
+                loadings, specific = self._covariance_calculator.calculate_factors(self._data,
+                                                                                   market_state=self._state)
+                self._risk = {"loadings": loadings.to_numpy().T, "specific": np.sqrt(specific.to_numpy())}
+            else:
+                self._risk = {"G": risk_factor(self._Sigma.to_numpy())}
+        return self._risk
+
+    def _solve(self, kind: str, weight_bounds: Tuple[float, float] = (0, 1), **inputs) -> Optional[np.ndarray]:
+        """
+        Solve a portfolio problem of the process-wide cache, compiled once per kind and size of the universe.
+
+        :return: The weights, None if the solver did not find them.
+        """
+        n = len(self._mu)
+        weights, timing = problem_cache.solve(kind, np.full(n, float(weight_bounds[0])),
+                                              np.full(n, float(weight_bounds[1])), solver=self._solver,
+                                              **self._risk_inputs(), **inputs)
+        self.solver_timings.append(timing)
+        return weights
+
+    @property
+    def solver_timing(self) -> dict:
+        """
+        :return: Number of solves of this calculator, and their compile and solve times.
+        """
+        return summarize_timings(self.solver_timings)
+
     def calculate_efficient_frontier_weights(self, risk_free_rate=0.02):
         if self._ef is None:
             self._ef = EfficientFrontier(self._mu, self._Sigma)
-        raw_weights = self._ef.max_sharpe(risk_free_rate=risk_free_rate)
+        self._ef.set_weights(self._max_sharpe(risk_free_rate))
         cleaned_weights = self._ef.clean_weights()
         return cleaned_weights
 
     def calculate_min_volatility_weights(self):
         if self._ef is None:
             self._ef = EfficientFrontier(self._mu, self._Sigma)
-        raw_weights = self._ef.min_volatility()
+        weights = self._solve("min_volatility")
+        if weights is None:
+            raise cp.error.SolverError("Minimum volatility problem could not be solved")
+        self._ef.set_weights(dict(zip(self._mu.index, weights)))
         cleaned_weights = self._ef.clean_weights()
         return cleaned_weights
 
+    def _max_sharpe(self, risk_free_rate: float) -> dict:
+        """
+        Maximum Sharpe ratio portfolio (long only), with the same change of variables as pypfopt: minimize the
+        variance of y subject to (mu - rf)' y = 1, then w = y / sum(y).
+        """
+        excess = self._mu.to_numpy() - risk_free_rate
+        if excess.max() <= 0:
+            raise ValueError("at least one of the assets must have an expected return exceeding the risk-free rate")
+        weights = self._solve("max_sharpe", mu=excess)
+        if weights is None:
+            raise cp.error.SolverError("Maximum Sharpe ratio problem could not be solved")
+        return dict(zip(self._mu.index, weights))
+
+    def calculate_rebalance_weights(self, current_weights: Dict[str, float], objective: str = "max_sharpe",
+                                    risk_free_rate=0.02, **costs_and_limits) -> dict:
+        """
+        Rebalance the current book of total_portfolio_value, see rebalance_accounts for the costs and limits.
+
+        :param current_weights: Current weight of every ticker, the rest of the portfolio being cash.
+        :param objective: max_sharpe or min_volatility.
+        """
+        targets = self.rebalance_accounts(pd.DataFrame([current_weights], dtype=float), objective=objective,
+                                          risk_free_rate=risk_free_rate, **costs_and_limits)
+        if self._ef is None:
+            self._ef = EfficientFrontier(self._mu, self._Sigma)
+        self._ef.set_weights(targets.iloc[0].to_dict())
+        return self._ef.clean_weights()
+
+    def rebalance_accounts(self, current_weights: pd.DataFrame, objective: str = "max_sharpe", risk_free_rate=0.02,
+                           proportional_cost: Union[float, Dict[str, float]] = 0.0, fixed_cost: float = 0.0,
+                           max_turnover: float = None, max_trade: float = None,
+                           portfolio_values=None) -> pd.DataFrame:
+        """
+        Target weights of many accounts, trading from their current weights at a cost. Accounts are solved together,
+        REBALANCE_ACCOUNTS_PER_SOLVE at a time, by one problem of the problem cache (see RebalanceProblem).
+
+        Fixed costs are approximated by proportional ones, reweighted from the previous solution (Lobo, Fazel and
+        Boyd, 2007): an asset costs fixed / (|trade| + 1e-4) more per unit traded, which is the fixed cost for the
+        previous trade and prohibitive for an asset not traded. Positions in tickers outside the universe are sold.
+
+        :param current_weights: Current weights, accounts x tickers, the rest of every account being cash.
+        :param objective: max_sharpe (net of the costs) or min_volatility (plus the costs).
+        :param proportional_cost: Cost of a trade as a fraction of its value, or of the trades of every ticker.
+        :param fixed_cost: Cost of every trade, in the currency of the portfolio values.
+        :param max_turnover: Maximum sum of |weight change| of an account, sales outside the universe included.
+        :param max_trade: Maximum |weight change| of every asset.
+        :param portfolio_values: Value of every account, or one for all of them, total_portfolio_value if None.
+        :return: Target weights, accounts x assets of the universe.
+        :raises InfeasibleConstraintsError: if the limits do not allow an account to be fully invested.
+        """
+        if objective not in ("max_sharpe", "min_volatility"):
+            raise ValueError("objective must be either 'max_sharpe' or 'min_volatility'.")
+        tickers = self._mu.index
+        current_weights = current_weights.fillna(0.0)
+        if (current_weights < 0).any().any():
+            raise ValueError("Current weights must be positive")
+        sold = current_weights.drop(columns=tickers, errors='ignore').sum(axis=1).to_numpy()
+        current = current_weights.reindex(columns=tickers, fill_value=0.0).to_numpy(dtype=float).T
+        n, accounts = current.shape
+        if np.any(current.sum(axis=0) + sold > 1 + 1e-6):
+            raise ValueError("Current weights must not sum to more than 1")
+
+        if portfolio_values is None:
+            portfolio_values = self.total_portfolio_value
+        portfolio_values = np.broadcast_to(np.asarray(portfolio_values, dtype=float), (accounts,))
+        if isinstance(proportional_cost, dict):
+            proportional = pd.Series(proportional_cost, dtype=float).reindex(tickers).fillna(0.0).to_numpy()
+        else:
+            proportional = np.full(n, float(proportional_cost))
+        if np.any(proportional < 0) or fixed_cost < 0:
+            raise ValueError("Transaction costs must be positive")
+        fixed = fixed_cost / portfolio_values
+
+        lower, upper = np.zeros((n, accounts)), np.ones((n, accounts))
+        if max_trade is not None:
+            lower, upper = np.maximum(lower, current - max_trade), np.minimum(upper, current + max_trade)
+        if np.any(lower.sum(axis=0) > 1 + 1e-9) or np.any(upper.sum(axis=0) < 1 - 1e-9):
+            raise InfeasibleConstraintsError("max_trade does not allow every account to be fully invested.")
+        # Long only, the turnover of a portfolio is at most 2
+        turnover = np.full(accounts, 2.0) if max_turnover is None else max_turnover - sold
+        if np.any(turnover < np.abs(1 - current.sum(axis=0)) - 1e-9):
+            raise InfeasibleConstraintsError("max_turnover does not allow every account to be fully invested.")
+
+        inputs = {}
+        if objective == "max_sharpe":
+            excess = self._mu.to_numpy() - risk_free_rate
+            if excess.max() <= 0:
+                raise ValueError(
+                    "at least one of the assets must have an expected return exceeding the risk-free rate")
+            inputs["mu"] = excess
+
+        targets = np.empty((n, accounts))
+        width = min(accounts, self.REBALANCE_ACCOUNTS_PER_SOLVE)
+        turnover = np.maximum(turnover, 0.0)
+        for start in range(0, accounts, width):
+            stop = min(start + width, accounts)
+            # The last group is padded with copies of its last account
+            group = np.minimum(np.arange(start, start + width), accounts - 1)
+            weights = self._rebalance_group(f"rebalance_{objective}", lower[:, group], upper[:, group],
+                                            current[:, group], proportional, fixed[group], turnover[group], **inputs)
+            targets[:, start:stop] = weights[:, :stop - start]
+
+        # Solver noise is not traded
+        targets = np.where(np.abs(targets - current) < TRADE_TOLERANCE, current, targets)
+        return pd.DataFrame(targets.T, index=current_weights.index, columns=tickers)
+
+    def _rebalance_group(self, kind: str, lower: np.ndarray, upper: np.ndarray, current: np.ndarray,
+                         proportional: np.ndarray, fixed: np.ndarray, turnover: np.ndarray, **inputs) -> np.ndarray:
+        """
+        Solve a group of accounts, re-solving with reweighted costs until fixed costs stop changing the assets
+        an account trades. Every solve reuses the compiled problem, and an account keeps the solution it settled
+        on, so that it gets the same weights as when solved alone.
+        """
+        costs = np.repeat(proportional[:, None], lower.shape[1], axis=1)
+        weights = None
+        settled = np.zeros(lower.shape[1], dtype=bool)
+        for _ in range(self.FIXED_COST_ITERATIONS if np.any(fixed > 0) else 1):
+            if weights is not None:
+                costs = proportional[:, None] + fixed[None, :] / (np.abs(weights - current) + TRADE_TOLERANCE)
+            # Interior point: the reweighted costs are too badly scaled for OSQP
+            solution, timing = problem_cache.solve(kind, lower, upper, solver=cp.CLARABEL, current=current,
+                                                   costs=costs, turnover=turnover, **self._risk_inputs(), **inputs)
+            self.solver_timings.append(timing)
+            if solution is None:
+                if weights is None:
+                    raise cp.error.SolverError("Rebalancing problem could not be solved")
+                break
+            if weights is None:
+                weights = solution
+                continue
+            traded = np.abs(solution - current) >= TRADE_TOLERANCE
+            settling = ~settled & (traded == (np.abs(weights - current) >= TRADE_TOLERANCE)).all(axis=0)
+            weights[:, ~settled] = solution[:, ~settled]
+            settled |= settling
+            if settled.all():
+                break
+        return weights
+
     def calculate_efficient_frontier_performance(self, risk_free_rate=0.02) -> Tuple[float, float, float]:
         if self._ef is None:
             raise ValueError(
                 "Efficient Frontier weights not calculated. Call calculate_efficient_frontier_weights() first.")
         return self._ef.portfolio_performance(risk_free_rate=risk_free_rate)
+
+    def _frontier_endpoints(self, weight_bounds: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: The weights of the minimum volatility and of the maximum return portfolios,
+                 which bound the efficient frontier.
+        """
+        min_vol = self._solve("min_volatility", weight_bounds)
+        max_ret = self._solve("max_return", weight_bounds, mu=self._mu.to_numpy())
+        if min_vol is None or max_ret is None:
+            raise cp.error.SolverError("The bounds of the efficient frontier could not be solved")
+        return min_vol, max_ret
+
+    def calculate_frontier(self, n_points: int = 100, by: str = "return", risk_free_rate=0.02,
+                           weight_bounds: Tuple[float, float] = (0, 1)) -> dict:
+        """
+        Traces the efficient frontier between the minimum volatility and the maximum return portfolios.
+
+        Between two turning points the set of assets sitting at their bounds does not change and the optimal
+        weights are an affine function of the target return (critical line). Consecutive points are therefore
+        read off the current segment, or from the next one after a turning point, and the parameterized solver is
+        only called, warm-started from the previous point, when a segment cannot be identified. The solver problems
+        are shared with the other calculators of the same universe size through the problem cache.
+
+        :param n_points: Number of frontier points.
+        :param by: 'return' to minimize the volatility at evenly spaced target returns,
+                   'risk' to maximize the return at evenly spaced target volatilities.
+        :param risk_free_rate: Risk-free rate used for the Sharpe ratio of each point.
+        :param weight_bounds: Minimum and maximum weight of each asset.
+        :return: A dictionary with the expected return, volatility, Sharpe ratio and weights of each point,
+                 None for the points where the solver did not converge.
+        """
+        if by not in ("return", "risk"):
+            raise ValueError("by must be either 'return' or 'risk'.")
+        weight_bounds = tuple(weight_bounds)
+        mu = self._mu.to_numpy()
+        Sigma = self._Sigma.to_numpy()
+
+        min_vol, max_ret = self._frontier_endpoints(weight_bounds)
+        if by == "return":
+            low, high = mu @ min_vol, mu @ max_ret
+        else:
+            low, high = np.sqrt(min_vol @ Sigma @ min_vol), np.sqrt(max_ret @ Sigma @ max_ret)
+
+        frontier = {"tickers": self._mu.index.tolist(), "returns": [], "volatilities": [], "sharpe_ratios": [],
+                    "weights": []}
+        segment = None
+        for i, value in enumerate(np.linspace(low, high, n_points)):
+            weights = None
+            if i == 0:
+                weights = min_vol
+            elif i == n_points - 1:
+                weights = max_ret
+            elif segment is not None:
+                segment = segment.advance(value if by == "return" else None, value ** 2 if by == "risk" else None)
+                if segment is not None:
+                    t = value if by == "return" else segment.target_for_variance(value ** 2)
+                    if t is not None and segment.contains(t):
+                        weights = segment.weights(t)
+
+            if weights is None:
+                # target is the variance when tracing by risk, so that the constraint stays DPP compliant
+                weights = self._solve(f"frontier_{by}", weight_bounds, mu=mu,
+                                      target=value if by == "return" else value ** 2)
+
+            if weights is None:
+                for values in ("returns", "volatilities", "sharpe_ratios", "weights"):
+                    frontier[values].append(None)
+                continue
+
+            if segment is None or not segment.contains(mu @ weights):
+                segment = _FrontierSegment.from_weights(mu, Sigma, weights, weight_bounds)
+
+            expected_return = float(mu @ weights)
+            volatility = float(np.sqrt(max(weights @ Sigma @ weights, 0.0)))
+            frontier["returns"].append(expected_return)
+            frontier["volatilities"].append(volatility)
+            frontier["sharpe_ratios"].append((expected_return - risk_free_rate) / volatility if volatility > 0 else None)
+            frontier["weights"].append(weights.round(5).tolist())
+
+        return frontier
+
+
+def trade_list(current_weights: Dict[str, float], target_weights: Dict[str, float], portfolio_value: float,
+               proportional_cost: Union[float, Dict[str, float]] = 0.0, fixed_cost: float = 0.0) -> dict:
+    """
+    :return: The trades from the current to the target weights, largest first, with their weight change and value
+             (positive for a buy), the turnover sum |weight change|, and the transaction costs in value.
+    """
+    tickers = list(dict.fromkeys([*current_weights, *target_weights]))
+    change = (pd.Series(target_weights, index=tickers, dtype=float).fillna(0.0)
+              - pd.Series(current_weights, index=tickers, dtype=float).fillna(0.0))
+    change = change[change.abs() >= TRADE_TOLERANCE]
+    change = change.reindex(change.abs().sort_values(ascending=False, kind="stable").index)
+    if isinstance(proportional_cost, dict):
+        costs = pd.Series(proportional_cost, dtype=float).reindex(change.index).fillna(0.0)
+    else:
+        costs = pd.Series(float(proportional_cost), index=change.index)
+    return {
+        "trades": [{"ticker": ticker, "action": "buy" if weight > 0 else "sell", "weight": round(float(weight), 5),
+                    "value": float(weight * portfolio_value)} for ticker, weight in change.items()],
+        "turnover": float(change.abs().sum()),
+        "transaction_cost": float((change.abs() * costs).sum() * portfolio_value + fixed_cost * len(change)),
+    }
+
+
+class _FrontierSegment:
+    """
+    Piece of the efficient frontier on which the assets at their lower bound and at their upper bound do not change.
+
+    With this active set fixed, the KKT conditions of min w'Σw s.t. 1'w = 1, mu'w = t are linear, so the optimal
+    weights, budget and return multipliers are affine in the target return t. The segment is valid for every t
+    keeping the free weights within their bounds and the multipliers of the bound constraints non-negative.
+    """
+    _TOL = 1e-10
+
+    def __init__(self, mu: np.ndarray, Sigma: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                 weight_bounds: Tuple[float, float]):
+        self.mu = mu
+        self.Sigma = Sigma
+        self.lower = lower
+        self.upper = upper
+        self.weight_bounds = weight_bounds
+        lb, ub = weight_bounds
+
+        free = np.flatnonzero(~(lower | upper))
+        f = len(free)
+        fixed = np.where(lower, lb, np.where(upper, ub, 0.0))
+
+        # [Σ_FF  -1  -mu_F] [w_F   ]   [-Σ_FB w_B   ]       [0]
+        # [1'     0   0   ] [budget] = [1 - 1'w_B   ] + t * [0]
+        # [mu_F'  0   0   ] [lambda]   [-mu_B'w_B   ]       [1]
+        kkt = np.zeros((f + 2, f + 2))
+        kkt[:f, :f] = Sigma[np.ix_(free, free)]
+        kkt[:f, f] = -1
+        kkt[:f, f + 1] = -mu[free]
+        kkt[f, :f] = 1
+        kkt[f + 1, :f] = mu[free]
+        rhs = np.zeros((f + 2, 2))
+        rhs[:f, 0] = -Sigma[free] @ fixed
+        rhs[f, 0] = 1 - fixed.sum()
+        rhs[f + 1, 0] = -mu @ fixed
+        rhs[f + 1, 1] = 1
+        solution = np.linalg.solve(kkt, rhs)
+
+        self.p = fixed.copy()
+        self.p[free] = solution[:f, 0]
+        self.q = np.zeros(len(mu))
+        self.q[free] = solution[:f, 1]
+        budget, lam = solution[f], solution[f + 1]
+
+        # Gradient of the Lagrangian, i.e. the multipliers of the bound constraints of the fixed assets
+        gradient_0 = Sigma @ self.p - budget[0] - lam[0] * mu
+        gradient_1 = Sigma @ self.q - budget[1] - lam[1] * mu
+
+        # Every validity condition has the form c0 + c1 * t >= 0
+        c0 = np.concatenate([self.p[free] - lb, ub - self.p[free], gradient_0[lower], -gradient_0[upper], [lam[0]]])
+        c1 = np.concatenate([self.q[free], -self.q[free], gradient_1[lower], -gradient_1[upper], [lam[1]]])
+        self._events = np.concatenate([free, free, np.flatnonzero(lower), np.flatnonzero(upper), [-1]])
+        self._kinds = np.repeat(['hits_lower', 'hits_upper', 'leaves_lower', 'leaves_upper', 'lambda'],
+                                [f, f, lower.sum(), upper.sum(), 1])
+
+        scale = 1 + np.abs(c0)
+        flat = np.abs(c1) < self._TOL
+        if np.any(flat & (c0 < -self._TOL * scale)):
+            self.t_low, self.t_high, self._event = np.inf, -np.inf, None
+            return
+        with np.errstate(divide='ignore'):
+            bounds = -c0 / c1
+        rising, falling = (c1 > 0) & ~flat, (c1 < 0) & ~flat
+        self.t_low = bounds[rising].max() if rising.any() else -np.inf
+        self.t_high = bounds[falling].min() if falling.any() else np.inf
+        self._event = np.flatnonzero(falling)[np.argmin(bounds[falling])] if falling.any() else None
+
+    @classmethod
+    def from_weights(cls, mu: np.ndarray, Sigma: np.ndarray, weights: np.ndarray,
+                     weight_bounds: Tuple[float, float], tol: float = 1e-6) -> Optional['_FrontierSegment']:
+        """
+        Identify the segment of a solver solution from the weights sitting at their bounds.
+
+        :return: The segment, or None if the active set is degenerate or does not contain the solution.
+        """
+        lower = weights <= weight_bounds[0] + tol
+        upper = (weights >= weight_bounds[1] - tol) & ~lower
+        try:
+            segment = cls(mu, Sigma, lower, upper, weight_bounds)
+        except np.linalg.LinAlgError:
+            return None
+        return segment if segment.contains(mu @ weights, slack=1e-6) else None
+
+    def contains(self, t: float, slack: float = 1e-9) -> bool:
+        slack = slack * (1 + abs(t))
+        return self.t_low - slack <= t <= self.t_high + slack
+
+    def weights(self, t: float) -> np.ndarray:
+        return np.clip(self.p + t * self.q, *self.weight_bounds)
+
+    def variance(self, t: float) -> float:
+        w = self.p + t * self.q
+        return w @ self.Sigma @ w
+
+    def target_for_variance(self, variance: float) -> Optional[float]:
+        """
+        :return: The target return of this segment whose portfolio has the given variance, None if there is none.
+        """
+        Sigma_q = self.Sigma @ self.q
+        a = self.q @ Sigma_q
+        b = 2 * self.p @ Sigma_q
+        c = self.p @ self.Sigma @ self.p - variance
+        if abs(a) < self._TOL:
+            return -c / b if abs(b) > self._TOL else None
+        discriminant = b ** 2 - 4 * a * c
+        if discriminant < 0:
+            return None
+        # Upper root: the efficient branch, where the variance increases with the return
+        return (-b + np.sqrt(discriminant)) / (2 * a)
+
+    def advance(self, target_return: float = None, target_variance: float = None) -> Optional['_FrontierSegment']:
+        """
+        Walk the following segments (turning point after turning point) until one reaches the target
+        return or variance.
+
+        :return: The segment reaching the target, or None if the walk failed (degenerate active set).
+        """
+        segment = self
+        for _ in range(4 * len(self.mu) + 4):
+            if target_return is not None and target_return <= segment.t_high:
+                return segment
+            if target_variance is not None and (not np.isfinite(segment.t_high)
+                                                or target_variance <= segment.variance(segment.t_high)):
+                return segment
+            segment = segment._next()
+            if segment is None:
+                return None
+        return None
+
+    def _next(self) -> Optional['_FrontierSegment']:
+        if self._event is None or self._kinds[self._event] == 'lambda' or not np.isfinite(self.t_high):
+            return None
+        asset, kind = self._events[self._event], self._kinds[self._event]
+        lower, upper = self.lower.copy(), self.upper.copy()
+        if kind == 'hits_lower':
+            lower[asset] = True
+        elif kind == 'hits_upper':
+            upper[asset] = True
+        elif kind == 'leaves_lower':
+            lower[asset] = False
+        else:
+            upper[asset] = False
+        try:
+            segment = _FrontierSegment(self.mu, self.Sigma, lower, upper, self.weight_bounds)
+        except np.linalg.LinAlgError:
+            return None
+        return segment if segment.contains(self.t_high, slack=1e-7) else None
+
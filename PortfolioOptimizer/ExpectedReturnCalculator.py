@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
-from pypfopt import expected_returns
-from PortfolioOptimizer.MarketDataProvider import MarketDataProvider as md
+import datetime
+import threading
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
+from pypfopt import expected_returns
 from typing import List, Any, Dict
 
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+
+# Process-wide default provider, used when no provider is injected
+md = MarketDataProvider()
+
 
 class ExpectedReturnCalculator(ABC):
     @abstractmethod
@@ -22,10 +29,157 @@ class MeanHistoricalReturnCalculator(ExpectedReturnCalculator):
         return expected_returns.mean_historical_return(data)
 
 
+class MarketInputs:
+    """
+    Market-wide CAPM inputs for one (start, end) window: the risk-free rate and the S&P 500 prices and return.
+
+    Each input is downloaded lazily and at most once per instance. Use get_market_inputs() to share the
+    instance of a window between CapmCalculator, BlackLitterman and EfficientFrontierCalculator.
+    """
+
+    def __init__(self, start_date, end_date, risk_free_rate: float = None, market_prices: pd.Series = None,
+                 data_provider: MarketDataProvider = None):
+        """
+        :param risk_free_rate: Known risk-free rate, not downloaded then (e.g. in offline backtests).
+        :param market_prices: Known daily prices of the market benchmark over the window, not downloaded then.
+        :param data_provider: Provider of the inputs, the process-wide one if None.
+        """
+        self.start_date = start_date
+        self.end_date = end_date
+        self.data_provider = data_provider
+        self._risk_free_rate = risk_free_rate
+        self._market_prices = market_prices
+        self._market_return = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g. when sending the inputs to a worker process
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def prefetch(self):
+        """
+        Download every input now, e.g. on an I/O worker before handing the instance to CPU bound code.
+        """
+        self.risk_free_rate
+        self.market_prices
+
+    @property
+    def risk_free_rate(self) -> float:
+        """
+        Formula : Risk-free rate = Yield of 3-month U.S. Treasury Bill
+
+        :return: the latest 3-month US Treasury Bill yield as a decimal
+        """
+        with self._lock:
+            if self._risk_free_rate is None:
+                risk_free_rate = (self.data_provider or md).get_data(['^IRX'], period='2y')
+                # Check if it's a DataFrame/Series and extract scalar
+                val = risk_free_rate.iloc[-1]
+                if isinstance(val, pd.Series):
+                    val = val.iloc[0]
+                self._risk_free_rate = val / 100
+            return self._risk_free_rate
+
+    @property
+    def market_prices(self) -> pd.Series:
+        """
+        :return: the daily prices of the market benchmark (S&P 500 here) over the window
+        """
+        with self._lock:
+            if self._market_prices is None:
+                market_data = (self.data_provider or md).get_data(['^GSPC'], start_date=self.start_date,
+                                                                  end_date=self.end_date)
+                if isinstance(market_data, pd.DataFrame):
+                    market_data = market_data.iloc[:, 0]
+                self._market_prices = market_data
+            return self._market_prices
+
+    @property
+    def market_return(self) -> float:
+        """
+        formula : E(Rm) = Average annual return of the market benchmark (S&P 500 here)
+
+        :return: the average annualized return of the sp500 on the same years as the input data
+        """
+        if self._market_return is None:
+            # Calculating daily returns from daily adjusted close prices
+            daily_returns = self.market_prices.pct_change().dropna()
+
+            # Calculating the average annualized market return
+            # 252 is the typical number of trading days in a year
+            avg_daily_return = daily_returns.mean()
+            self._market_return = (1 + avg_daily_return) ** 252 - 1
+        return self._market_return
+
+    @property
+    def market_premium(self) -> float:  # Mkt - Rf
+        return self.market_return - self.risk_free_rate
+
+    @property
+    def market_risk_aversion(self) -> float:
+        """
+        formula : delta = (E(Rm) - Rf) / Var(Rm), the risk aversion implied by the market benchmark
+
+        :return: the market premium over the annualized variance of the daily returns of the market benchmark
+        """
+        variance = self.market_prices.pct_change().dropna().var() * 252
+        return self.market_premium / variance
+
+
+# Process-wide memo of MarketInputs per window and day, least recently used windows are evicted first
+_MARKET_INPUTS_CACHE_SIZE = 32
+_market_inputs_cache: 'OrderedDict[tuple, MarketInputs]' = OrderedDict()
+_market_inputs_lock = threading.Lock()
+
+
+def get_market_inputs(start_date, end_date, data_provider: MarketDataProvider = None) -> MarketInputs:
+    """
+    Get the shared MarketInputs of a (start, end) window, creating it on first use.
+    Inputs are kept for the day only: the risk-free rate is the latest yield whatever the window, and windows
+    ending today get a new bar of the benchmark every day.
+
+    :param start_date: first date of the window, as a string, date or timestamp
+    :param end_date: last date of the window, as a string, date or timestamp
+    :param data_provider: provider of the inputs, the process-wide one if None. Providers have their own inputs.
+    """
+    key = (pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date(), data_provider, _today())
+    with _market_inputs_lock:
+        inputs = _market_inputs_cache.get(key)
+        if inputs is None:
+            inputs = MarketInputs(*key[:2], data_provider=data_provider)
+            _market_inputs_cache[key] = inputs
+            while len(_market_inputs_cache) > _MARKET_INPUTS_CACHE_SIZE:
+                _market_inputs_cache.popitem(last=False)
+        _market_inputs_cache.move_to_end(key)
+        return inputs
+
+
+def _today() -> datetime.date:
+    return datetime.date.today()
+
+
+def clear_market_inputs_cache():
+    with _market_inputs_lock:
+        _market_inputs_cache.clear()
+
+
 class CapmCalculator(ExpectedReturnCalculator):
-    def __init__(self, start_date, end_date):
+    def __init__(self, start_date, end_date, market_inputs: MarketInputs = None,
+                 data_provider: MarketDataProvider = None):
+        """
+        :param market_inputs: shared risk-free rate and market data. Defaults to the process-wide ones of the window.
+        :param data_provider: provider of the prices and market inputs, the process-wide one if None.
+        """
         self.start_date = start_date
         self.end_date = end_date
+        self.data_provider = data_provider
+        self.market_inputs = market_inputs or get_market_inputs(start_date, end_date, data_provider=data_provider)
 
     def calculate_risk_free_rate(self) -> float:
         """
@@ -33,12 +187,7 @@ class CapmCalculator(ExpectedReturnCalculator):
 
         :return: the latest 3-month US Treasury Bill yield as a decimal
         """
-        risk_free_rate = md.get_data(['^IRX'], period='2y')
-        # Check if it's a DataFrame/Series and extract scalar
-        val = risk_free_rate.iloc[-1]
-        if isinstance(val, pd.Series):
-            val = val.iloc[0]
-        return val / 100
+        return self.market_inputs.risk_free_rate
 
     def calculate_market_return(self) -> float:
         """
@@ -46,84 +195,74 @@ class CapmCalculator(ExpectedReturnCalculator):
 
         :return: the average annualized return of the sp500 on the same years as the input data
         """
-        market_data = md.get_data(['^GSPC'], start_date=self.start_date, end_date=self.end_date)
-        # Calculating daily returns from daily adjusted close prices
-        daily_returns = market_data.pct_change().dropna()
+        return self.market_inputs.market_return
 
-        # Calculating the average annualized market return
-        # 252 is the typical number of trading days in a year
-        avg_daily_return = daily_returns.mean()
-        annualized_return = (1 + avg_daily_return) ** 252 - 1
+    def calculate_market_premium(self) -> float:  # Mkt - Rf
+        return self.market_inputs.market_premium
+
+    def calculate_beta(self, tickers: List[str], prices: pd.DataFrame = None) -> Dict[str, float]:
+        """
+        Formula : beta = Cov(Ri, Rm) / Var(Rm), computed on monthly returns
 
-        if isinstance(annualized_return, pd.Series):
-            return annualized_return.iloc[0]
-        return annualized_return
+        All tickers are handled in one pass: prices are resampled to monthly once, and the covariance of every
+        column with the market is computed over the months where both have a return (pairwise complete),
+        so assets with shorter or gappy histories keep every month they traded.
 
-    def calculate_market_premium(self) -> float:  # Mkt - Rf
-        return self.calculate_market_return() - self.calculate_risk_free_rate()
-
-    def calculate_beta(self, tickers: List[str]) -> Dict[str, float]:
-        betas = {}
-        # Fetch and resample market data to monthly
-        market_data = md.get_data(['^GSPC'], start_date=self.start_date, end_date=self.end_date)
-        monthly_market_data = market_data.resample('ME').last()
-        monthly_market_returns = monthly_market_data.pct_change().dropna()
-
-        for ticker in tickers:
-            # Fetch and resample stock data to monthly
-            stock_data = md.get_data([ticker], start_date=self.start_date, end_date=self.end_date)
-            if stock_data.empty:
-                betas[ticker] = 0.0
-                continue
-            monthly_stock_data = stock_data.resample('ME').last()
-            monthly_stock_returns = monthly_stock_data.pct_change().dropna()
-
-            # Aligning monthly stock returns with market returns
-            # axis=0 ensures alignment only on index (dates), ignoring column names
-            aligned_stock, aligned_market = monthly_stock_returns.align(monthly_market_returns, join='inner', axis=0)
-
-            # Ensure aligned_market is 1D
-            if isinstance(aligned_market, pd.DataFrame):
-                if aligned_market.empty:
-                    betas[ticker] = 0.0
-                    continue
-                aligned_market = aligned_market.iloc[:, 0]
-            
-            # Ensure aligned_stock is 1D
-            if isinstance(aligned_stock, pd.DataFrame):
-                if aligned_stock.empty:
-                    betas[ticker] = 0.0
-                    continue
-                aligned_stock = aligned_stock.iloc[:, 0]
-
-            if aligned_stock.empty or aligned_market.empty:
-                betas[ticker] = 0.0 # Or nan
-                continue
-
-            # Calculating covariance and variance
-            # np.cov returns a 2x2 matrix
-            covariance_matrix = np.cov(aligned_stock, aligned_market)
-            covariance = covariance_matrix[0, 1]
-            market_variance = np.var(aligned_market)
-
-            # Calculating beta
+        :param tickers: list of tickers
+        :param prices: already fetched daily prices with tickers as columns. Downloaded in bulk if not provided.
+        :return: a dictionary {ticker: beta}, 0.0 for tickers without enough overlapping history
+        """
+        if prices is None:
+            prices = (self.data_provider or md).get_data(tickers, start_date=self.start_date, end_date=self.end_date)
+        if isinstance(prices, pd.Series):
+            prices = prices.to_frame(tickers[0])
+        available = [ticker for ticker in tickers if ticker in prices.columns]
+        if not available:
+            return {ticker: 0.0 for ticker in tickers}
+
+        market_data = self.market_inputs.market_prices
+
+        # Resample to month ends once for the whole universe and align on the market's months
+        monthly_stock_returns = prices[available].resample('ME').last().astype(float).pct_change(fill_method=None)
+        monthly_market_returns = market_data.resample('ME').last().pct_change(fill_method=None)
+        monthly_market_returns = monthly_market_returns.reindex(monthly_stock_returns.index)
+
+        stock_returns = monthly_stock_returns.to_numpy(dtype=float)
+        market_returns = monthly_market_returns.to_numpy(dtype=float)[:, None]
+
+        # Pairwise complete observations: months where both the asset and the market have a return
+        mask = ~np.isnan(stock_returns) & ~np.isnan(market_returns)
+        count = mask.sum(axis=0)
+        stock_returns = np.where(mask, stock_returns, 0.0)
+        market_returns = np.where(mask, market_returns, 0.0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stock_means = stock_returns.sum(axis=0) / count
+            market_means = market_returns.sum(axis=0) / count
+            stock_deviations = np.where(mask, stock_returns - stock_means, 0.0)
+            market_deviations = np.where(mask, market_returns - market_means, 0.0)
+            covariance = (stock_deviations * market_deviations).sum(axis=0) / (count - 1)
+            market_variance = (market_deviations ** 2).sum(axis=0) / (count - 1)
             beta = covariance / market_variance
-            betas[ticker] = beta
 
+        beta = np.where((count > 1) & (market_variance > 0), beta, 0.0)
+        betas = dict.fromkeys(tickers, 0.0)
+        betas.update(zip(available, beta.tolist()))
         return betas
 
-    def calculate_expected_return(self, tickers):
+    def calculate_expected_return(self, tickers, prices: pd.DataFrame = None):
         """
         Calculate expected return using the CAPM formula for each ticker
         Formula : E(Ri) = Rf + beta * (E(Rm) - Rf)
 
         :param tickers: list of tickers
+        :param prices: already fetched daily prices of the tickers, used for the betas instead of downloading them again
         :return: a panda series composed of each ticker and their corresponding expected return
         """
         expected_returns = {}
         risk_free_rate = self.calculate_risk_free_rate()
         market_premium = self.calculate_market_premium()
-        betas = self.calculate_beta(tickers)
+        betas = self.calculate_beta(tickers, prices=prices)
 
         for ticker, beta in betas.items():
             # CAPM formula: Expected Return = Risk-Free Rate + Beta*(Market Premium)
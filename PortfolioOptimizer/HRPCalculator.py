@@ -1,72 +1,200 @@
-from pypfopt.hierarchical_portfolio import HRPOpt
+import numpy as np
 import pandas as pd
-from typing import Tuple
+import scipy.cluster.hierarchy as sch
+import scipy.spatial.distance as ssd
+from typing import Dict, Tuple, Union
+
+from PortfolioOptimizer.CovarianceCalculator import CovarianceCalculator
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+
+
+class InfeasibleConstraintsError(ValueError):
+    """
+    Raised when weight bounds cannot be satisfied by a fully invested portfolio.
+    """
+
 
 class HRPCalculator:
-    def __init__(self, data: pd.DataFrame):
+    """
+    Hierarchical Risk Parity (Lopez de Prado) on a returns matrix:
+    assets are clustered on their correlation distance, ordered along the dendrogram (quasi-diagonalization),
+    and weights are allocated by recursive bisection of the ordered assets, inversely to the variance of each half.
+
+    Same algorithm as pypfopt's HRPOpt and riskfolio's HRP model with rm='MV' and codependence='pearson'
+    (riskfolio's default leaf_order=True corresponds to optimal_ordering=True).
+    """
+    LINKAGE_METHODS = ("single", "ward", "average", "complete")
+
+    def __init__(self, data: Union[pd.DataFrame, PricePanel] = None, returns: pd.DataFrame = None, linkage_method: str = "single",
+                 optimal_ordering: bool = False, frequency: int = 252, market_state: MarketState = None,
+                 covariance_calculator: CovarianceCalculator = None):
+        """
+        :param data: Prices, one column per asset. Ignored if returns are given.
+        :param returns: Precomputed (daily) returns, one column per asset.
+        :param market_state: Returns statistics shared with other calculators, used instead of data and returns.
+        :param covariance_calculator: Covariance estimator, sample covariance if None.
+        :param linkage_method: Linkage of the hierarchical clustering: single, ward, average or complete.
+        :param optimal_ordering: Reorder the dendrogram leaves so that successive assets are as close as possible.
+                                 Costly for large universes (about a minute for 2000 assets).
+        :param frequency: Number of returns per year, used to annualize the performance.
+        """
+        if linkage_method not in self.LINKAGE_METHODS:
+            raise ValueError(f"linkage_method must be one of {', '.join(self.LINKAGE_METHODS)}")
+        if data is not None:
+            data = as_frame(data)
+        if market_state is None:
+            if data is None and returns is None:
+                raise ValueError("Either data or returns must be provided")
+            market_state = MarketState(prices=data if returns is None else None, returns=returns, frequency=frequency)
+
         self._data = data
-        self._hrp = HRPOpt(returns=data.pct_change().dropna())
-
-    def calculate_weights(self, constraints: dict = None):
-        raw_weights = self._hrp.optimize()
-        cleaned_weights = self._hrp.clean_weights()
-        
-        if constraints:
-            cleaned_weights = self._apply_constraints(cleaned_weights, constraints)
-            
-        return cleaned_weights
-
-    def _apply_constraints(self, weights: dict, constraints: dict) -> dict:
+        self.returns = market_state.returns
+        self.tickers = market_state.tickers
+        self.linkage_method = linkage_method
+        self.optimal_ordering = optimal_ordering
+        self.frequency = market_state.frequency
+
+        self._mean = market_state.daily_mean.to_numpy()
+        if covariance_calculator is None:
+            self._cov = market_state.daily_covariance.to_numpy()
+        else:
+            covariance = covariance_calculator.calculate_covariance(data, market_state=market_state)
+            self._cov = np.asarray(covariance, dtype=float) / covariance_calculator.frequency
+        self.weights: Dict[str, float] = None
+        self.clusters = None
+
+    def _ordered_assets(self) -> np.ndarray:
         """
-        Iteratively apply max weight constraints and redistribute excess to other assets.
+        :return: Indices of the assets sorted along the dendrogram.
         """
-        # 1. Validate constraints
-        # Ensure constraints don't sum to less than 1 (impossible to satisfy)
-        # But here we only have max constraints. If sum(max_constraints) < 1, it's impossible.
-        # We'll assume user input is somewhat sane, but we can handle the case where we can't distribute.
-        
-        current_weights = weights.copy()
-        
-        for _ in range(100): # Max iterations to prevent infinite loops
-            excess_weight = 0.0
-            violations = False
-            
-            # Check for violations and cap
-            for ticker, weight in current_weights.items():
-                if ticker in constraints and weight > constraints[ticker]:
-                    excess_weight += weight - constraints[ticker]
-                    current_weights[ticker] = constraints[ticker]
-                    violations = True
-            
-            if not violations and excess_weight < 1e-6:
-                break
-                
-            # Redistribute excess
-            # Find eligible assets (those not at their cap)
-            eligible_assets = []
-            total_eligible_weight = 0.0
-            
-            for ticker, weight in current_weights.items():
-                # An asset is eligible if it's not constrained OR if it's constrained but below its cap
-                # (We use a small epsilon for float comparison)
-                limit = constraints.get(ticker, 1.0)
-                if weight < limit - 1e-6:
-                    eligible_assets.append(ticker)
-                    total_eligible_weight += weight
-            
-            if not eligible_assets or total_eligible_weight == 0:
-                # Cannot redistribute further (e.g. all assets hit caps)
-                # This implies sum(constraints) < 1. 
-                # We stop here. The weights will sum to < 1.
+        if len(self.tickers) == 1:
+            return np.array([0])
+        std = np.sqrt(np.diag(self._cov))
+        corr = self._cov / np.outer(std, std)
+        distance = np.sqrt(np.clip((1.0 - corr) / 2.0, 0.0, 1.0))
+        condensed = ssd.squareform(distance, checks=False)
+        self.clusters = sch.linkage(condensed, self.linkage_method, optimal_ordering=self.optimal_ordering)
+        return sch.leaves_list(self.clusters)
+
+    def _recursive_bisection(self, order: np.ndarray) -> np.ndarray:
+        """
+        Split every cluster of the ordered assets in two halves, level by level, and give each half a share of the
+        cluster weight inversely proportional to the variance of its inverse-variance portfolio.
+        The variances of all the clusters of a level are computed at once from block sums of the scaled covariance.
+
+        :return: Weights, in the order of the assets.
+        """
+        n = len(order)
+        cov = self._cov[np.ix_(order, order)]
+        inverse_variance = 1 / np.diag(cov)
+        scaled = inverse_variance[:, None] * cov * inverse_variance[None, :]
+
+        weights = np.ones(n)
+        # Start of every cluster of the current level, the clusters cover all the assets
+        starts = np.array([0])
+        while True:
+            lengths = np.diff(np.append(starts, n))
+            split = lengths > 1
+            if not split.any():
                 break
-                
-            for ticker in eligible_assets:
-                # Distribute proportional to current weight
-                share = current_weights[ticker] / total_eligible_weight
-                current_weights[ticker] += excess_weight * share
-        
-        # Final rounding to ensure clean output
-        return {k: round(v, 5) for k, v in current_weights.items()}
+            children = np.sort(np.concatenate([starts, starts[split] + lengths[split] // 2]))
+
+            # Variance of the inverse-variance portfolio of every child: w' C w / (sum of w)^2
+            block_sums = np.add.reduceat(np.add.reduceat(scaled, children, axis=0), children, axis=1)
+            variances = np.diag(block_sums) / np.add.reduceat(inverse_variance, children) ** 2
+
+            left = np.searchsorted(children, starts[split])
+            alpha = 1 - variances[left] / (variances[left] + variances[left + 1])
+            factors = np.ones(len(children))
+            factors[left] = alpha
+            factors[left + 1] = 1 - alpha
+            weights *= np.repeat(factors, np.diff(np.append(children, n)))
+            starts = children
+
+        result = np.empty(n)
+        result[order] = weights
+        return result
+
+    def calculate_raw_weights(self) -> np.ndarray:
+        """
+        :return: Unconstrained HRP weights, as an array in the order of the tickers.
+        """
+        return self._recursive_bisection(self._ordered_assets())
+
+    def calculate_weights(self, constraints: dict = None, min_weights: dict = None, cutoff: float = 1e-4,
+                          rounding: int = 5) -> Dict[str, float]:
+        """
+        :param constraints: Maximum weight of some assets, e.g. {"GLD": 0.15}.
+        :param min_weights: Minimum weight of some assets.
+        :param cutoff: Weights below cutoff are set to 0.
+        :param rounding: Number of decimals of the weights.
+        :return: A dictionary {ticker: weight}, sorted by ticker.
+        :raises InfeasibleConstraintsError: If the bounds cannot be satisfied by weights summing to 1.
+        """
+        weights = self.calculate_raw_weights()
+        if constraints or min_weights:
+            weights = self._apply_constraints(weights, constraints or {}, min_weights or {})
+        self._weight_array = weights
+
+        weights = np.where(np.abs(weights) < cutoff, 0, weights)
+        if rounding is not None:
+            weights = np.round(weights, rounding)
+        self.weights = {ticker: float(weights[i]) for i, ticker in sorted(enumerate(self.tickers), key=lambda x: x[1])}
+        return self.weights
+
+    def _apply_constraints(self, weights: np.ndarray, constraints: dict, min_weights: dict) -> np.ndarray:
+        """
+        Bring the weights within [min, max] bounds while keeping them proportional to the HRP weights elsewhere:
+        w_i = clip(k * hrp_i, min_i, max_i), with the scale k such that the weights sum to 1.
+
+        The sum is piecewise linear and non-decreasing in k, with breakpoints where an asset reaches a bound,
+        so k is found exactly from the sorted breakpoints in a single vectorized pass.
+        """
+        lower = np.array([min_weights.get(ticker, 0.0) for ticker in self.tickers], dtype=float)
+        upper = np.array([constraints.get(ticker, 1.0) for ticker in self.tickers], dtype=float)
+        if np.any(lower > upper):
+            raise InfeasibleConstraintsError("Minimum weights must not exceed maximum weights.")
+        if lower.sum() > 1 + 1e-9:
+            raise InfeasibleConstraintsError(f"Infeasible constraints: minimum weights sum to {lower.sum():.4f} > 1.")
+
+        # Assets without HRP weight stay at their minimum whatever the scale
+        active = weights > 0
+        reachable = lower[~active].sum() + upper[active].sum()
+        if reachable < 1 - 1e-9:
+            raise InfeasibleConstraintsError(f"Infeasible constraints: maximum weights only allow {reachable:.4f} of the portfolio.")
+
+        # Every active asset starts following k * hrp at k = min / hrp, and stops at k = max / hrp.
+        # Sweep the breakpoints, tracking sum = constant + slope * k
+        hrp = weights[active]
+        breakpoints = np.concatenate([lower[active] / hrp, upper[active] / hrp])
+        constant_changes = np.concatenate([-lower[active], upper[active]])
+        slope_changes = np.concatenate([hrp, -hrp])
+        order = np.argsort(breakpoints, kind='stable')
+        breakpoints = breakpoints[order]
+        constant = lower.sum() + np.cumsum(constant_changes[order])
+        slope = np.cumsum(slope_changes[order])
+        totals = constant + slope * breakpoints
+
+        # First breakpoint where the sum reaches 1: k lies on the linear piece right before it
+        index = int(np.searchsorted(totals, 1 - 1e-12))
+        if index == 0:
+            scale = breakpoints[0]
+        else:
+            index = min(index, len(breakpoints) - 1)
+            previous_constant, previous_slope = constant[index - 1], slope[index - 1]
+            scale = (1 - previous_constant) / previous_slope if previous_slope > 0 else breakpoints[index - 1]
+
+        return np.clip(scale * weights, lower, upper) * active + lower * ~active
 
     def calculate_performance(self, risk_free_rate=0.02) -> Tuple[float, float, float]:
-        return self._hrp.portfolio_performance(risk_free_rate=risk_free_rate)
+        """
+        :return: Annualized expected return (historical mean), volatility and Sharpe ratio of the last weights.
+        """
+        if self.weights is None:
+            raise ValueError("Weights not calculated yet. Run calculate_weights first.")
+        weights = self._weight_array
+        expected_return = float(weights @ self._mean * self.frequency)
+        volatility = float(np.sqrt(weights @ self._cov @ weights * self.frequency))
+        sharpe = (expected_return - risk_free_rate) / volatility if volatility > 0 else 0.0
+        return expected_return, volatility, float(sharpe)
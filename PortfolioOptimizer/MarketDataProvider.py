@@ -1,16 +1,98 @@
+import functools
 import logging
+import threading
+import time
+import numpy as np
 import yfinance as yf
 import pandas as pd
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+from PortfolioOptimizer.AssetNameResolver import AssetNameResolver
+from PortfolioOptimizer.DataSource import DataSource, data_source_from_env
+from PortfolioOptimizer.PricePanel import PricePanel
+from PortfolioOptimizer.PriceStore import PriceStore, last_bars, period_to_range
+
+
+class TickerValidityCache:
+    """
+    Remembers which symbols were found valid or invalid, so known-bad symbols are not downloaded again
+    until their entry expires.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600):
+        """
+        :param ttl: Time to live of a verdict, in seconds.
+        """
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[bool, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ticker: str) -> Optional[bool]:
+        """
+        :return: True or False if the ticker has a fresh verdict, None if it is unknown or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(ticker)
+            if entry is None:
+                return None
+            valid, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[ticker]
+                return None
+            return valid
+
+    def set(self, ticker: str, valid: bool):
+        with self._lock:
+            self._entries[ticker] = (valid, time.monotonic() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _ProviderMethod:
+    """
+    A provider method that can also be called on the class, as MarketDataProvider.get_data(tickers, ...) was when
+    it was static: it then runs on a provider of the process-wide source and price store.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        functools.update_wrapper(self, function)
+
+    def __get__(self, instance, owner):
+        return functools.partial(self.function, instance if instance is not None else owner())
 
 
 class MarketDataProvider:
+    """
+    Prices of a data source (yfinance by default), behind the price store and the ticker validity cache.
 
-    @staticmethod
-    def get_data(tickers: List, start_date: str = None, end_date: str = None, period: str = None,
+    The class attributes are the process-wide defaults, configured from the environment. A provider built with
+    its own source or store, e.g. MarketDataProvider(ReplayDataSource(prices)) for offline runs, can be passed
+    to the calculators instead.
+    """
+    # Where prices come from, see data_source_from_env()
+    source: DataSource = data_source_from_env()
+    # Optional on-disk price cache sitting in front of the source, see PriceStore.from_env()
+    price_store: Optional[PriceStore] = PriceStore.from_env()
+    ticker_validity = TickerValidityCache()
+
+    def __init__(self, source: DataSource = None, price_store: PriceStore = None):
+        """
+        :param source: Data source of this provider, MarketDataProvider.source if None.
+        :param price_store: Price cache of this provider, MarketDataProvider.price_store if None.
+        """
+        if source is not None:
+            self.source = source
+        if price_store is not None:
+            self.price_store = price_store
+
+    @_ProviderMethod
+    def get_data(self, tickers: List, start_date: str = None, end_date: str = None, period: str = None,
                  frequency: str = 'Adj Close', return_updated_tickers: bool = False):
         """
-        Fetches stock market data for specified tickers using Yahoo Finance API.
+        Fetches stock market data for specified tickers from the data source (Yahoo Finance API by default).
 
             :param return_updated_tickers:
             :param tickers: A list of stock ticker symbols or a single ticker symbol as string.
@@ -22,52 +104,175 @@ class MarketDataProvider:
                               yfinance such as 'Open', 'Close', 'High', 'Low', 'Volume'.
             :return: A pandas DataFrame containing the fetched data with dates as index and tickers as columns.
         """
-        valid_tickers = []
-        for ticker in tickers:
-            stock_data = yf.Ticker(ticker)
-            # Check if the ticker has historical data as a proxy for validation
-            if not stock_data.history(period="1mo").empty:
-                valid_tickers.append(ticker)
-            else:
-                print(f"Ticker {ticker} is not valid or delisted.")
+        candidates = MarketDataProvider._filter_known_invalid(tickers)
+        recent = MarketDataProvider._is_recent(end_date if not period else None)
+
+        store = self.price_store
+        if store is not None:
+            window = period_to_range(period) if period else (start_date, end_date)
+            if window is not None:
+                return self._get_stored_data(store, candidates, *window, frequency=frequency, period=period,
+                                             return_updated_tickers=return_updated_tickers)
 
+        valid_tickers = []
         try:
             # Decide whether to use period or start and end dates
             try:
-                if period:
-                    data = yf.download(valid_tickers, period=period, auto_adjust=False)
+                if not candidates:
+                    prices = pd.DataFrame()
+                elif period:
+                    prices = self.source.download(candidates, period=period, field=frequency)
                 else:
                     if not start_date or not end_date:
                         raise ValueError("Start date and end date must be specified if not using period.")
-                    data = yf.download(valid_tickers, start=start_date, end=end_date, auto_adjust=False)
+                    prices = self.source.download(candidates, start_date=start_date, end_date=end_date,
+                                                  field=frequency)
             except Exception as e:
-                print(f"Error downloading data: {e}")
+                logging.error(f"Error downloading data: {e}")
                 return (pd.DataFrame(), []) if return_updated_tickers else pd.DataFrame()
 
-            if data.empty:
+            if prices is None or prices.empty:
                 return (pd.DataFrame(), []) if return_updated_tickers else pd.DataFrame()
 
+            # A ticker is valid if the bulk download returned at least one price for it
+            valid_tickers = MarketDataProvider._validate(candidates, prices, recent)
+            prices = prices[valid_tickers]
+
             if return_updated_tickers:
-                return data[frequency], valid_tickers
+                return prices, valid_tickers
             else:
-                return data[frequency]
+                return prices
         except Exception as e:
             logging.error(f"Error fetching data for {valid_tickers} from {start_date} to {end_date}: {e}")
             raise
 
+    @_ProviderMethod
+    def get_panel(self, tickers: List, start_date: str = None, end_date: str = None, period: str = None,
+                  frequency: str = 'Adj Close', dtype=np.float32) -> Tuple[PricePanel, List]:
+        """
+        Same as get_data, with the prices of the valid tickers as a PricePanel, float32 unless dtype says otherwise.
+
+        :return: The panel and the valid tickers.
+        """
+        prices, valid_tickers = self.get_data(tickers, start_date=start_date, end_date=end_date, period=period,
+                                              frequency=frequency, return_updated_tickers=True)
+        return PricePanel.from_frame(prices, dtype=dtype), valid_tickers
+
     @staticmethod
-    def get_asset_names(tickers: List[str]) -> dict:
+    def _filter_known_invalid(tickers: List) -> List:
+        candidates = []
+        for ticker in tickers:
+            if MarketDataProvider.ticker_validity.get(ticker) is False:
+                logging.warning(f"Ticker {ticker} is not valid or delisted.")
+            else:
+                candidates.append(ticker)
+        return candidates
+
+    @staticmethod
+    def _is_recent(end_date) -> bool:
         """
-        Fetches the full name (longName) for a list of tickers.
-        Returns a dictionary {ticker: full_name}.
+        Whether a window ends within the last month. Only such windows can prove a ticker invalid,
+        an older window may simply predate the listing.
+        """
+        if end_date is None:
+            return True
+        return pd.Timestamp(end_date) >= pd.Timestamp.today().normalize() - pd.DateOffset(months=1)
+
+    @staticmethod
+    def _validate(tickers: List, prices: pd.DataFrame, recent: bool, unverified=()) -> List:
+        """
+        Infers the valid tickers from a bulk download: columns that are not entirely NaN.
+        Verdicts are remembered in MarketDataProvider.ticker_validity.
+
+        :param unverified: Tickers whose download failed: missing ones are not valid, but nothing is remembered
+                           about them.
+        """
+        has_data = prices.notna().any() if not prices.empty else pd.Series(dtype=bool)
+        valid_tickers = []
+        for ticker in tickers:
+            if ticker in has_data.index and has_data[ticker]:
+                valid_tickers.append(ticker)
+                if ticker not in unverified:
+                    MarketDataProvider.ticker_validity.set(ticker, True)
+            elif ticker in unverified:
+                logging.warning(f"No data for {ticker}, its download failed.")
+            else:
+                logging.warning(f"Ticker {ticker} is not valid or delisted.")
+                if recent:
+                    MarketDataProvider.ticker_validity.set(ticker, False)
+        return valid_tickers
+
+    def _get_stored_data(self, store: PriceStore, tickers: List, start_date, end_date, frequency: str = 'Adj Close',
+                         period: str = None, return_updated_tickers: bool = False):
+        """
+        Serves get_data from the price store, downloading only the date ranges it does not hold yet.
+        Tickers sharing the same missing range are fetched in a single download.
+
+        :param period: The period the window was built from, whose last bars are kept as yfinance does for '5d'.
         """
-        names = {}
+        if not start_date or not end_date:
+            raise ValueError("Start date and end date must be specified if not using period.")
+
+        gaps = {}
         for ticker in tickers:
+            for gap in store.missing_ranges(ticker, frequency, start_date, end_date):
+                gaps.setdefault(gap, []).append(ticker)
+
+        # Tickers of the gaps whose download failed, which prove nothing about their validity
+        unverified = set()
+        for (gap_start, gap_end), gap_tickers in gaps.items():
             try:
-                info = yf.Ticker(ticker).info
-                # Try longName, then shortName, then fallback to ticker
-                names[ticker] = info.get('longName') or info.get('shortName') or ticker
+                prices = self.source.download(gap_tickers, start_date=gap_start.isoformat(),
+                                              end_date=gap_end.isoformat(), field=frequency)
             except Exception as e:
-                logging.warning(f"Could not fetch name for {ticker}: {e}")
-                names[ticker] = ticker
-        return names
\ No newline at end of file
+                logging.warning(f"Could not fetch {gap_tickers} from {gap_start} to {gap_end}, serving stored data: {e}")
+                unverified.update(gap_tickers)
+                continue
+
+            if prices is None or prices.empty:
+                # An empty answer is only trusted when the gap has no business day at all,
+                # otherwise it is most likely a transient failure and the gap is retried next time.
+                if len(pd.bdate_range(gap_start, gap_end, inclusive='left')) == 0:
+                    for ticker in gap_tickers:
+                        store.write(ticker, frequency, pd.Series(dtype=float), gap_start, gap_end)
+                else:
+                    unverified.update(gap_tickers)
+                continue
+
+            for ticker in gap_tickers:
+                series = prices[ticker] if ticker in prices.columns else pd.Series(dtype=float)
+                store.write(ticker, frequency, series, gap_start, gap_end)
+
+        prices = last_bars(store.read(tickers, frequency, start_date, end_date), period)
+        valid_tickers = MarketDataProvider._validate(tickers, prices, MarketDataProvider._is_recent(end_date),
+                                                     unverified=unverified)
+
+        if prices.empty:
+            return (pd.DataFrame(), []) if return_updated_tickers else pd.DataFrame()
+        prices = prices[valid_tickers]
+        return (prices, valid_tickers) if return_updated_tickers else prices
+
+    @staticmethod
+    def get_asset_names(tickers: List[str], timeout: float = None) -> dict:
+        """
+        Fetches the full name (longName) for a list of tickers.
+        Names are served from MarketDataProvider.name_resolver, which only waits `timeout` seconds for
+        the ones it does not know yet and falls back to the ticker for those.
+        Returns a dictionary {ticker: full_name}.
+        """
+        return MarketDataProvider.name_resolver.resolve(tickers, timeout=timeout)
+
+    @staticmethod
+    def warm_up_asset_names(tickers: List[str]):
+        """
+        Starts resolving the names of the given tickers in the background, e.g. for a standard universe
+        at start-up or while a request is being optimized.
+        """
+        MarketDataProvider.name_resolver.warm_up(tickers)
+
+
+def _fetch_asset_info(ticker: str) -> dict:
+    return yf.Ticker(ticker).info
+
+
+MarketDataProvider.name_resolver = AssetNameResolver.from_env(_fetch_asset_info)
@@ -0,0 +1,304 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+from pypfopt import risk_models
+
+from PortfolioOptimizer.PricePanel import PricePanel, as_frame
+
+
+class MarketState:
+    """
+    Daily returns of a price frame and their statistics (mean, compounded growth, covariance), computed once and
+    shared by every strategy working on the same prices.
+
+    Returns are computed as pypfopt does (forward filled prices, rows without any return dropped) and the covariance
+    is the pairwise-complete sample covariance, so results match risk_models.sample_cov and
+    expected_returns.mean_historical_return. Statistics are kept as running sums per pair of assets: new daily bars
+    are added with rank-1 (Welford) updates by extended(), without going through the history again.
+
+    Instances are not modified once built, so they can be shared between threads.
+    """
+
+    def __init__(self, prices: Union[pd.DataFrame, PricePanel] = None, returns: pd.DataFrame = None,
+                 frequency: int = 252, ffill: bool = True):
+        """
+        :param prices: Daily prices, one column per asset. A PricePanel is kept as a frame sharing its array.
+        :param returns: Precomputed daily returns, when prices are not available. Such a state cannot be extended.
+        :param frequency: Number of returns per year, used to annualize the statistics.
+        :param ffill: Forward fill missing prices before computing the returns, as pypfopt does. Prices aligned by
+                      DataAlignment are already filled as far as allowed: their remaining gaps are kept as missing
+                      returns, left out of the pairwise-complete statistics.
+        """
+        if prices is not None:
+            prices = as_frame(prices)
+        if returns is None:
+            if prices is None:
+                raise ValueError("Either prices or returns must be provided")
+            returns = _returns_from_prices(prices, ffill=ffill)
+        self.prices = prices
+        self.returns = returns
+        self.tickers = list(returns.columns)
+        self.frequency = frequency
+        self.ffill = ffill
+
+        values = returns.to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        mask = present.astype(float)
+
+        # Number of returns available for both assets of every pair
+        self._count = mask.T @ mask
+        # Shift by the mean of every asset before summing products, for accuracy
+        shift = np.where(present, values, 0.0).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+        shifted = np.where(present, values - shift, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # _pair_mean[i, j]: mean return of asset i over the days where both i and j have a return
+            offset = np.where(self._count > 0, (shifted.T @ mask) / self._count, 0.0)
+        self._pair_mean = shift[:, None] + offset
+        # Sum of the products of deviations from the pair means
+        self._comoment = shifted.T @ shifted - self._count * offset * offset.T
+        self._growth = np.prod(np.where(present, 1 + values, 1.0), axis=0)
+
+    def extended(self, new_prices: pd.DataFrame) -> 'MarketState':
+        """
+        :param new_prices: Prices of the same assets on days after the last day of this state.
+        :return: A new state including the new days. Statistics are updated one day at a time, each update costing
+                 O(assets^2) instead of O(days * assets^2) for a recomputation.
+        """
+        if self.prices is None:
+            raise ValueError("A state built from returns cannot be extended")
+        new_prices = as_frame(new_prices)[self.tickers]
+        if len(new_prices) and new_prices.index[0] <= self.prices.index[-1]:
+            raise ValueError("New prices must start after the last day of the state")
+
+        # The last known price of every asset is the reference of the first new return
+        last_prices = (self.prices.ffill() if self.ffill else self.prices).iloc[-1:]
+        new_returns = _returns_from_prices(pd.concat([last_prices, new_prices]), ffill=self.ffill) \
+            .loc[new_prices.index[0]:] if len(new_prices) else self.returns.iloc[:0]
+
+        state = object.__new__(MarketState)
+        state.prices = pd.concat([self.prices, new_prices])
+        state.returns = pd.concat([self.returns, new_returns])
+        state.tickers = self.tickers
+        state.frequency = self.frequency
+        state.ffill = self.ffill
+        state._count = self._count.copy()
+        state._pair_mean = self._pair_mean.copy()
+        state._comoment = self._comoment.copy()
+        state._growth = self._growth.copy()
+        for row in new_returns.to_numpy(dtype=float):
+            state._add_returns(row)
+        return state
+
+    def rolled(self, new_returns: pd.DataFrame, dropped: int = 0) -> 'MarketState':
+        """
+        Move a window of returns forward, e.g. the lookback window of a backtest.
+
+        :param new_returns: Returns of the same assets on the days following the window.
+        :param dropped: Number of days removed from the start of the window.
+        :return: A new state, without prices. The added and removed days are merged into the statistics as blocks
+                 (pairwise update of Chan et al.), costing O(days moved * assets^2) whatever the window length.
+        """
+        new_returns = new_returns[self.tickers]
+        state = object.__new__(MarketState)
+        state.prices = None
+        state.returns = pd.concat([self.returns.iloc[dropped:], new_returns])
+        state.tickers = self.tickers
+        state.frequency = self.frequency
+        state.ffill = self.ffill
+        state._count = self._count.copy()
+        state._pair_mean = self._pair_mean.copy()
+        state._comoment = self._comoment.copy()
+        state._growth = self._growth.copy()
+        if dropped:
+            state._merge(MarketState(returns=self.returns.iloc[:dropped]), remove=True)
+        if len(new_returns):
+            state._merge(MarketState(returns=new_returns))
+        return state
+
+    def _merge(self, block: 'MarketState', remove: bool = False):
+        """
+        Add (or remove) the days of another state of the same assets to the pair statistics.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if not remove:
+                count = self._count + block._count
+                delta = block._pair_mean - self._pair_mean
+                self._pair_mean = self._pair_mean + np.where(count > 0, delta * block._count / count, 0.0)
+                self._comoment = self._comoment + block._comoment + np.where(
+                    count > 0, delta * delta.T * self._count * block._count / count, 0.0)
+                self._growth = self._growth * block._growth
+            else:
+                count = self._count - block._count
+                mean = np.where(count > 0, (self._count * self._pair_mean - block._count * block._pair_mean) / count,
+                                0.0)
+                delta = block._pair_mean - mean
+                self._comoment = np.where(count > 0, self._comoment - block._comoment - np.where(
+                    count > 0, delta * delta.T * count * block._count / self._count, 0.0), 0.0)
+                self._pair_mean = mean
+                self._growth = self._growth / block._growth
+        self._count = count
+
+    def subset(self, tickers: List[str]) -> 'MarketState':
+        """
+        :param tickers: Some of the assets of this state.
+        :return: The state of these assets alone, the same as MarketState(prices[tickers]) without the days where
+                 none of them has a price. Statistics are sliced from this state, unless such a day falls within
+                 their history: the other assets then add a flat day to their returns and it is recomputed.
+        """
+        tickers = list(tickers)
+        if self.prices is not None:
+            prices = self.prices[tickers]
+            priced = prices.notna().any(axis=1)
+            if (~priced & (priced.cumsum() > 0)).any():
+                return MarketState(prices[priced], frequency=self.frequency, ffill=self.ffill)
+            prices = prices[priced]
+        else:
+            prices = None
+
+        indices = [self.tickers.index(ticker) for ticker in tickers]
+        pairs = np.ix_(indices, indices)
+        state = object.__new__(MarketState)
+        state.prices = prices
+        state.returns = self.returns[tickers].dropna(how="all")
+        state.tickers = tickers
+        state.frequency = self.frequency
+        state.ffill = self.ffill
+        state._count = self._count[pairs].copy()
+        state._pair_mean = self._pair_mean[pairs].copy()
+        state._comoment = self._comoment[pairs].copy()
+        state._growth = self._growth[indices].copy()
+        return state
+
+    def _add_returns(self, returns: np.ndarray):
+        """
+        Welford update of the pair statistics with one day of returns (NaN for assets without a return that day).
+        """
+        present = ~np.isnan(returns)
+        values = np.where(present, returns, 0.0)
+        pairs = present[:, None] & present[None, :]
+
+        self._count += pairs
+        delta = np.where(pairs, values[:, None] - self._pair_mean, 0.0)
+        self._pair_mean += np.where(pairs, delta / np.maximum(self._count, 1), 0.0)
+        self._comoment += np.where(pairs, delta * (values[None, :] - self._pair_mean.T), 0.0)
+        self._growth *= np.where(present, 1 + values, 1.0)
+
+    @property
+    def counts(self) -> pd.Series:
+        """
+        :return: Number of daily returns of every asset.
+        """
+        return pd.Series(np.diag(self._count).astype(int), index=self.tickers)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: Memory held by the prices, returns, pair statistics and the statistics computed so far, in bytes.
+        """
+        total = 0
+        for value in vars(self).values():
+            if isinstance(value, np.ndarray):
+                total += value.nbytes
+            elif isinstance(value, pd.DataFrame):
+                total += int(value.memory_usage(index=False).sum())
+            elif isinstance(value, pd.Series):
+                total += int(value.memory_usage(index=False))
+        return total
+
+    @cached_property
+    def daily_mean(self) -> pd.Series:
+        """
+        :return: Arithmetic mean of the daily returns of every asset.
+        """
+        return pd.Series(np.diag(self._pair_mean).copy(), index=self.tickers)
+
+    @cached_property
+    def daily_covariance(self) -> pd.DataFrame:
+        """
+        :return: Pairwise-complete sample covariance of the daily returns (NaN for pairs with less than 2 days).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = np.where(self._count > 1, self._comoment / (self._count - 1), np.nan)
+        return pd.DataFrame(covariance, index=self.tickers, columns=self.tickers)
+
+    @cached_property
+    def covariance(self) -> pd.DataFrame:
+        """
+        :return: Annualized sample covariance, fixed to be positive semidefinite (same as risk_models.sample_cov).
+        """
+        return risk_models.fix_nonpositive_semidefinite(self.daily_covariance * self.frequency)
+
+    def mean_historical_return(self, compounding: bool = True) -> pd.Series:
+        """
+        :param compounding: Annualize the compounded growth (CAGR) if True, the arithmetic mean otherwise.
+        :return: Annualized mean historical return of every asset (same as expected_returns.mean_historical_return).
+        """
+        if compounding:
+            counts = np.diag(self._count)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return pd.Series(self._growth ** (self.frequency / counts) - 1, index=self.tickers)
+        return self.daily_mean * self.frequency
+
+
+def _returns_from_prices(prices: pd.DataFrame, ffill: bool = True) -> pd.DataFrame:
+    # Same as pypfopt's returns_from_prices, without the deprecated implicit forward fill of pct_change.
+    # Returns are computed in float64 whatever the precision of the prices.
+    prices = prices.astype(np.float64, copy=False)
+    return (prices.ffill() if ffill else prices).pct_change(fill_method=None).dropna(how="all")
+
+
+# Process-wide memo of the last MarketState of every universe, bounded by the size of the states
+# (MARKET_STATE_CACHE_MAX_BYTES, 256 MB by default): least recently used ones are evicted first
+_MARKET_STATE_CACHE_MAX_BYTES = int(os.environ.get('MARKET_STATE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+_market_state_cache: 'OrderedDict[tuple, MarketState]' = OrderedDict()
+_market_state_sizes = {}
+_market_state_bytes = 0
+_market_state_lock = threading.Lock()
+
+
+def get_market_state(prices: Union[pd.DataFrame, PricePanel]) -> MarketState:
+    """
+    Get the MarketState of a price frame. When a state of the same assets and start date is cached and the prices
+    only add days at its end, the cached state is extended with the new days instead of being recomputed.
+    """
+    prices = as_frame(prices)
+    key = (tuple(prices.columns), prices.index[0] if len(prices) else None)
+    with _market_state_lock:
+        cached = _market_state_cache.get(key)
+
+    state = None
+    if cached is not None and len(prices) >= len(cached.prices):
+        known = prices.iloc[:len(cached.prices)]
+        if known.index.equals(cached.prices.index) and known.equals(cached.prices):
+            state = cached if len(prices) == len(cached.prices) else cached.extended(prices.iloc[len(cached.prices):])
+    if state is None:
+        state = MarketState(prices)
+
+    size = state.nbytes
+    global _market_state_bytes
+    with _market_state_lock:
+        if key in _market_state_cache:
+            del _market_state_cache[key]
+            _market_state_bytes -= _market_state_sizes.pop(key)
+        if size > _MARKET_STATE_CACHE_MAX_BYTES:
+            return state
+        _market_state_cache[key] = state
+        _market_state_sizes[key] = size
+        _market_state_bytes += size
+        while _market_state_bytes > _MARKET_STATE_CACHE_MAX_BYTES:
+            evicted, _ = _market_state_cache.popitem(last=False)
+            _market_state_bytes -= _market_state_sizes.pop(evicted)
+    return state
+
+
+def clear_market_state_cache():
+    global _market_state_bytes
+    with _market_state_lock:
+        _market_state_cache.clear()
+        _market_state_sizes.clear()
+        _market_state_bytes = 0
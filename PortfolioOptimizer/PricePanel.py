@@ -0,0 +1,102 @@
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+
+class PricePanel:
+    """
+    One field of the daily bars of several assets, as a single contiguous (dates x assets) array with separate date
+    and ticker indexes. Prices are float32 by default: half the memory of a float64 DataFrame and a twelfth of the
+    six-field float64 download they come from, while 7 significant digits are more than quotes have.
+
+    to_frame() wraps the array in a DataFrame without copying it, and MarketState, hence every estimator built on it,
+    takes a panel wherever it takes prices. Returns and statistics are still computed in float64.
+    """
+    DTYPES = (np.float32, np.float64)
+
+    def __init__(self, values: np.ndarray, dates, tickers: List[str], dtype=np.float32):
+        """
+        :param values: Prices, dates x assets, NaN where an asset has no price.
+        :param dates: Date of every row.
+        :param tickers: Ticker of every column.
+        :param dtype: float32 or float64. The values are copied only if they are not already a C-contiguous array
+                      of this type.
+        """
+        if np.dtype(dtype) not in [np.dtype(allowed) for allowed in self.DTYPES]:
+            raise ValueError("dtype must be float32 or float64")
+        values = np.ascontiguousarray(values, dtype=dtype)
+        dates = pd.DatetimeIndex(dates, name='Date')
+        tickers = list(tickers)
+        if values.ndim != 2 or values.shape != (len(dates), len(tickers)):
+            raise ValueError(f"values must be a dates x assets array of shape ({len(dates)}, {len(tickers)})")
+        self.values = values
+        self.dates = dates
+        self.tickers = tickers
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dtype=np.float32) -> 'PricePanel':
+        """
+        :param frame: Prices indexed by date, one column per ticker.
+        """
+        return cls(frame.to_numpy(dtype=dtype), frame.index, frame.columns, dtype=dtype)
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, pd.Series], dtype=np.float32) -> 'PricePanel':
+        """
+        Build a panel from the prices of every ticker on its own dates, writing them straight into the array
+        instead of aligning them in an intermediate float64 DataFrame.
+        """
+        if not columns:
+            return cls(np.empty((0, 0)), [], [], dtype=dtype)
+        dates = pd.DatetimeIndex(np.unique(np.concatenate([series.index.values for series in columns.values()])))
+        values = np.full((len(dates), len(columns)), np.nan, dtype=dtype)
+        for column, series in enumerate(columns.values()):
+            values[dates.get_indexer(series.index), column] = series.to_numpy()
+        return cls(values, dates, list(columns), dtype=dtype)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        :return: The prices as a DataFrame sharing the memory of the panel: writing to one writes to the other.
+        """
+        return pd.DataFrame(self.values, index=self.dates, columns=self.tickers, copy=False)
+
+    def subset(self, tickers: List[str]) -> 'PricePanel':
+        columns = pd.Index(self.tickers).get_indexer(tickers)
+        if np.any(columns < 0):
+            raise ValueError("Unknown tickers")
+        return PricePanel(self.values[:, columns], self.dates, tickers, dtype=self.dtype)
+
+    def between(self, start=None, end=None) -> 'PricePanel':
+        """
+        :return: The rows in [start, end), a view of the same array.
+        """
+        lo = self.dates.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        hi = self.dates.searchsorted(pd.Timestamp(end)) if end is not None else len(self.dates)
+        return PricePanel(self.values[lo:hi], self.dates[lo:hi], self.tickers, dtype=self.dtype)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.values.dtype
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    @property
+    def empty(self) -> bool:
+        return self.values.size == 0
+
+    def __len__(self):
+        return len(self.dates)
+
+
+def as_frame(prices: Union[pd.DataFrame, PricePanel]) -> pd.DataFrame:
+    """
+    :return: The prices as a DataFrame, without copying a panel.
+    """
+    return prices.to_frame() if isinstance(prices, PricePanel) else prices
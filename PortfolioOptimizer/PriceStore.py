@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.PricePanel import PricePanel
+
+# One record per stored observation. Dates are kept at day resolution so files are compact and sortable.
+_RECORD_DTYPE = np.dtype([('date', 'datetime64[D]'), ('value', 'f8')])
+
+
+def _to_date(value) -> date:
+    return pd.Timestamp(value).date()
+
+
+class PriceStore:
+    """
+    On-disk cache of daily price series, stored as one memory-mapped NumPy file per (field, ticker).
+
+    Every series keeps a sidecar list of the [start, end) date ranges that were already fetched, so a
+    request for an overlapping window only needs to download the missing gaps. Ranges that returned no
+    rows (week-ends, holidays, unknown symbols) are recorded too and are never fetched twice.
+
+    In offline (replay) mode the store never reports gaps, and callers serve whatever it holds.
+    """
+
+    def __init__(self, root: str, offline: bool = False):
+        """
+        :param root: Directory where the price files are written. Created on first write.
+        :param offline: If True, never ask for downloads and only replay stored data.
+        """
+        self.root = root
+        self.offline = offline
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['PriceStore']:
+        """
+        Build a store from the PRICE_STORE_DIR and PRICE_STORE_OFFLINE environment variables.
+
+        :return: A PriceStore, or None if PRICE_STORE_DIR is not set.
+        """
+        root = os.environ.get('PRICE_STORE_DIR')
+        if not root:
+            return None
+        offline = os.environ.get('PRICE_STORE_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        return cls(root, offline=offline)
+
+    def _paths(self, ticker: str, field: str) -> Tuple[str, str]:
+        directory = os.path.join(self.root, quote(field, safe=''))
+        name = quote(ticker, safe='')
+        return os.path.join(directory, name + '.npy'), os.path.join(directory, name + '.json')
+
+    def coverage(self, ticker: str, field: str) -> List[Tuple[date, date]]:
+        """
+        :return: The sorted, non-overlapping [start, end) date ranges already fetched for this series.
+        """
+        _, coverage_path = self._paths(ticker, field)
+        if not os.path.exists(coverage_path):
+            return []
+        with open(coverage_path) as f:
+            ranges = json.load(f)
+        return [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in ranges]
+
+    def missing_ranges(self, ticker: str, field: str, start, end) -> List[Tuple[date, date]]:
+        """
+        Compute the parts of [start, end) that are not covered by the store yet.
+
+        :return: A list of [start, end) date ranges to download. Always empty in offline mode.
+        """
+        if self.offline:
+            return []
+        start, end = _to_date(start), _to_date(end)
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self.coverage(ticker, field):
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _load(self, ticker: str, field: str) -> np.ndarray:
+        data_path, _ = self._paths(ticker, field)
+        if not os.path.exists(data_path):
+            return np.empty(0, dtype=_RECORD_DTYPE)
+        try:
+            return np.load(data_path, mmap_mode='r')
+        except ValueError:
+            # Zero-length arrays cannot be memory-mapped
+            return np.load(data_path)
+
+    def read(self, tickers: List[str], field: str, start, end) -> pd.DataFrame:
+        """
+        Read the stored observations of several tickers over [start, end).
+
+        :return: A DataFrame indexed by date with one column per ticker that has data in the window.
+        """
+        columns = self._read_columns(tickers, field, start, end)
+        if not columns:
+            return pd.DataFrame()
+        data = pd.concat(columns, axis=1).sort_index()
+        data.index.name = 'Date'
+        return data
+
+    def read_panel(self, tickers: List[str], field: str, start, end, dtype=np.float32) -> PricePanel:
+        """
+        Same as read, as a PricePanel filled straight from the stored observations.
+        """
+        return PricePanel.from_columns(self._read_columns(tickers, field, start, end), dtype=dtype)
+
+    def _read_columns(self, tickers: List[str], field: str, start, end) -> Dict[str, pd.Series]:
+        start = np.datetime64(_to_date(start), 'D')
+        end = np.datetime64(_to_date(end), 'D')
+        columns = {}
+        for ticker in tickers:
+            records = self._load(ticker, field)
+            lo, hi = np.searchsorted(records['date'], [start, end])
+            if hi > lo:
+                window = np.array(records[lo:hi])
+                columns[ticker] = pd.Series(window['value'], index=pd.DatetimeIndex(window['date']))
+            del records
+        return columns
+
+    def write(self, ticker: str, field: str, series: pd.Series, start, end):
+        """
+        Merge freshly downloaded observations into the store and mark [start, end) as fetched.
+
+        Today's bar is stored but not marked as covered, as it can still change before the close.
+
+        :param series: Observations indexed by date. NaN values are ignored.
+        :param start: First date of the downloaded window.
+        :param end: Exclusive end of the downloaded window.
+        """
+        data_path, coverage_path = self._paths(ticker, field)
+        series = series.dropna()
+
+        with self._lock:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+            if not series.empty:
+                existing = np.array(self._load(ticker, field))
+                new = np.empty(len(series), dtype=_RECORD_DTYPE)
+                new['date'] = pd.DatetimeIndex(series.index).tz_localize(None).values.astype('datetime64[D]')
+                new['value'] = series.values
+                merged = np.concatenate([new, existing])
+                # Keep the first occurrence of every date, which is the freshly downloaded one
+                _, keep = np.unique(merged['date'], return_index=True)
+                self._atomic_save(data_path, merged[keep])
+
+            covered_end = min(_to_date(end), date.today())
+            covered_start = _to_date(start)
+            if covered_start < covered_end:
+                ranges = self.coverage(ticker, field) + [(covered_start, covered_end)]
+                self._atomic_dump(coverage_path, self._merge_ranges(ranges))
+
+    @staticmethod
+    def _merge_ranges(ranges: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def _atomic_save(path: str, records: np.ndarray):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, records)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _atomic_dump(path: str, ranges: List[Tuple[date, date]]):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump([[start.isoformat(), end.isoformat()] for start, end in ranges], f)
+        os.replace(tmp_path, path)
+
+
+def period_to_range(period: str, today: date = None) -> Optional[Tuple[date, date]]:
+    """
+    Convert a yfinance period string ('5d', '1mo', '2y', ...) into a [start, end) date range ending today.
+    Day periods count trading days, as yfinance does: their range spans enough calendar days to hold them, and
+    last_bars() keeps the last ones.
+
+    :param today: Last day of the range, the actual date if None (e.g. the last day of replayed data).
+    :return: The date range, or None for periods that have no fixed length such as 'max' or 'ytd'.
+    """
+    end = (today or date.today()) + timedelta(days=1)
+    bars = period_bars(period)
+    if bars is not None:
+        # Week-ends and a margin for holidays
+        return end - timedelta(days=bars * 3 // 2 + 7), end
+    units = {'wk': 'weeks', 'mo': 'months', 'y': 'years'}
+    for suffix, unit in units.items():
+        count = period[:-len(suffix)]
+        if period.endswith(suffix) and count.isdigit():
+            start = (pd.Timestamp(end) - pd.DateOffset(**{unit: int(count)})).date()
+            return start, end
+    return None
+
+
+def period_bars(period: str) -> Optional[int]:
+    """
+    :return: The number of bars of a day period ('5d' is the last 5 trading days), None for other periods.
+    """
+    count = period[:-1]
+    return int(count) if period.endswith('d') and count.isdigit() else None
+
+
+def last_bars(prices: pd.DataFrame, period: Optional[str]) -> pd.DataFrame:
+    """
+    Keep the bars of a day period out of the prices of its range (see period_to_range), other prices as they are.
+    """
+    bars = period_bars(period) if period else None
+    if bars is None:
+        return prices
+    return prices.dropna(how='all').iloc[-bars:] if bars > 0 else prices.iloc[:0]
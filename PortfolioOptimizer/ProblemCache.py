@@ -0,0 +1,339 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import cvxpy as cp
+import numpy as np
+
+
+class PortfolioProblem:
+    """
+    A long-only portfolio problem of a given kind and size, built once with all its inputs as cvxpy parameters, so
+    that it is canonicalized on the first solve only (DPP) and later solves just update the parameters and re-solve,
+    warm-started from the previous solution.
+
+    Kinds:
+    - min_volatility: minimize the variance.
+    - max_sharpe: maximize the Sharpe ratio, with pypfopt's change of variables y = kappa * w and (mu - rf)' y = 1.
+    - max_return: maximize the expected return.
+    - frontier_return: minimize the variance for an expected return of at least target.
+    - frontier_risk: maximize the expected return for a variance of at most target.
+
+    The variance is ||G w||^2 with a dense risk factor G (assets x assets), or ||B' w||^2 + ||s * w||^2 with the
+    loadings B' (factors x assets) and specific volatilities s of a factor model, whose parameters grow with
+    factors x assets only.
+
+    Solves are serialized by a lock, as the parameters are shared state.
+    """
+    KINDS = ("min_volatility", "max_sharpe", "max_return", "frontier_return", "frontier_risk")
+
+    def __init__(self, kind: str, n_assets: int, n_factors: int = None, solver: str = None,
+                 parameterized: bool = True):
+        """
+        :param kind: One of PortfolioProblem.KINDS.
+        :param n_assets: Number of assets.
+        :param n_factors: Number of factors of a factor risk model, None for a dense risk factor.
+        :param solver: cvxpy solver, chosen by cvxpy if None.
+        :param parameterized: Build the problem once with parameters. If False, the problem is built from the
+                              inputs on every solve, which canonicalizes faster for a single use of a large problem.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.n_assets = n_assets
+        self.n_factors = n_factors
+        self.solver = solver
+        self.parameterized = parameterized
+        self.solves = 0
+        self._lock = threading.Lock()
+
+        self._parameters = None
+        self._problem = None
+        if parameterized:
+            self._parameters = self._make_parameters()
+            self._problem = self._build(**self._parameters)
+
+    def _make_parameters(self) -> dict:
+        n = self.n_assets
+        parameters = {"lower": cp.Parameter(n), "upper": cp.Parameter(n)}
+        if self.kind != "min_volatility":
+            parameters["mu"] = cp.Parameter(n)
+        if self.kind.startswith("frontier"):
+            parameters["target"] = cp.Parameter()
+        parameters.update(self._risk_parameters())
+        return parameters
+
+    def _risk_parameters(self) -> dict:
+        n = self.n_assets
+        if self.n_factors is None:
+            return {"G": cp.Parameter((n, n))}
+        return {"loadings": cp.Parameter((self.n_factors, n)), "specific": cp.Parameter(n, nonneg=True)}
+
+    def _build(self, lower, upper, mu=None, G=None, loadings=None, specific=None, target=None) -> cp.Problem:
+        """
+        Build the problem from parameters, or from constant inputs.
+        """
+        w = cp.Variable(self.n_assets)
+        if G is not None:
+            variance = cp.sum_squares(G @ w)
+        else:
+            variance = cp.sum_squares(loadings @ w) + cp.sum_squares(cp.multiply(specific, w))
+
+        self._w = w
+        self._kappa = None
+        if self.kind == "max_sharpe":
+            # mu holds the excess returns mu - rf, w is y and kappa scales the bounds
+            self._kappa = cp.Variable()
+            return cp.Problem(cp.Minimize(variance), [mu @ w == 1, cp.sum(w) == self._kappa,
+                                                      w >= cp.multiply(lower, self._kappa),
+                                                      w <= cp.multiply(upper, self._kappa)])
+
+        constraints = [cp.sum(w) == 1, w >= lower, w <= upper]
+        if self.kind == "min_volatility":
+            return cp.Problem(cp.Minimize(variance), constraints)
+        if self.kind == "max_return":
+            return cp.Problem(cp.Maximize(mu @ w), constraints)
+        if self.kind == "frontier_return":
+            return cp.Problem(cp.Minimize(variance), constraints + [mu @ w >= target])
+        return cp.Problem(cp.Maximize(mu @ w), constraints + [variance <= target])
+
+    def solve(self, lower: np.ndarray, upper: np.ndarray, mu: np.ndarray = None, G: np.ndarray = None,
+              loadings: np.ndarray = None, specific: np.ndarray = None,
+              target: float = None) -> Tuple[Optional[np.ndarray], dict]:
+        """
+        :param lower: Minimum weight of every asset.
+        :param upper: Maximum weight of every asset.
+        :param mu: Expected returns, excess returns over the risk-free rate for max_sharpe.
+        :param G: Dense risk factor, such that the covariance is G' G.
+        :param loadings: Factor loadings B' (factors x assets) of a factor risk model.
+        :param specific: Specific volatilities of a factor risk model.
+        :param target: Target return (frontier_return) or variance (frontier_risk).
+        :return: The optimal weights, None if the solver did not find them, and the compile and solve times of
+                 the call.
+        """
+        return self._solve({"lower": lower, "upper": upper, "mu": mu, "G": G, "loadings": loadings,
+                            "specific": specific, "target": target})
+
+    def _solve(self, inputs: dict) -> Tuple[Optional[np.ndarray], dict]:
+        lower, upper = inputs["lower"], inputs["upper"]
+        with self._lock:
+            started = time.perf_counter()
+            if self.parameterized:
+                for name, parameter in self._parameters.items():
+                    parameter.value = inputs[name]
+            else:
+                self._problem = self._build(**inputs)
+            try:
+                self._problem.solve(solver=self.solver, warm_start=True)
+            except cp.error.SolverError as e:
+                logging.warning(f"{self.kind} problem of {self.n_assets} assets could not be solved: {e}")
+            elapsed = time.perf_counter() - started
+            # The first solve canonicalizes the problem, the next ones only substitute the parameters
+            compile_time = min(self._problem.compilation_time or 0.0, elapsed)
+            timing = {"problem": self.kind, "assets": self.n_assets,
+                      "cached": self.parameterized and self.solves > 0,
+                      "compile_seconds": compile_time, "solve_seconds": elapsed - compile_time}
+            self.solves += 1
+
+            if self._problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self._w.value is None:
+                return None, timing
+            weights = self._w.value / self._kappa.value if self._kappa is not None else self._w.value
+            return np.clip(weights, lower, upper), timing
+
+
+class RebalanceProblem(PortfolioProblem):
+    """
+    Rebalancing of many accounts from their current weights, as one problem whose variables are the target weights
+    of every account (assets x accounts): their objectives and constraints are separable, so one solve rebalances
+    all of them, and the problem is canonicalized once per number of assets and accounts.
+
+    Kinds:
+    - rebalance_min_volatility: minimize the variance plus the transaction costs, as pypfopt's transaction_cost
+      objective does.
+    - rebalance_max_sharpe: maximize the Sharpe ratio net of the transaction costs: minimize the variance of
+      y = kappa * w subject to (mu - rf)' y - costs' |y - kappa * current| >= 1.
+
+    The turnover sum |w - current| of every account is at most its limit, and the costs are per asset and account,
+    so that fixed costs can be approximated by reweighted proportional ones. Trades are measured with auxiliary
+    variables, for the costs to multiply variables only (DPP).
+    """
+    KINDS = ("rebalance_min_volatility", "rebalance_max_sharpe")
+
+    def __init__(self, kind: str, n_assets: int, accounts: int, n_factors: int = None, solver: str = None,
+                 parameterized: bool = True):
+        """
+        :param accounts: Number of accounts rebalanced by a solve.
+        """
+        self.accounts = accounts
+        super().__init__(kind, n_assets, n_factors=n_factors, solver=solver, parameterized=parameterized)
+
+    def _make_parameters(self) -> dict:
+        shape = (self.n_assets, self.accounts)
+        parameters = {"lower": cp.Parameter(shape), "upper": cp.Parameter(shape), "current": cp.Parameter(shape),
+                      "costs": cp.Parameter(shape, nonneg=True), "turnover": cp.Parameter(self.accounts, nonneg=True)}
+        if self.kind == "rebalance_max_sharpe":
+            parameters["mu"] = cp.Parameter(self.n_assets)
+        parameters.update(self._risk_parameters())
+        return parameters
+
+    def _build(self, lower, upper, current, costs, turnover, mu=None, G=None, loadings=None,
+               specific=None) -> cp.Problem:
+        shape = (self.n_assets, self.accounts)
+        w = cp.Variable(shape)
+        trades = cp.Variable(shape, nonneg=True)
+        if G is not None:
+            variance = cp.sum_squares(G @ w)
+        else:
+            specific = cp.reshape(specific, (self.n_assets, 1))
+            variance = cp.sum_squares(loadings @ w) + cp.sum_squares(cp.multiply(specific, w))
+
+        self._w = w
+        self._kappa = None
+        if self.kind == "rebalance_max_sharpe":
+            self._kappa = cp.Variable(self.accounts)
+            # kappa of every account, repeated on every asset
+            scale = np.ones((self.n_assets, 1)) @ cp.reshape(self._kappa, (1, self.accounts))
+            change = w - cp.multiply(current, scale)
+            return cp.Problem(cp.Minimize(variance), [
+                mu @ w - cp.sum(cp.multiply(costs, trades), axis=0) >= 1, cp.sum(w, axis=0) == self._kappa,
+                w >= cp.multiply(lower, scale), w <= cp.multiply(upper, scale), trades >= change, trades >= -change,
+                cp.sum(trades, axis=0) <= cp.multiply(turnover, self._kappa)])
+
+        change = w - current
+        return cp.Problem(cp.Minimize(variance + cp.sum(cp.multiply(costs, trades))), [
+            cp.sum(w, axis=0) == 1, w >= lower, w <= upper, trades >= change, trades >= -change,
+            cp.sum(trades, axis=0) <= turnover])
+
+    def solve(self, lower: np.ndarray, upper: np.ndarray, current: np.ndarray = None, costs: np.ndarray = None,
+              turnover: np.ndarray = None, mu: np.ndarray = None, G: np.ndarray = None, loadings: np.ndarray = None,
+              specific: np.ndarray = None) -> Tuple[Optional[np.ndarray], dict]:
+        """
+        :param lower: Minimum weight of every asset and account (assets x accounts).
+        :param upper: Maximum weight of every asset and account.
+        :param current: Current weights of every account.
+        :param costs: Cost of trading every asset of every account, as a fraction of the value traded.
+        :param turnover: Maximum turnover sum |w - current| of every account.
+        :param mu: Excess returns over the risk-free rate, for rebalance_max_sharpe.
+        :return: The target weights (assets x accounts), None if the solver did not find them, and the compile
+                 and solve times of the call.
+        """
+        return self._solve({"lower": lower, "upper": upper, "current": current, "costs": costs,
+                            "turnover": turnover, "mu": mu, "G": G, "loadings": loadings, "specific": specific})
+
+
+class ProblemCache:
+    """
+    Process-wide cache of PortfolioProblem, keyed on (kind, assets, factors, solver), so that requests of the same
+    shape share one canonicalized problem. Least recently used problems are evicted first.
+
+    Dense risk factors add assets^2 parameters, whose canonicalization outweighs a cold solve beyond a hundred
+    assets or so: above max_dense_assets, dense problems are built for a single use and not kept.
+    """
+
+    def __init__(self, max_problems: int = 64, max_dense_assets: int = 100):
+        """
+        :param max_problems: Maximum number of problems kept.
+        :param max_dense_assets: Largest number of assets of a cached problem with a dense risk factor.
+        """
+        self.max_problems = max_problems
+        self.max_dense_assets = max_dense_assets
+        self._problems: 'OrderedDict[tuple, PortfolioProblem]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._compile_seconds = 0.0
+        self._solve_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> 'ProblemCache':
+        """
+        Build a cache from PROBLEM_CACHE_SIZE (64 problems by default) and PROBLEM_CACHE_MAX_DENSE_ASSETS (100).
+        """
+        return cls(max_problems=int(os.environ.get('PROBLEM_CACHE_SIZE', 64)),
+                   max_dense_assets=int(os.environ.get('PROBLEM_CACHE_MAX_DENSE_ASSETS', 100)))
+
+    def get(self, kind: str, n_assets: int, n_factors: int = None, solver: str = None,
+            accounts: int = None) -> PortfolioProblem:
+        """
+        :param accounts: Number of accounts of a rebalancing problem.
+        """
+        key = (kind, n_assets, n_factors, solver, accounts)
+        if n_factors is None and n_assets > self.max_dense_assets:
+            with self._lock:
+                self._misses += 1
+            return self._build(kind, n_assets, n_factors, solver, accounts, parameterized=False)
+        with self._lock:
+            problem = self._problems.get(key)
+            if problem is not None:
+                self._hits += 1
+                self._problems.move_to_end(key)
+                return problem
+            self._misses += 1
+        problem = self._build(kind, n_assets, n_factors, solver, accounts)
+        with self._lock:
+            # Another thread may have built the same problem meanwhile, keep the first one
+            problem = self._problems.setdefault(key, problem)
+            while len(self._problems) > self.max_problems:
+                self._problems.popitem(last=False)
+        return problem
+
+    @staticmethod
+    def _build(kind: str, n_assets: int, n_factors: int, solver: str, accounts: int,
+               parameterized: bool = True) -> PortfolioProblem:
+        if kind in RebalanceProblem.KINDS:
+            return RebalanceProblem(kind, n_assets, accounts, n_factors, solver, parameterized=parameterized)
+        return PortfolioProblem(kind, n_assets, n_factors, solver, parameterized=parameterized)
+
+    def solve(self, kind: str, lower: np.ndarray, upper: np.ndarray, solver: str = None,
+              **inputs) -> Tuple[Optional[np.ndarray], dict]:
+        """
+        Solve a problem of the cache, see PortfolioProblem.solve and RebalanceProblem.solve for the inputs.
+
+        :return: The weights (None if not solved), and the compile and solve times of the call.
+        """
+        n_factors = len(inputs['loadings']) if inputs.get('loadings') is not None else None
+        accounts = lower.shape[1] if np.ndim(lower) == 2 else None
+        problem = self.get(kind, len(lower), n_factors, solver, accounts=accounts)
+        weights, timing = problem.solve(lower, upper, **inputs)
+        with self._lock:
+            self._compile_seconds += timing["compile_seconds"]
+            self._solve_seconds += timing["solve_seconds"]
+        return weights, timing
+
+    def clear(self):
+        with self._lock:
+            self._problems.clear()
+            self._hits = self._misses = 0
+            self._compile_seconds = self._solve_seconds = 0.0
+
+    def stats(self) -> dict:
+        """
+        :return: Number of cached problems, hits and misses, and the total compile and solve times.
+        """
+        with self._lock:
+            return {
+                "problems": len(self._problems),
+                "hits": self._hits,
+                "misses": self._misses,
+                "compile_seconds": round(self._compile_seconds, 4),
+                "solve_seconds": round(self._solve_seconds, 4),
+            }
+
+
+def summarize_timings(timings: List[dict]) -> dict:
+    """
+    :param timings: Timings returned by PortfolioProblem.solve.
+    :return: Number of solves, how many of them reused a compiled problem, and the total compile and solve times.
+    """
+    return {
+        "solves": len(timings),
+        "cached": sum(1 for timing in timings if timing["cached"]),
+        "compile_seconds": round(sum(timing["compile_seconds"] for timing in timings), 4),
+        "solve_seconds": round(sum(timing["solve_seconds"] for timing in timings), 4),
+    }
+
+
+problem_cache = ProblemCache.from_env()
@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ResultCache:
+    """
+    Content-addressed cache of computed results, keyed by a canonical hash of the request.
+
+    Entries are kept as JSON in an in-process LRU bounded in bytes, and optionally in a directory shared by several
+    processes or servers. An entry is stale once a newer daily bar than its last price date may be available in its
+    date window, so results over past windows are served forever while results up to today are refreshed every day.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: str = None):
+        """
+        :param max_bytes: Maximum size of the serialized entries kept in memory.
+        :param directory: Optional directory of the on-disk tier.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        """
+        Build a cache of RESULT_CACHE_MAX_BYTES bytes (64 MB by default), with an on-disk tier in RESULT_CACHE_DIR if set.
+        """
+        return cls(max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                   directory=os.environ.get('RESULT_CACHE_DIR') or None)
+
+    @staticmethod
+    def key(request: dict) -> str:
+        """
+        Canonical hash of a request: tickers are sorted and deduplicated, dates normalized, lists of views sorted
+        and dict keys ordered, so that equivalent requests share the same key.
+
+        :param request: The request fields, e.g. TickerRequest.model_dump().
+        """
+        normalized = dict(request)
+        if normalized.get('tickers') is not None:
+            normalized['tickers'] = sorted(set(ticker.strip() for ticker in normalized['tickers']))
+        for field in ('start_date', 'end_date'):
+            if normalized.get(field):
+                normalized[field] = pd.Timestamp(normalized[field]).date().isoformat()
+        if normalized.get('views'):
+            normalized['views'] = sorted(normalized['views'], key=lambda view: json.dumps(view, sort_keys=True))
+        canonical = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=_to_builtin)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _today(self) -> datetime.date:
+        return datetime.date.today()
+
+    def _is_fresh(self, entry: dict) -> bool:
+        # The last bar the window can hold: yfinance's end date is exclusive, and today's bar is not final yet
+        last_possible = min(datetime.date.fromisoformat(entry['end_date']), self._today()) - datetime.timedelta(days=1)
+        # Last weekday on or before it
+        last_bar = last_possible - datetime.timedelta(days=max(0, last_possible.weekday() - 4))
+        last_price_date = datetime.date.fromisoformat(entry['last_price_date'])
+        created = datetime.date.fromisoformat(entry['created'])
+        # Fresh if it has that bar, or if it was computed after that bar was due (a market holiday)
+        return last_price_date >= last_bar or created > last_bar
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        :return: The cached result, or None if it is missing or stale.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        from_disk = False
+        if data is None:
+            data = self._read(key)
+            from_disk = data is not None
+
+        if data is None:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        entry = json.loads(data)
+        if not self._is_fresh(entry):
+            with self._lock:
+                self._stale += 1
+                self._misses += 1
+                if key in self._entries:
+                    self._bytes -= len(self._entries.pop(key))
+            return None
+
+        with self._lock:
+            self._hits += 1
+            if from_disk:
+                self._disk_hits += 1
+        if from_disk:
+            self._store(key, data)
+        return entry['result']
+
+    def put(self, key: str, result: Any, last_price_date, end_date):
+        """
+        :param result: JSON serializable result.
+        :param last_price_date: Date of the last price the result was computed from.
+        :param end_date: End of the date window of the request.
+        """
+        entry = {
+            'result': result,
+            'last_price_date': pd.Timestamp(last_price_date).date().isoformat(),
+            'end_date': pd.Timestamp(end_date).date().isoformat(),
+            'created': self._today().isoformat(),
+        }
+        data = json.dumps(entry, default=_to_builtin).encode()
+        self._store(key, data)
+        self._write(key, data)
+
+    def _store(self, key: str, data: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Could not read cached result {key}: {e}")
+            return None
+
+    def _write(self, key: str, data: bytes):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write cached result {key}: {e}")
+
+    def clear(self):
+        """
+        Empty the in-memory tier and reset the counters. The on-disk tier is kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = self._disk_hits = self._misses = self._stale = self._evictions = 0
+
+    def stats(self) -> dict:
+        """
+        :return: Hit and miss counters (stale entries count as misses), and the size of the in-memory tier.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _to_builtin(value):
+    # numpy scalars and arrays, dates and timestamps found in results
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
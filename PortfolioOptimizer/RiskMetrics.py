@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Iterable, List
+
+_STANDARD_NORMAL = NormalDist()
+
+
+def _normal_quantile(alpha: np.ndarray):
+    """
+    :return: Quantiles z and densities at z of the standard normal distribution. A handful of confidence levels is
+             faster in plain Python than through scipy.stats.
+    """
+    z = np.array([_STANDARD_NORMAL.inv_cdf(a) for a in alpha])
+    return z, np.exp(-z ** 2 / 2) / np.sqrt(2 * np.pi)
+
+
+class RiskMetrics:
+    """
+    Downside risk of a portfolio from its daily returns: Sortino ratio, and Value at Risk / Conditional Value at Risk
+    at several confidence levels, all computed in closed form or from the sorted returns (no random draws).
+
+    VaR and CVaR are daily returns, negative for losses: the VaR at 95% is the return not exceeded on the worst 5% of
+    days, and the CVaR the mean return on those days.
+    - parametric: normal returns of the given mean and volatility.
+    - historical: the actual returns of the portfolio.
+    - cornish_fisher: the normal quantile corrected for the skewness and excess kurtosis of the actual returns.
+    """
+    METHODS = ("parametric", "historical", "cornish_fisher")
+
+    def __init__(self, portfolio_returns: pd.Series, expected_return: float, volatility: float, frequency: int = 252):
+        """
+        :param portfolio_returns: Daily returns of the portfolio.
+        :param expected_return: Annualized expected return of the portfolio.
+        :param volatility: Annualized volatility of the portfolio.
+        :param frequency: Number of returns per year.
+        """
+        self.returns = np.sort(np.asarray(portfolio_returns, dtype=float))
+        self.returns = self.returns[~np.isnan(self.returns)]
+        self.frequency = frequency
+        self.mu = expected_return / frequency
+        self.sigma = volatility / np.sqrt(frequency)
+
+    def sortino_ratio(self, expected_return: float, risk_free_rate: float = 0.02, target_return: float = 0.0) -> float:
+        """
+        Sortino = (R - Rf) / annualized standard deviation of the daily returns below target_return
+        """
+        downside_returns = self.returns[self.returns < target_return]
+        if len(downside_returns) < 2:
+            return 0.0
+        downside_std = downside_returns.std(ddof=1) * np.sqrt(self.frequency)
+        return float((expected_return - risk_free_rate) / downside_std) if downside_std > 0 else 0.0
+
+    def parametric(self, confidence_levels: Iterable[float] = (0.95,)):
+        """
+        :return: VaR and CVaR arrays, one value per confidence level.
+        """
+        alpha = 1 - np.asarray(confidence_levels, dtype=float)
+        z, density = _normal_quantile(alpha)
+        return self.mu + self.sigma * z, self.mu - self.sigma * density / alpha
+
+    def historical(self, confidence_levels: Iterable[float] = (0.95,)):
+        """
+        :return: VaR (linearly interpolated quantile) and CVaR (mean of the returns up to the VaR) arrays.
+        """
+        alpha = 1 - np.asarray(confidence_levels, dtype=float)
+        if len(self.returns) == 0:
+            return np.full(len(alpha), np.nan), np.full(len(alpha), np.nan)
+        # Returns are sorted: linear interpolation between the order statistics around the quantile (as np.quantile)
+        position = alpha * (len(self.returns) - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, len(self.returns) - 1)
+        var = self.returns[lower] + (position - lower) * (self.returns[upper] - self.returns[lower])
+        # and the tail of every level is a prefix, averaged from the cumulative sums
+        tail = np.maximum(np.searchsorted(self.returns, var, side='right'), 1)
+        return var, np.cumsum(self.returns)[tail - 1] / tail
+
+    def cornish_fisher(self, confidence_levels: Iterable[float] = (0.95,)):
+        """
+        Modified VaR: the normal quantile z becomes
+        z + (z^2 - 1) S / 6 + (z^3 - 3z) K / 24 - (2z^3 - 5z) S^2 / 36
+        with S the skewness and K the excess kurtosis of the returns. The CVaR is the mean of that quantile over the
+        tail, which integrates in closed form against the normal density.
+
+        :return: VaR and CVaR arrays, one value per confidence level.
+        """
+        alpha = 1 - np.asarray(confidence_levels, dtype=float)
+        skewness, kurtosis = self._higher_moments()
+        z, density = _normal_quantile(alpha)
+        z_cf = (z + (z ** 2 - 1) * skewness / 6 + (z ** 3 - 3 * z) * kurtosis / 24
+                - (2 * z ** 3 - 5 * z) * skewness ** 2 / 36)
+        tail_mean = -density / alpha * (1 + z * skewness / 6 + (z ** 2 - 1) * kurtosis / 24
+                                            - (2 * z ** 2 - 1) * skewness ** 2 / 36)
+        return self.mu + self.sigma * z_cf, self.mu + self.sigma * tail_mean
+
+    def _higher_moments(self):
+        """
+        :return: Skewness and excess kurtosis of the returns, 0 if there are too few of them.
+        """
+        if len(self.returns) < 4:
+            return 0.0, 0.0
+        deviations = self.returns - self.returns.mean()
+        squared = deviations * deviations
+        variance = squared.mean()
+        if variance == 0:
+            return 0.0, 0.0
+        return (float((squared * deviations).mean() / variance ** 1.5),
+                float((squared * squared).mean() / variance ** 2 - 3))
+
+    def value_at_risk(self, confidence_levels: Iterable[float] = (0.95,)) -> List[dict]:
+        """
+        :return: One row {"confidence", "method", "var", "cvar"} per confidence level and method.
+        """
+        confidence_levels = [float(level) for level in confidence_levels]
+        rows = []
+        for method in self.METHODS:
+            var, cvar = getattr(self, method)(confidence_levels)
+            rows.extend({"confidence": level, "method": method, "var": float(v), "cvar": float(c)}
+                        for level, v, c in zip(confidence_levels, var, cvar))
+        return rows
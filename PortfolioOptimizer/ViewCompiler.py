@@ -0,0 +1,153 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+
+class ViewCompiler:
+    """
+    Compiles investor views into the Black-Litterman picking matrix P (sparse, views x assets), the view returns Q
+    and the confidence of every view. Tickers are looked up in a hash index, all at once, so compiling costs
+    O(views + assets) whatever the size of the universe.
+
+    Views:
+    - {'type': 'absolute', 'asset': 'A', 'return': 0.05}: A returns 5%.
+      In bulk: {'type': 'absolute', 'assets': ['A', 'B'], 'returns': [0.05, 0.04]}, one view per asset.
+    - {'type': 'relative', 'asset1': 'A', 'asset2': 'B', 'difference': 0.02}: A outperforms B by 2%.
+    - {'type': 'portfolio', 'weights': {'A': 0.5, 'B': 0.5, 'C': -1}, 'return': 0.01}: the weighted sum of the
+      returns is 1%.
+    Any view may carry a 'confidence' between 0 and 1 (Idzorek), 'confidences' for bulk absolute views. The
+    confidence of views without one is NaN.
+    """
+    TYPES = ("absolute", "relative", "portfolio")
+
+    def __init__(self, tickers: List[str]):
+        self.tickers = list(tickers)
+        self._index = pd.Index(self.tickers)
+        if not self._index.is_unique:
+            raise ValueError("Tickers must be unique")
+
+    def compile(self, views: List[dict]) -> Tuple[scipy.sparse.csr_matrix, np.ndarray, np.ndarray]:
+        """
+        :return: P (sparse, views x assets), Q and the confidences (NaN where not given), one row per view.
+        """
+        rows, assets, values = [], [], []
+        Q, confidences = [], []
+        for view in views or []:
+            kind = view.get('type')
+            row = len(Q)
+            if kind == 'absolute' and 'assets' in view:
+                count = len(view['assets'])
+                if len(view['returns']) != count:
+                    raise ValueError("A bulk absolute view needs one return per asset")
+                if 'confidences' in view and len(view['confidences']) != count:
+                    raise ValueError("A bulk absolute view needs one confidence per asset")
+                rows.extend(range(row, row + count))
+                assets.extend(view['assets'])
+                values.extend([1.0] * count)
+                Q.extend(view['returns'])
+                confidences.extend(view.get('confidences', [view.get('confidence', np.nan)] * count))
+                continue
+            if kind == 'absolute':
+                rows.append(row)
+                assets.append(view['asset'])
+                values.append(1.0)
+                Q.append(view['return'])
+            elif kind == 'relative':
+                rows.extend((row, row))
+                assets.extend((view['asset1'], view['asset2']))
+                values.extend((1.0, -1.0))
+                Q.append(view['difference'])
+            elif kind == 'portfolio':
+                rows.extend([row] * len(view['weights']))
+                assets.extend(view['weights'])
+                values.extend(view['weights'].values())
+                Q.append(view['return'])
+            else:
+                raise ValueError(f"View type must be one of {', '.join(self.TYPES)}")
+            confidences.append(view.get('confidence', np.nan))
+
+        columns = self._index.get_indexer(assets)
+        if np.any(columns < 0):
+            unknown = sorted(set(np.asarray(assets, dtype=object)[columns < 0]))
+            raise ValueError(f"Views on unknown assets: {', '.join(map(str, unknown))}")
+        confidences = np.asarray(confidences, dtype=float)
+        if np.any((confidences < 0) | (confidences > 1)):
+            raise ValueError("View confidences must be between 0 and 1")
+
+        # Duplicate entries of a row (the same asset twice in a view) are summed
+        P = scipy.sparse.csr_matrix((np.asarray(values, dtype=float), (np.asarray(rows, dtype=int), columns)),
+                                    shape=(len(Q), len(self.tickers)))
+        return P, np.asarray(Q, dtype=float), confidences
+
+    def restrict(self, views: List[dict]) -> List[dict]:
+        """
+        :return: The views on the tickers of the compiler only, e.g. the ones already listed on a backtest date:
+                 bulk absolute views keep their assets among them, other views are dropped if any of their assets
+                 is not.
+        """
+        restricted = []
+        for view in views or []:
+            if view.get('type') == 'absolute' and 'assets' in view \
+                    and len(view.get('returns', [])) == len(view['assets']):
+                keep = np.flatnonzero(self._index.get_indexer(view['assets']) >= 0)
+                if len(keep) == len(view['assets']):
+                    restricted.append(view)
+                elif len(keep):
+                    view = dict(view, assets=[view['assets'][i] for i in keep],
+                                returns=[view['returns'][i] for i in keep])
+                    if 'confidences' in view:
+                        view['confidences'] = [view['confidences'][i] for i in keep]
+                    restricted.append(view)
+            elif np.all(self._index.get_indexer(_view_assets(view)) >= 0):
+                restricted.append(view)
+        return restricted
+
+
+def _view_assets(view: dict) -> list:
+    """
+    :return: The assets a view is on, as ViewCompiler.compile reads them.
+    """
+    kind = view.get('type')
+    if kind == 'absolute':
+        return list(view['assets']) if 'assets' in view else [view.get('asset')]
+    if kind == 'relative':
+        return [view.get('asset1'), view.get('asset2')]
+    if kind == 'portfolio':
+        return list(view.get('weights', {}))
+    return []
+
+
+def view_variances(P: scipy.sparse.csr_matrix, Sigma: np.ndarray) -> np.ndarray:
+    """
+    :return: Prior variance p_k' Sigma p_k of every view portfolio, the diagonal of P Sigma P' without computing
+             the other entries.
+    """
+    return np.asarray(P.multiply(P @ Sigma).sum(axis=1), dtype=float).ravel()
+
+
+def omega_proportional_to_prior(P: scipy.sparse.csr_matrix, Sigma: np.ndarray, tau: float = 0.05) -> np.ndarray:
+    """
+    :return: Variances of the views (the diagonal of Omega), tau times the variance of every view portfolio with
+             the asset variances alone, i.e. diag(P diag(Sigma) P') * tau.
+    """
+    return tau * np.asarray(P.multiply(P) @ np.diag(Sigma), dtype=float).ravel()
+
+
+def idzorek_omega(P: scipy.sparse.csr_matrix, Sigma: np.ndarray, confidences: np.ndarray,
+                  tau: float = 0.05, variances: np.ndarray = None) -> np.ndarray:
+    """
+    Idzorek's method in closed form (the same as pypfopt's idzorek_method): a view held with confidence c has the
+    variance tau * (1 - c) / c * p' Sigma p, so that its weight tilt is the fraction c of the tilt of a certain view.
+
+    :param confidences: Confidences of the views, or of several scenarios of them (scenarios x views).
+    :param variances: Precomputed view_variances(P, Sigma).
+    :return: Variances of the views, infinite for a zero confidence (the view is ignored), 0 for full confidence.
+    """
+    confidences = np.asarray(confidences, dtype=float)
+    with np.errstate(divide='ignore'):
+        alpha = np.where(confidences > 0, (1 - confidences) / confidences, np.inf)
+    if variances is None:
+        variances = view_variances(P, Sigma)
+    return np.where(np.isinf(alpha), np.inf, tau * alpha * variances)
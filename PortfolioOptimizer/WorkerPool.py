@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class WorkerPool:
+    """
+    Runs blocking work off the event loop, on a thread pool (I/O bound work such as downloads) or on a
+    process pool (CPU bound work such as optimizations), and keeps track of its load.
+    """
+
+    def __init__(self, name: str, max_workers: int, processes: bool = False):
+        """
+        :param name: Name reported in the statistics.
+        :param max_workers: Maximum number of tasks running at the same time.
+        :param processes: Use a process pool instead of a thread pool. Functions and arguments must be picklable.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.processes = processes
+        self._executor: Executor = None
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        # Created on first use, so importing the application does not spawn any process
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    # Spawned rather than forked: the parent process runs threads (downloads, name resolution)
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=f'{self.name}-pool')
+            return self._executor
+
+    @property
+    def tracked_executor(self) -> Executor:
+        """
+        Executor submitting to this pool and counting the tasks in its statistics, for code that splits its own
+        work across the workers (e.g. MonteCarloSimulator.simulate or Backtester.run).
+        """
+        return _TrackedExecutor(self)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and wait for its result without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._submitted += 1
+        try:
+            result = await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._completed += 1
+        return result
+
+    def _submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            self._submitted += 1
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(failed=True)
+            raise
+        future.add_done_callback(lambda done: self._done(failed=done.cancelled() or done.exception() is not None))
+        return future
+
+    def _done(self, failed: bool):
+        with self._lock:
+            self._completed += 1
+            if failed:
+                self._failed += 1
+
+    def stats(self) -> dict:
+        """
+        :return: The pool size, the number of tasks waiting for a worker (queued), running (in_flight),
+                 and the number of completed and failed tasks.
+        """
+        with self._lock:
+            pending = self._submitted - self._completed
+            in_flight = min(pending, self.max_workers)
+            return {
+                "kind": "process" if self.processes else "thread",
+                "max_workers": self.max_workers,
+                "queued": pending - in_flight,
+                "in_flight": in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class _TrackedExecutor(Executor):
+    """
+    Executor view of a WorkerPool: tasks run on the pool's executor and are counted in its statistics.
+    """
+
+    def __init__(self, pool: WorkerPool):
+        self._pool = pool
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self._pool._submit(fn, *args, **kwargs)
+
+
+class RequestLimiter:
+    """
+    Caps the number of requests processed concurrently. Requests above the limit wait for a slot.
+
+    Usage: `async with limiter: ...`
+    """
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self._semaphore = None
+        self._waiting = 0
+        self._active = 0
+
+    async def __aenter__(self):
+        # Created lazily so that it is bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        :return: The concurrency limit, and the number of requests waiting (queued) and being processed (in_flight).
+        """
+        return {"max_concurrent": self.max_concurrent, "queued": self._waiting, "in_flight": self._active}
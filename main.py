@@ -1,20 +1,31 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
-import pandas as pd
+from typing import List, Optional, Dict, Union
 import numpy as np
+import pandas as pd
+import asyncio
 import json
 import logging
+import os
 
-from PortfolioOptimizer.HRPCalculator import HRPCalculator
+from PortfolioOptimizer.Backtester import Backtester
+from PortfolioOptimizer.HRPCalculator import HRPCalculator, InfeasibleConstraintsError
 from PortfolioOptimizer.BlackLitterman import BlackLitterman
 from PortfolioOptimizer.MonteCarloSimulator import MonteCarloSimulator
-from PortfolioOptimizer.ExpectedReturnCalculator import MeanHistoricalReturnCalculator
-from PortfolioOptimizer.CovarianceCalculator import SampleCovarianceCalculator
+from PortfolioOptimizer.ExpectedReturnCalculator import get_market_inputs
+from PortfolioOptimizer.MarketState import MarketState, get_market_state
+from PortfolioOptimizer.CovarianceCalculator import COVARIANCE_CALCULATORS, get_covariance_calculator
+from PortfolioOptimizer.DataAlignment import AlignedPrices, DataAlignment, get_aligned_prices
+from PortfolioOptimizer.DiscreteAllocation import DiscreteAllocator, latest_prices
 from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
-from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator
+from PortfolioOptimizer.PricePanel import PricePanel
+from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator, TRADE_TOLERANCE, trade_list
+from PortfolioOptimizer.ProblemCache import problem_cache, summarize_timings
+from PortfolioOptimizer.ResultCache import ResultCache
+from PortfolioOptimizer.RiskMetrics import RiskMetrics
+from PortfolioOptimizer.WorkerPool import RequestLimiter, WorkerPool
 
 
 # Configure logging
@@ -23,9 +34,42 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Downloads run on a thread pool, optimizations on a process pool (CPU_POOL=thread keeps them in-process)
+io_pool = WorkerPool("io", max_workers=int(os.environ.get("IO_WORKERS", 16)))
+cpu_pool = WorkerPool("cpu", max_workers=int(os.environ.get("CPU_WORKERS", os.cpu_count() or 1)),
+                      processes=os.environ.get("CPU_POOL", "process") == "process")
+request_limiter = RequestLimiter(int(os.environ.get("MAX_CONCURRENT_REQUESTS", 32)))
+# Results of /api/analyze, keyed on the normalized request
+result_cache = ResultCache.from_env()
+# Simulations with at least this many paths are split across the CPU workers
+PARALLEL_SIMULATION_PATHS = int(os.environ.get("PARALLEL_SIMULATION_PATHS", 100000))
+# Maximum number of jobs of a /api/analyze/batch request
+MAX_BATCH_JOBS = int(os.environ.get("MAX_BATCH_JOBS", 1000))
+# Maximum number of scenarios of a /api/black_litterman/sensitivity request
+MAX_SENSITIVITY_SCENARIOS = int(os.environ.get("MAX_SENSITIVITY_SCENARIOS", 1000))
+# Maximum number of accounts of a /api/allocate request
+MAX_ALLOCATION_ACCOUNTS = int(os.environ.get("MAX_ALLOCATION_ACCOUNTS", 10000))
+# Maximum number of accounts of a /api/rebalance request
+MAX_REBALANCE_ACCOUNTS = int(os.environ.get("MAX_REBALANCE_ACCOUNTS", 1000))
+
 # Serve static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+
+@app.on_event("startup")
+async def warm_up_asset_names():
+    # Comma separated list of the tickers we usually analyze, e.g. ASSET_UNIVERSE=AAPL,MSFT,GLD
+    universe = [ticker.strip() for ticker in os.environ.get("ASSET_UNIVERSE", "").split(",") if ticker.strip()]
+    if universe:
+        MarketDataProvider.warm_up_asset_names(universe)
+
+
+@app.on_event("shutdown")
+async def shutdown_worker_pools():
+    io_pool.shutdown()
+    cpu_pool.shutdown()
+
+
 class TickerRequest(BaseModel):
     tickers: List[str]
     start_date: str
@@ -35,6 +79,23 @@ class TickerRequest(BaseModel):
     strategy: str = "max_sharpe" # Options: max_sharpe, hrp, black_litterman, min_volatility
     views: Optional[List[dict]] = None # List of views for Black-Litterman
     constraints: Optional[Dict[str, float]] = None # Max weight constraints (e.g., {"GLD": 0.15})
+    min_weights: Optional[Dict[str, float]] = None # Min weight constraints (HRP only)
+    linkage_method: str = "single" # HRP clustering: single, ward, average or complete
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
+    confidence_levels: List[float] = [0.95] # Confidence levels of the VaR and CVaR
+    calendar: Optional[str] = None # Trading days of mixed-exchange prices: union or intersection, as downloaded if None
+    ffill_limit: Optional[int] = 5 # Days a missing price is carried forward on the union calendar, no limit if None
+    base_currency: Optional[str] = None # Convert the prices to this currency (e.g. USD), as quoted if None
+    currencies: Optional[Dict[str, str]] = None # Quote currency of some tickers, guessed from their exchange otherwise
+    allocation_method: str = "greedy" # Whole-share allocation: greedy, or milp for the integer optimum
+    current_weights: Optional[Dict[str, float]] = None # Current book to rebalance, the rest being cash
+    proportional_cost: Union[float, Dict[str, float]] = 0.0 # Cost of a trade as a fraction of its value, or per ticker
+    fixed_cost: float = 0.0 # Cost of every trade
+    max_turnover: Optional[float] = None # Maximum sum of |weight changes| (max_sharpe and min_volatility)
+    max_trade: Optional[float] = None # Maximum |weight change| of every asset (max_sharpe and min_volatility)
+
+class BatchRequest(BaseModel):
+    jobs: List[TickerRequest]
 
 class SimulationRequest(BaseModel):
     tickers: List[str]
@@ -44,138 +105,834 @@ class SimulationRequest(BaseModel):
     initial_portfolio_value: float = 10000.0
     num_simulations: int = 1000
     time_horizon: int = 252
+    seed: Optional[int] = None # Seed of the simulation, for reproducible results
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
 
+class BacktestRequest(BaseModel):
+    tickers: List[str]
+    start_date: str
+    end_date: str
+    strategy: str = "max_sharpe" # Options: max_sharpe, min_volatility, hrp, black_litterman
+    lookback: int = 252 # Number of daily returns the weights are estimated on
+    rebalance: str = "monthly" # Options: weekly, monthly, quarterly, yearly
+    risk_free_rate: float = 0.02
+    initial_portfolio_value: float = 10000.0
+    views: Optional[List[dict]] = None # Views for Black-Litterman
+    benchmark: str = "^GSPC" # Market benchmark of the Black-Litterman prior
+    constraints: Optional[Dict[str, float]] = None # Max weight constraints
+    linkage_method: str = "single" # HRP clustering: single, ward, average or complete
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
 
-@app.post("/api/analyze")
-async def analyze_portfolio(request: TickerRequest):
+class SensitivityRequest(BaseModel):
+    tickers: List[str]
+    start_date: str
+    end_date: str
+    views: List[dict] # Views for Black-Litterman
+    omega_taus: List[float] = [0.05] # Scales of the variance of the views without a confidence
+    deltas: Optional[List[float]] = None # Market risk aversions, the market's own if None
+    confidences: Optional[List[Union[float, List[Optional[float]]]]] = None # Per scenario: one per view, or one for all
+    risk_free_rate: float = 0.02
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
+
+class AllocationRequest(BaseModel):
+    weights: List[Dict[str, float]] # Target weights of every account, or a single set for all of them
+    budgets: List[float] # Cash of every account
+    prices: Optional[Dict[str, float]] = None # Latest prices, downloaded if None
+    method: str = "greedy" # Options: greedy, milp
+
+class RebalanceAccount(BaseModel):
+    current_weights: Dict[str, float] # Current book, the rest being cash
+    portfolio_value: Optional[float] = None # Value of the account, investment_amount if None
+
+class RebalanceRequest(BaseModel):
+    tickers: List[str]
+    start_date: str
+    end_date: str
+    accounts: List[RebalanceAccount]
+    strategy: str = "max_sharpe" # Options: max_sharpe, min_volatility
+    risk_free_rate: float = 0.02
+    investment_amount: float = 10000.0
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
+    proportional_cost: Union[float, Dict[str, float]] = 0.0 # Cost of a trade as a fraction of its value, or per ticker
+    fixed_cost: float = 0.0 # Cost of every trade
+    max_turnover: Optional[float] = None # Maximum sum of |weight changes| of an account
+    max_trade: Optional[float] = None # Maximum |weight change| of every asset
+    calendar: Optional[str] = None # Trading days of mixed-exchange prices: union or intersection, as downloaded if None
+    ffill_limit: Optional[int] = 5 # Days a missing price is carried forward on the union calendar, no limit if None
+    base_currency: Optional[str] = None # Convert the prices to this currency (e.g. USD), as quoted if None
+    currencies: Optional[Dict[str, str]] = None # Quote currency of some tickers, guessed from their exchange otherwise
+
+class FrontierRequest(BaseModel):
+    tickers: List[str]
+    start_date: str
+    end_date: str
+    risk_free_rate: float = 0.02
+    n_points: int = 100
+    by: str = "return" # Options: return (evenly spaced target returns), risk (evenly spaced target volatilities)
+    covariance_method: str = "sample" # Options: sample, ledoit_wolf, oas, ewma, pca_factor
+
+
+def check_covariance_method(request):
+    if request.covariance_method not in COVARIANCE_CALCULATORS:
+        raise HTTPException(status_code=400,
+                            detail=f"covariance_method must be one of {', '.join(COVARIANCE_CALCULATORS)}")
+
+
+def check_confidence_levels(request):
+    if not all(0 < level < 1 for level in request.confidence_levels):
+        raise HTTPException(status_code=400, detail="confidence_levels must be between 0 and 1 (exclusive).")
+
+
+def check_allocation_method(method: str):
+    if method not in DiscreteAllocator.METHODS:
+        raise HTTPException(status_code=400,
+                            detail=f"The allocation method must be one of {', '.join(DiscreteAllocator.METHODS)}")
+
+
+def check_current_weights(current_weights: Dict[str, float]):
+    if any(weight < 0 for weight in current_weights.values()):
+        raise HTTPException(status_code=400, detail="current_weights must be positive.")
+    if sum(current_weights.values()) > 1 + 1e-6:
+        raise HTTPException(status_code=400, detail="current_weights must not sum to more than 1.")
+
+
+def check_rebalance(request):
+    """
+    Transaction costs are optimized by max_sharpe and min_volatility, and reported for every strategy.
+    """
+    costs = request.proportional_cost.values() if isinstance(request.proportional_cost, dict) \
+        else [request.proportional_cost]
+    if any(cost < 0 for cost in costs) or request.fixed_cost < 0:
+        raise HTTPException(status_code=400, detail="Transaction costs must be positive.")
+    if any(limit is not None and limit < 0 for limit in (request.max_turnover, request.max_trade)):
+        raise HTTPException(status_code=400, detail="max_turnover and max_trade must be positive.")
+    limited = request.max_turnover is not None or request.max_trade is not None
+    if limited and request.strategy not in ("max_sharpe", "min_volatility"):
+        raise HTTPException(status_code=400,
+                            detail="max_turnover and max_trade are only supported by max_sharpe and min_volatility.")
+    if isinstance(request, TickerRequest):
+        if request.current_weights is None:
+            if limited:
+                raise HTTPException(status_code=400, detail="max_turnover and max_trade need current_weights.")
+        else:
+            check_current_weights(request.current_weights)
+
+
+def rebalance_options(request) -> dict:
+    return {"proportional_cost": request.proportional_cost, "fixed_cost": request.fixed_cost,
+            "max_turnover": request.max_turnover, "max_trade": request.max_trade}
+
+
+def get_alignment(request: TickerRequest) -> Optional[DataAlignment]:
+    """
+    :return: The alignment of the prices asked for by the request, None to use them as downloaded.
+    """
+    if request.calendar is None and request.base_currency is None:
+        return None
+    try:
+        return DataAlignment(calendar=request.calendar or "union", ffill_limit=request.ffill_limit,
+                             base_currency=request.base_currency, currencies=request.currencies)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def align_prices(prices_df: pd.DataFrame, alignment: DataAlignment) -> AlignedPrices:
+    """
+    I/O bound part of the alignment (exchange rates may be downloaded), shared by every strategy on the same prices.
+    """
     try:
-        logger.info(f"Analyzing tickers: {request.tickers} with strategy: {request.strategy}")
-        
-        # 1. Download Data
-        market_data_provider = MarketDataProvider()
-        prices_df, valid_tickers = market_data_provider.get_data(
-            tickers=request.tickers,
-            start_date=request.start_date,
-            end_date=request.end_date,
-            return_updated_tickers=True
-        )
-        
-        if prices_df.empty:
-            raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
-
-        cleaned_weights = {}
-        performance = (0.0, 0.0, 0.0)
-
-        if request.strategy == "hrp":
-            hrp = HRPCalculator(prices_df)
-            cleaned_weights = hrp.calculate_weights(constraints=request.constraints)
-            performance = hrp.calculate_performance(risk_free_rate=request.risk_free_rate)
-        
-        elif request.strategy == "black_litterman":
-            # Pass user views to BlackLitterman
-            # Views should be a list of dicts, e.g., [{'type': 'absolute', 'asset': 'AAPL', 'return': 0.10}]
-            views = request.views if request.views else []
-            bl = BlackLitterman(prices_df, valid_tickers, views=views, total_portfolio_value=request.investment_amount)
-            cleaned_weights, exp_ret, vol, sharpe = bl.optimize_with_black_litterman()
-            performance = (exp_ret, vol, sharpe)
-            
-        elif request.strategy == "min_volatility":
-            ef = EfficientFrontierCalculator(prices_df)
+        aligned = get_aligned_prices(prices_df, alignment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if aligned.prices.empty:
+        raise HTTPException(status_code=400, detail="No dates left after aligning the prices.")
+    return aligned
+
+
+def aligned_market_state(aligned: AlignedPrices) -> MarketState:
+    """
+    CPU bound part of the alignment: the pairwise-complete returns statistics of the aligned prices.
+    Their remaining gaps are kept, so assets that share too few days have no covariance to optimize with.
+    """
+    market_state = aligned.market_state
+    if market_state.daily_covariance.isna().to_numpy().any():
+        raise HTTPException(status_code=400,
+                            detail="Some assets share fewer than 2 days of returns after aligning the prices.")
+    return market_state
+
+
+def optimize_portfolio(request: TickerRequest, prices_df: pd.DataFrame, valid_tickers: List[str],
+                       market_inputs, market_state=None) -> dict:
+    """
+    CPU bound part of /api/analyze: runs the requested strategy and the risk metrics of the resulting portfolio.
+    Runs on the CPU worker pool, so everything it needs is passed as (picklable) arguments.
+
+    :param market_state: MarketState of prices_df, e.g. sliced from the state of a batch. Computed if None.
+    """
+    cleaned_weights = {}
+    performance = (0.0, 0.0, 0.0)
+    solver_timing = None
+    # Returns, mean and covariance computed once and shared by the strategy and the risk metrics
+    if market_state is None:
+        market_state = get_market_state(prices_df)
+    covariance_calculator = get_covariance_calculator(request.covariance_method)
+
+    if request.strategy == "hrp":
+        hrp = HRPCalculator(prices_df, linkage_method=request.linkage_method, market_state=market_state,
+                            covariance_calculator=covariance_calculator)
+        cleaned_weights = hrp.calculate_weights(constraints=request.constraints, min_weights=request.min_weights)
+        performance = hrp.calculate_performance(risk_free_rate=request.risk_free_rate)
+
+    elif request.strategy == "black_litterman":
+        # Pass user views to BlackLitterman
+        # Views should be a list of dicts, e.g., [{'type': 'absolute', 'asset': 'AAPL', 'return': 0.10}]
+        views = request.views if request.views else []
+        bl = BlackLitterman(prices_df, valid_tickers, views=views, total_portfolio_value=request.investment_amount,
+                            market_inputs=market_inputs, market_state=market_state,
+                            covariance_calculator=covariance_calculator)
+        cleaned_weights, exp_ret, vol, sharpe = bl.optimize_with_black_litterman()
+        performance = (exp_ret, vol, sharpe)
+        solver_timing = summarize_timings([bl.solver_timing])
+
+    elif request.strategy == "min_volatility":
+        ef = EfficientFrontierCalculator(prices_df, market_inputs=market_inputs, market_state=market_state,
+                                         covariance_calculator=covariance_calculator)
+        if request.current_weights is not None:
+            cleaned_weights = ef.calculate_rebalance_weights(request.current_weights, objective="min_volatility",
+                                                             **rebalance_options(request))
+        else:
             cleaned_weights = ef.calculate_min_volatility_weights()
-            performance = ef.calculate_efficient_frontier_performance(risk_free_rate=request.risk_free_rate)
+        performance = ef.calculate_efficient_frontier_performance(risk_free_rate=request.risk_free_rate)
+        solver_timing = ef.solver_timing
 
-        else: # Default to max_sharpe
-            ef = EfficientFrontierCalculator(prices_df)
+    else: # Default to max_sharpe
+        ef = EfficientFrontierCalculator(prices_df, market_inputs=market_inputs, market_state=market_state,
+                                         covariance_calculator=covariance_calculator)
+        if request.current_weights is not None:
+            cleaned_weights = ef.calculate_rebalance_weights(request.current_weights, objective="max_sharpe",
+                                                             risk_free_rate=request.risk_free_rate,
+                                                             **rebalance_options(request))
+        else:
             cleaned_weights = ef.calculate_efficient_frontier_weights(risk_free_rate=request.risk_free_rate)
-            performance = ef.calculate_efficient_frontier_performance(risk_free_rate=request.risk_free_rate)
-
-        # Calculate Sortino Ratio
-        # Sortino = (R - Rf) / Downside Deviation
-        # We need daily returns for this
-        daily_returns = prices_df.pct_change().dropna()
-        portfolio_returns = daily_returns.dot(pd.Series(cleaned_weights))
-        
-        # Downside deviation
-        target_return = 0
-        downside_returns = portfolio_returns[portfolio_returns < target_return]
-        downside_std = downside_returns.std() * np.sqrt(252) # Annualized
-        
-        expected_return = performance[0]
-        sortino_ratio = (expected_return - request.risk_free_rate) / downside_std if downside_std > 0 else 0.0
-
-        # Calculate VaR and CVaR (Monte Carlo Method, 95% confidence)
-        # Simulate 10,000 daily returns based on portfolio mu and sigma
-        mu_daily = performance[0] / 252
-        sigma_daily = performance[1] / np.sqrt(252)
-        
-        # Generate 10,000 hypothetical daily returns
-        simulated_returns = np.random.normal(mu_daily, sigma_daily, 10000)
-        
-        var_95 = np.percentile(simulated_returns, 5)
-        cvar_95 = simulated_returns[simulated_returns <= var_95].mean()
-        
-        # Fetch Asset Names
-        asset_names = market_data_provider.get_asset_names(valid_tickers)
-
-        # Prepare response data
-        response_data = {
-            "weights": cleaned_weights,
-            "performance": {
-                "expected_return": performance[0],
-                "volatility": performance[1],
-                "sharpe_ratio": performance[2],
-                "sortino_ratio": sortino_ratio,
-                "var_95": var_95,
-                "cvar_95": cvar_95
-            },
-            "valid_tickers": valid_tickers,
-            "names": asset_names,
-            "allocation": {
-                ticker: weight * request.investment_amount 
-                for ticker, weight in cleaned_weights.items() if weight > 0
-            }
+        performance = ef.calculate_efficient_frontier_performance(risk_free_rate=request.risk_free_rate)
+        solver_timing = ef.solver_timing
+
+    # Sortino ratio and VaR / CVaR from the daily returns of the portfolio
+    daily_returns = market_state.returns.dropna()
+    portfolio_returns = daily_returns.dot(pd.Series(cleaned_weights))
+    risk_metrics = RiskMetrics(portfolio_returns, expected_return=performance[0], volatility=performance[1])
+    sortino_ratio = risk_metrics.sortino_ratio(performance[0], risk_free_rate=request.risk_free_rate)
+
+    # var_95 and cvar_95 are the parametric (normal) ones, the other levels and methods are in value_at_risk
+    value_at_risk = risk_metrics.value_at_risk(dict.fromkeys([0.95, *request.confidence_levels]))
+    var_95, cvar_95 = value_at_risk[0]["var"], value_at_risk[0]["cvar"]
+
+    # Whole shares at the latest prices, with the leftover cash and their tracking error against the weights
+    allocator = DiscreteAllocator(latest_prices(prices_df))
+    discrete_allocation = allocator.allocate(cleaned_weights, request.investment_amount,
+                                             method=request.allocation_method, covariance=market_state.covariance)
+
+    response = {
+        "weights": cleaned_weights,
+        "performance": {
+            "expected_return": performance[0],
+            "volatility": performance[1],
+            "sharpe_ratio": performance[2],
+            "sortino_ratio": sortino_ratio,
+            "var_95": var_95,
+            "cvar_95": cvar_95,
+            "value_at_risk": value_at_risk
+        },
+        "discrete_allocation": discrete_allocation,
+        # Time spent compiling and solving the optimization problems (None for HRP, which does not use a solver)
+        "solver_timing": solver_timing
+    }
+    if request.current_weights is not None:
+        # Trades from the current book, and what they cost
+        response["rebalance"] = trade_list(request.current_weights, cleaned_weights, request.investment_amount,
+                                           proportional_cost=request.proportional_cost, fixed_cost=request.fixed_cost)
+    return response
+
+
+def add_allocation(request: TickerRequest, response_data: dict, valid_tickers: List[str]) -> dict:
+    response_data.update({
+        "valid_tickers": valid_tickers,
+        "allocation": {
+            ticker: weight * request.investment_amount
+            for ticker, weight in response_data["weights"].items() if weight > 0
         }
-        
-        return response_data
+    })
+    return response_data
+
+
+def build_simulator(request: SimulationRequest, prices_df: pd.DataFrame) -> MonteCarloSimulator:
+    # Using Mean Historical Return for simplicity in simulation
+    market_state = get_market_state(prices_df)
+    mu = market_state.mean_historical_return()
+    S = get_covariance_calculator(request.covariance_method).calculate_covariance(prices_df, market_state=market_state)
+    return MonteCarloSimulator(mu, S, request.weights, request.initial_portfolio_value)
+
+
+def run_simulation(request: SimulationRequest, prices_df: pd.DataFrame, executor=None, max_workers: int = 1) -> dict:
+    """
+    CPU bound part of /api/simulate, run on the CPU worker pool, or split across max_workers workers of executor.
+    """
+    simulator = build_simulator(request, prices_df)
+    return simulator.simulate(num_simulations=request.num_simulations, time_horizon=request.time_horizon,
+                              seed=request.seed, max_workers=max_workers, executor=executor)
+
 
-    except Exception as e:
-        logger.error(f"Error analyzing portfolio: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def run_backtest(request: BacktestRequest, prices: PricePanel, market_prices: Optional[pd.Series] = None,
+                 executor=None, max_workers: int = 1) -> dict:
+    """
+    CPU bound part of /api/backtest, its rebalance dates split across max_workers workers of executor.
+    """
+    backtester = Backtester(prices, strategy=request.strategy, lookback=request.lookback,
+                            rebalance=request.rebalance, risk_free_rate=request.risk_free_rate,
+                            covariance_calculator=get_covariance_calculator(request.covariance_method),
+                            constraints=request.constraints, linkage_method=request.linkage_method,
+                            views=request.views, market_prices=market_prices,
+                            initial_value=request.initial_portfolio_value)
+    return backtester.run(max_workers=max_workers, executor=executor)
+
+
+def run_sensitivity(request: SensitivityRequest, prices_df: pd.DataFrame, valid_tickers: List[str],
+                    market_inputs) -> dict:
+    """
+    CPU bound part of /api/black_litterman/sensitivity, run on the CPU worker pool.
+    """
+    bl = BlackLitterman(prices_df, valid_tickers, views=request.views, market_inputs=market_inputs,
+                        market_state=get_market_state(prices_df),
+                        covariance_calculator=get_covariance_calculator(request.covariance_method))
+    return bl.sensitivity(omega_taus=request.omega_taus, deltas=request.deltas, confidences=request.confidences,
+                          risk_free_rate=request.risk_free_rate)
+
+
+def run_allocation(request: AllocationRequest, prices: pd.Series) -> dict:
+    """
+    CPU bound part of /api/allocate, every account being allocated at once.
+    """
+    allocator = DiscreteAllocator(prices)
+    weights = pd.DataFrame(request.weights, dtype=float)
+    shares, leftover = allocator.allocate_many(weights, request.budgets, method=request.method)
+    values = shares * np.nan_to_num(allocator.prices)
+    accounts = []
+    for account in range(len(shares)):
+        bought = np.flatnonzero(shares[account])
+        accounts.append({
+            "shares": {allocator.tickers[i]: int(shares[account, i]) for i in bought},
+            "values": {allocator.tickers[i]: float(values[account, i]) for i in bought},
+            "leftover": float(leftover[account]),
+        })
+    return {"prices": {ticker: float(price) for ticker, price in prices.items()}, "accounts": accounts}
+
+
+def run_rebalance(request: RebalanceRequest, prices_df: pd.DataFrame, market_inputs, market_state=None) -> dict:
+    """
+    CPU bound part of /api/rebalance: every account is rebalanced by a few batched solves.
+    """
+    if market_state is None:
+        market_state = get_market_state(prices_df)
+    ef = EfficientFrontierCalculator(prices_df, market_inputs=market_inputs, market_state=market_state,
+                                     covariance_calculator=get_covariance_calculator(request.covariance_method))
+    values = [account.portfolio_value or request.investment_amount for account in request.accounts]
+    targets = ef.rebalance_accounts(pd.DataFrame([account.current_weights for account in request.accounts],
+                                                 dtype=float),
+                                    objective=request.strategy, risk_free_rate=request.risk_free_rate,
+                                    portfolio_values=values, **rebalance_options(request))
+    accounts = []
+    for account, value, (_, weights) in zip(request.accounts, values, targets.iterrows()):
+        weights = {ticker: round(float(weight), 5) for ticker, weight in weights.items() if weight >= TRADE_TOLERANCE}
+        accounts.append({"weights": weights, **trade_list(account.current_weights, weights, value,
+                                                          proportional_cost=request.proportional_cost,
+                                                          fixed_cost=request.fixed_cost)})
+    return {"tickers": targets.columns.tolist(), "accounts": accounts, "solver_timing": ef.solver_timing}
+
+
+def trace_frontier(request: FrontierRequest, prices_df: pd.DataFrame, market_inputs) -> dict:
+    """
+    CPU bound part of /api/frontier, run on the CPU worker pool.
+    """
+    ef = EfficientFrontierCalculator(prices_df, market_inputs=market_inputs, market_state=get_market_state(prices_df),
+                                     covariance_calculator=get_covariance_calculator(request.covariance_method))
+    return ef.calculate_frontier(n_points=request.n_points, by=request.by, risk_free_rate=request.risk_free_rate)
+
+
+@app.post("/api/analyze")
+async def analyze_portfolio(request: TickerRequest):
+    async with request_limiter:
+        try:
+            logger.info(f"Analyzing tickers: {request.tickers} with strategy: {request.strategy}")
+            check_covariance_method(request)
+            check_confidence_levels(request)
+            check_allocation_method(request.allocation_method)
+            check_rebalance(request)
+            alignment = get_alignment(request)
+            market_data_provider = MarketDataProvider()
+
+            # Identical requests over the same data are served from the cache, without downloading anything
+            cache_key = result_cache.key(request.model_dump())
+            response_data = result_cache.get(cache_key)
+            if response_data is not None:
+                response_data["names"] = await io_pool.run(market_data_provider.get_asset_names,
+                                                           response_data["valid_tickers"])
+                return response_data
+
+            # 1. Download Data
+            prices_df, valid_tickers = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                return_updated_tickers=True
+            )
+
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+
+            # Resolve asset names in the background while the portfolio is being optimized
+            market_data_provider.warm_up_asset_names(valid_tickers)
+
+            # Mixed-exchange prices on one calendar and in one currency, with their returns statistics
+            market_state = None
+            aligned = None
+            if alignment is not None:
+                aligned = await io_pool.run(align_prices, prices_df, alignment)
+                prices_df, market_state = aligned.prices, await cpu_pool.run(aligned_market_state, aligned)
+
+            # Risk-free rate and S&P 500 data shared by every CAPM computation of this window,
+            # downloaded here so that the CPU workers never wait on the network
+            market_inputs = get_market_inputs(prices_df.index[0], prices_df.index[-1])
+            if request.strategy != "hrp":
+                await io_pool.run(market_inputs.prefetch)
+
+            # 2. Optimize
+            response_data = await cpu_pool.run(optimize_portfolio, request, prices_df, valid_tickers, market_inputs,
+                                               market_state=market_state)
+
+            # Prepare response data
+            add_allocation(request, response_data, valid_tickers)
+            if aligned is not None:
+                response_data["alignment"] = aligned.report
+            # Names are not cached with the result: they may still be resolving and are cached by the resolver
+            result_cache.put(cache_key, response_data, last_price_date=prices_df.index[-1], end_date=request.end_date)
+
+            # Fetch Asset Names
+            response_data["names"] = await io_pool.run(market_data_provider.get_asset_names, valid_tickers)
+
+            return response_data
+
+        except HTTPException:
+            raise
+        except InfeasibleConstraintsError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error analyzing portfolio: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/analyze/batch")
+async def analyze_portfolio_batch(request: BatchRequest):
+    """
+    Many /api/analyze jobs in one request, streamed as newline delimited JSON: one line per job as soon as it is
+    done, {"job": index, "result": ...} or {"job": index, "status_code": ..., "detail": ...}, and a last line with
+    "done": true. The union of the tickers of every date window is downloaded once, its returns statistics computed
+    once and sliced for each job, and the optimizations run concurrently on the CPU worker pool.
+    """
+    if len(request.jobs) > MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {MAX_BATCH_JOBS} jobs.")
+    logger.info(f"Analyzing a batch of {len(request.jobs)} portfolios")
+
+    async def results():
+        async with request_limiter:
+            market_data_provider = MarketDataProvider()
+            failed = 0
+
+            async def analyze_job(index: int, job: TickerRequest, window: dict) -> dict:
+                try:
+                    if window.get("error"):
+                        raise window["error"]
+                    valid_tickers = [ticker for ticker in dict.fromkeys(job.tickers) if ticker in window["valid"]]
+                    if not valid_tickers:
+                        raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+                    alignment = get_alignment(job)
+                    aligned = None
+                    if alignment is None:
+                        market_state = window["state"].subset(valid_tickers)
+                    else:
+                        # The calendar of a job depends on its own tickers, its prices are aligned on their own
+                        aligned = await io_pool.run(align_prices, window["prices"][valid_tickers], alignment)
+                        market_state = await cpu_pool.run(aligned_market_state, aligned)
+                    prices_df = market_state.prices
+                    response_data = await cpu_pool.run(optimize_portfolio, job, prices_df, valid_tickers,
+                                                       window["market_inputs"], market_state=market_state)
+                    add_allocation(job, response_data, valid_tickers)
+                    if aligned is not None:
+                        response_data["alignment"] = aligned.report
+                    result_cache.put(window["keys"][index], response_data, last_price_date=prices_df.index[-1],
+                                     end_date=job.end_date)
+                    return {"job": index, "result": response_data}
+                except HTTPException as e:
+                    return {"job": index, "status_code": e.status_code, "detail": e.detail}
+                except InfeasibleConstraintsError as e:
+                    return {"job": index, "status_code": 400, "detail": str(e)}
+                except Exception as e:
+                    logger.error(f"Error analyzing portfolio {index} of the batch: {e}")
+                    return {"job": index, "status_code": 500, "detail": str(e)}
+
+            async def load_window(window: dict):
+                # Prices of every ticker of the window, and their returns statistics, shared by its jobs
+                try:
+                    prices_df, valid_tickers = await io_pool.run(
+                        market_data_provider.get_data,
+                        tickers=list(window["tickers"]),
+                        start_date=window["start_date"],
+                        end_date=window["end_date"],
+                        return_updated_tickers=True
+                    )
+                    if prices_df.empty:
+                        raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+                    market_data_provider.warm_up_asset_names(valid_tickers)
+                    window["valid"] = set(valid_tickers)
+                    window["prices"] = prices_df
+                    window["state"] = await cpu_pool.run(get_market_state, prices_df)
+                    window["market_inputs"] = get_market_inputs(prices_df.index[0], prices_df.index[-1])
+                    if window["needs_market_inputs"]:
+                        await io_pool.run(window["market_inputs"].prefetch)
+                except Exception as e:
+                    window["error"] = e
+
+            # Invalid and cached jobs are answered right away, the others are grouped by date window
+            windows = {}
+            pending = []
+            for index, job in enumerate(request.jobs):
+                try:
+                    check_covariance_method(job)
+                    check_confidence_levels(job)
+                    check_allocation_method(job.allocation_method)
+                    check_rebalance(job)
+                    get_alignment(job)
+                except HTTPException as e:
+                    failed += 1
+                    yield json.dumps({"job": index, "status_code": e.status_code, "detail": e.detail}) + "\n"
+                    continue
+                cache_key = result_cache.key(job.model_dump())
+                response_data = result_cache.get(cache_key)
+                if response_data is not None:
+                    response_data["names"] = await io_pool.run(market_data_provider.get_asset_names,
+                                                               response_data["valid_tickers"])
+                    yield json.dumps({"job": index, "result": response_data}) + "\n"
+                    continue
+                window = windows.setdefault((job.start_date, job.end_date), {
+                    "start_date": job.start_date, "end_date": job.end_date, "tickers": {}, "keys": {},
+                    "needs_market_inputs": False
+                })
+                window["tickers"].update(dict.fromkeys(job.tickers))
+                window["keys"][index] = cache_key
+                window["needs_market_inputs"] |= job.strategy != "hrp"
+                pending.append((index, job, window))
+
+            await asyncio.gather(*(load_window(window) for window in windows.values()))
+
+            for job_result in asyncio.as_completed([analyze_job(*item) for item in pending]):
+                line = await job_result
+                if "result" in line:
+                    line["result"]["names"] = await io_pool.run(market_data_provider.get_asset_names,
+                                                                line["result"]["valid_tickers"])
+                else:
+                    failed += 1
+                yield json.dumps(line, default=float) + "\n"
+
+            yield json.dumps({"done": True, "jobs": len(request.jobs), "failed": failed}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.post("/api/simulate")
 async def simulate_portfolio(request: SimulationRequest):
-    try:
-        logger.info(f"Simulating portfolio for tickers: {request.tickers}")
-        
-        # 1. Download Data (Need historical data for mean returns and covariance)
-        market_data_provider = MarketDataProvider()
-        prices_df = market_data_provider.get_data(
-            tickers=request.tickers,
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
-        
-        if prices_df.empty:
-             raise HTTPException(status_code=400, detail="No data found for simulation.")
-
-        # 2. Calculate Mean Returns and Covariance
-        # Using Mean Historical Return for simplicity in simulation
-        mu = MeanHistoricalReturnCalculator().calculate_expected_return(prices_df)
-        S = SampleCovarianceCalculator().calculate_covariance(prices_df)
-        
-        # 3. Run Simulation
-        simulator = MonteCarloSimulator(mu, S, request.weights, request.initial_portfolio_value)
-        results = simulator.simulate(num_simulations=request.num_simulations, time_horizon=request.time_horizon)
-        
-        return results
-
-    except Exception as e:
-        logger.error(f"Error simulating portfolio: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-    except Exception as e:
-        logger.error(f"Error analyzing portfolio: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with request_limiter:
+        try:
+            logger.info(f"Simulating portfolio for tickers: {request.tickers}")
+            check_covariance_method(request)
+
+            # 1. Download Data (Need historical data for mean returns and covariance)
+            market_data_provider = MarketDataProvider()
+            prices_df = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for simulation.")
+
+            # 2. Calculate Mean Returns and Covariance, and run the simulation
+            if request.num_simulations >= PARALLEL_SIMULATION_PATHS and cpu_pool.max_workers > 1:
+                # Large simulations are split across every CPU worker, this thread only waits for them
+                return await io_pool.run(run_simulation, request, prices_df,
+                                         executor=cpu_pool.tracked_executor, max_workers=cpu_pool.max_workers)
+            return await cpu_pool.run(run_simulation, request, prices_df)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error simulating portfolio: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/simulate/stream")
+async def simulate_portfolio_stream(request: SimulationRequest):
+    """
+    Same simulation as /api/simulate, streamed as newline delimited JSON: one line of percentile bands as soon as
+    the first batch of paths is done, then progressively refined ones until the last line, which has "done": true.
+    Bands are base64 float32 arrays (see PathStatistics.to_compact_dict).
+    """
+    async with request_limiter:
+        try:
+            logger.info(f"Streaming simulation for tickers: {request.tickers}")
+            check_covariance_method(request)
+
+            market_data_provider = MarketDataProvider()
+            prices_df = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for simulation.")
+
+            simulator = await cpu_pool.run(build_simulator, request, prices_df)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error simulating portfolio: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def snapshots():
+        async with request_limiter:
+            statistics = None
+            try:
+                # Every batch of paths is a task of the CPU pool, merged here into the statistics streamed so far
+                for batch in simulator.progressive_batches(num_simulations=request.num_simulations,
+                                                           seed=request.seed):
+                    batch_statistics = await cpu_pool.run(simulator.simulate_batch, batch, request.time_horizon)
+                    if statistics is None:
+                        statistics = batch_statistics
+                    else:
+                        statistics.merge(batch_statistics)
+                    snapshot = await cpu_pool.run(statistics.to_compact_dict)
+                    snapshot["done"] = statistics.count == request.num_simulations
+                    yield json.dumps(snapshot) + "\n"
+            except Exception as e:
+                # The status code is already sent, report the error in the stream
+                logger.error(f"Error streaming simulation: {e}")
+                yield json.dumps({"error": str(e), "done": True}) + "\n"
+
+    return StreamingResponse(snapshots(), media_type="application/x-ndjson")
+
+@app.post("/api/backtest")
+async def backtest_portfolio(request: BacktestRequest):
+    """
+    Walk-forward backtest of a strategy over the window. Prices come from the price store when one is configured
+    (PRICE_STORE_DIR, PRICE_STORE_OFFLINE=1 to never download).
+    """
+    async with request_limiter:
+        try:
+            logger.info(f"Backtesting {request.strategy} on tickers: {request.tickers}")
+            check_covariance_method(request)
+
+            # Long histories of large universes are held as a float32 panel, see PricePanel
+            market_data_provider = MarketDataProvider()
+            prices, _ = await io_pool.run(
+                market_data_provider.get_panel,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+            if prices.empty:
+                raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+
+            market_prices = None
+            if request.strategy == "black_litterman":
+                market_data = await io_pool.run(market_data_provider.get_data, tickers=[request.benchmark],
+                                                start_date=request.start_date, end_date=request.end_date)
+                if market_data.empty:
+                    raise HTTPException(status_code=400, detail=f"No data found for the benchmark {request.benchmark}.")
+                market_prices = market_data.iloc[:, 0]
+
+            # The rebalance dates are split across every CPU worker, this thread only waits for them
+            return await io_pool.run(run_backtest, request, prices, market_prices,
+                                     executor=cpu_pool.tracked_executor, max_workers=cpu_pool.max_workers)
+
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error backtesting portfolio: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/black_litterman/sensitivity")
+async def black_litterman_sensitivity(request: SensitivityRequest):
+    """
+    Black-Litterman max Sharpe weights over a grid of omega_taus x deltas x confidences, the prior and the
+    covariance being estimated once for the whole grid.
+    """
+    scenarios = len(request.omega_taus) * len(request.deltas or [None]) * len(request.confidences or [None])
+    if scenarios > MAX_SENSITIVITY_SCENARIOS:
+        raise HTTPException(status_code=400,
+                            detail=f"A sensitivity grid may contain at most {MAX_SENSITIVITY_SCENARIOS} scenarios.")
+    async with request_limiter:
+        try:
+            logger.info(f"Black-Litterman sensitivity of {scenarios} scenarios for tickers: {request.tickers}")
+            check_covariance_method(request)
+
+            market_data_provider = MarketDataProvider()
+            prices_df, valid_tickers = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                return_updated_tickers=True
+            )
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+
+            market_inputs = get_market_inputs(prices_df.index[0], prices_df.index[-1])
+            await io_pool.run(market_inputs.prefetch)
+
+            return await cpu_pool.run(run_sensitivity, request, prices_df, valid_tickers, market_inputs)
+
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error computing the Black-Litterman sensitivity: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/allocate")
+async def allocate_accounts(request: AllocationRequest):
+    """
+    Whole-share orders of many accounts at once, from their target weights and cash, at the latest prices.
+    """
+    if len(request.budgets) > MAX_ALLOCATION_ACCOUNTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_ALLOCATION_ACCOUNTS} accounts may be allocated.")
+    if len(request.weights) not in (1, len(request.budgets)):
+        raise HTTPException(status_code=400, detail="Give one set of weights for every account, or a single one.")
+    check_allocation_method(request.method)
+    async with request_limiter:
+        try:
+            tickers = list(dict.fromkeys(ticker for weights in request.weights for ticker in weights))
+            if request.prices is not None:
+                prices = pd.Series(request.prices, dtype=float)
+            else:
+                market_data_provider = MarketDataProvider()
+                prices_df = await io_pool.run(market_data_provider.get_data, tickers=tickers, period="5d")
+                prices = latest_prices(prices_df)
+
+            return await cpu_pool.run(run_allocation, request, prices)
+
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error allocating accounts: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/rebalance")
+async def rebalance_accounts(request: RebalanceRequest):
+    """
+    Rebalance many accounts on the same universe at once, from their current books, with transaction costs and
+    turnover limits.
+    """
+    if len(request.accounts) > MAX_REBALANCE_ACCOUNTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_REBALANCE_ACCOUNTS} accounts may be rebalanced at once.")
+    if request.strategy not in ("max_sharpe", "min_volatility"):
+        raise HTTPException(status_code=400, detail="strategy must be either max_sharpe or min_volatility.")
+    check_covariance_method(request)
+    check_rebalance(request)
+    for account in request.accounts:
+        check_current_weights(account.current_weights)
+        if account.portfolio_value is not None and account.portfolio_value <= 0:
+            raise HTTPException(status_code=400, detail="portfolio_value must be positive.")
+    alignment = get_alignment(request)
+    async with request_limiter:
+        try:
+            logger.info(f"Rebalancing {len(request.accounts)} accounts of tickers: {request.tickers}")
+            market_data_provider = MarketDataProvider()
+            prices_df = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+
+            market_state = None
+            if alignment is not None:
+                aligned = await io_pool.run(align_prices, prices_df, alignment)
+                prices_df, market_state = aligned.prices, await cpu_pool.run(aligned_market_state, aligned)
+
+            market_inputs = get_market_inputs(prices_df.index[0], prices_df.index[-1])
+            await io_pool.run(market_inputs.prefetch)
+
+            return await cpu_pool.run(run_rebalance, request, prices_df, market_inputs, market_state=market_state)
+
+        except HTTPException:
+            raise
+        except InfeasibleConstraintsError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error rebalancing accounts: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/frontier")
+async def efficient_frontier(request: FrontierRequest):
+    async with request_limiter:
+        try:
+            logger.info(f"Tracing efficient frontier for tickers: {request.tickers}")
+            check_covariance_method(request)
+
+            market_data_provider = MarketDataProvider()
+            prices_df = await io_pool.run(
+                market_data_provider.get_data,
+                tickers=request.tickers,
+                start_date=request.start_date,
+                end_date=request.end_date
+            )
+
+            if prices_df.empty:
+                raise HTTPException(status_code=400, detail="No data found for the provided tickers.")
+
+            market_inputs = get_market_inputs(prices_df.index[0], prices_df.index[-1])
+            await io_pool.run(market_inputs.prefetch)
+
+            return await cpu_pool.run(trace_frontier, request, prices_df, market_inputs)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error tracing efficient frontier: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    Load of the request limiter and of the worker pools, to size them under load, result cache counters, and the
+    problem cache of this process (process CPU workers keep their own).
+    """
+    return {
+        "requests": request_limiter.stats(),
+        "io_pool": io_pool.stats(),
+        "cpu_pool": cpu_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "problem_cache": problem_cache.stats()
+    }
 
 @app.get("/")
 async def read_index():
@@ -207,7 +207,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
-            const response = await fetch('/api/simulate', {
+            const response = await fetch('/api/simulate/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -224,8 +224,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.detail || 'Simulation failed');
             }
 
-            const simulationData = await response.json();
-            renderSimulationChart(simulationData);
+            // Newline delimited JSON: the chart is drawn from the first batch of paths, then refined
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const snapshot = JSON.parse(line);
+                    if (snapshot.error) throw new Error(snapshot.error);
+                    renderSimulationChart(decodeSimulationSnapshot(snapshot));
+                }
+            }
         } catch (error) {
             console.error("Simulation error:", error);
             alert("Simulation failed: " + error.message);
@@ -312,9 +327,38 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    function decodeFloat32(encoded) {
+        const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+        return Array.from(new Float32Array(bytes.buffer));
+    }
+
+    function decodeSimulationSnapshot(snapshot) {
+        return {
+            ...snapshot,
+            days: Array.from({ length: snapshot.time_horizon }, (_, day) => day),
+            p10: decodeFloat32(snapshot.p10),
+            p50: decodeFloat32(snapshot.p50),
+            p90: decodeFloat32(snapshot.p90)
+        };
+    }
+
+    function simulationTitle(data) {
+        return `Projected Value: $${data.final_mean.toFixed(0)} (Range: $${data.final_min.toFixed(0)} - $${data.final_max.toFixed(0)})`;
+    }
+
     function renderSimulationChart(data) {
         const ctx = document.getElementById('simulation-chart').getContext('2d');
 
+        // Refinement of the same simulation: update the bands in place rather than redrawing the chart
+        if (simulationChart && simulationChart.data.labels.length === data.days.length && data.paths) {
+            simulationChart.data.datasets[0].data = data.p90;
+            simulationChart.data.datasets[1].data = data.p50;
+            simulationChart.data.datasets[2].data = data.p10;
+            simulationChart.options.plugins.title.text = simulationTitle(data);
+            simulationChart.update('none');
+            return;
+        }
+
         if (simulationChart) {
             simulationChart.destroy();
         }
@@ -362,7 +406,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     },
                     title: {
                         display: true,
-                        text: `Projected Value: $${data.final_mean.toFixed(0)} (Range: $${data.final_min.toFixed(0)} - $${data.final_max.toFixed(0)})`,
+                        text: simulationTitle(data),
                         color: '#94a3b8'
                     }
                 },
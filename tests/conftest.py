@@ -0,0 +1,4 @@
+import os
+
+# The endpoint tests patch classes inside main, which worker processes would not see
+os.environ.setdefault("CPU_POOL", "thread")
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from PortfolioOptimizer.AssetNameResolver import AssetNameResolver
+
+
+class TestAssetNameResolver(unittest.TestCase):
+    def test_resolve_caches_names(self):
+        fetch = MagicMock(side_effect=lambda ticker: {"longName": f"{ticker} Inc.", "currency": "USD"})
+        resolver = AssetNameResolver(fetch)
+
+        self.assertEqual(resolver.resolve(["AAPL", "MSFT"]), {"AAPL": "AAPL Inc.", "MSFT": "MSFT Inc."})
+        self.assertEqual(resolver.resolve(["AAPL"]), {"AAPL": "AAPL Inc."})
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(resolver.metadata(["AAPL"])["AAPL"]["currency"], "USD")
+
+    def test_timeout_falls_back_to_ticker(self):
+        release = threading.Event()
+
+        def slow_fetch(ticker):
+            release.wait(5)
+            return {"shortName": "Slow Corp"}
+
+        resolver = AssetNameResolver(slow_fetch)
+        self.assertEqual(resolver.resolve(["SLOW"], timeout=0.01), {"SLOW": "SLOW"})
+
+        # The fetch keeps running in the background and fills the cache
+        release.set()
+        for future in resolver.warm_up(["SLOW"]):
+            future.result(timeout=5)
+        self.assertEqual(resolver.resolve(["SLOW"], timeout=0), {"SLOW": "Slow Corp"})
+
+    def test_failed_fetch_falls_back_to_ticker(self):
+        fetch = MagicMock(side_effect=RuntimeError("network down"))
+        resolver = AssetNameResolver(fetch)
+        self.assertEqual(resolver.resolve(["AAPL"]), {"AAPL": "AAPL"})
+
+        # The failure is cached for failure_ttl seconds
+        self.assertEqual(resolver.resolve(["AAPL"]), {"AAPL": "AAPL"})
+        self.assertEqual(fetch.call_count, 1)
+        resolver.failure_ttl = 0
+        fetch.side_effect = None
+        fetch.return_value = {"longName": "Apple Inc."}
+        self.assertEqual(resolver.resolve(["AAPL"]), {"AAPL": "Apple Inc."})
+
+    def test_persistence_and_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "names.json")
+            resolver = AssetNameResolver(lambda ticker: {"longName": ticker.lower()}, cache_path=path, max_entries=2)
+            resolver.resolve(["A"])
+            resolver.resolve(["B"])
+            resolver.resolve(["C"])
+
+            fetch = MagicMock(return_value={"longName": "fetched"})
+            reloaded = AssetNameResolver(fetch, cache_path=path)
+            self.assertEqual(reloaded.resolve(["B", "C"]), {"B": "b", "C": "c"})
+            fetch.assert_not_called()
+            self.assertEqual(reloaded.resolve(["A"]), {"A": "fetched"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pypfopt import EfficientFrontier, risk_models
+
+from PortfolioOptimizer.Backtester import Backtester
+from PortfolioOptimizer.PriceStore import PriceStore
+
+
+def _prices(days=700, assets=6, seed=0, drift=0.0004):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(drift, 0.01, (days, 1))
+    returns = market * rng.uniform(0.5, 1.5, assets) + rng.normal(0.0002, 0.01, (days, assets))
+    prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=pd.bdate_range("2020-01-01", periods=days),
+                          columns=[f"T{i}" for i in range(assets)])
+    # Listed after the first rebalance
+    if assets > 5:
+        prices.iloc[:300, 5] = np.nan
+    return prices
+
+
+class TestBacktester(unittest.TestCase):
+    def test_rebalance_positions(self):
+        backtester = Backtester(_prices(), lookback=100, rebalance="quarterly")
+        dates = backtester.returns.index[backtester.rebalance_positions()]
+        self.assertTrue(all(date.is_quarter_end or date.month in (3, 6, 9, 12) for date in dates))
+        self.assertGreaterEqual(backtester.rebalance_positions()[0], 99)
+        self.assertTrue((dates[1:].month != dates[:-1].month).all())
+
+    def test_min_volatility_matches_pypfopt(self):
+        prices = _prices()
+        result = Backtester(prices, strategy="min_volatility", lookback=250).run()
+        rebalance = result["rebalances"][-1]
+        position = prices.index.get_loc(pd.Timestamp(rebalance["date"]))
+
+        window = prices.iloc[position - 250:position + 1]
+        ef = EfficientFrontier(None, risk_models.sample_cov(window))
+        expected = ef.min_volatility()
+        for ticker, weight in expected.items():
+            self.assertAlmostEqual(rebalance["weights"].get(ticker, 0.0), weight, places=3)
+        # Not listed long enough on the first rebalance dates
+        self.assertNotIn("T5", result["rebalances"][0]["weights"])
+        self.assertIn("T5", rebalance["weights"])
+
+    def test_same_result_for_any_number_of_workers(self):
+        backtester = Backtester(_prices(), strategy="max_sharpe", lookback=120)
+        single = backtester.run()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            split = backtester.run(max_workers=3, executor=executor)
+        self.assertEqual(split["workers"], 3)
+        np.testing.assert_allclose(split["values"], single["values"], rtol=1e-6)
+
+    def test_buy_and_hold_between_rebalances(self):
+        prices = _prices(assets=1)
+        for strategy in ("hrp", "min_volatility"):
+            result = Backtester(prices.iloc[:, :1], strategy=strategy, lookback=60, rebalance="yearly").run()
+            start = prices.index.get_loc(pd.Timestamp(result["rebalances"][0]["date"]))
+            expected = 10000 * prices.iloc[start + 1:, 0] / prices.iloc[start, 0]
+            np.testing.assert_allclose(result["values"], expected.round(2), rtol=1e-9)
+            self.assertEqual(result["dates"][0], prices.index[start + 1].date().isoformat())
+
+    def test_black_litterman_offline_from_price_store(self):
+        # Rising market, so that the posterior max Sharpe portfolio exists on every date
+        prices = _prices(drift=0.002)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PriceStore(tmp)
+            for ticker in list(prices.columns):
+                store.write(ticker, "Adj Close", prices[ticker], prices.index[0], prices.index[-1])
+            store.write("^GSPC", "Adj Close", prices.iloc[:, :5].mean(axis=1), prices.index[0], prices.index[-1])
+
+            backtester = Backtester.from_price_store(PriceStore(tmp, offline=True), list(prices.columns),
+                                                     prices.index[0], prices.index[-1], benchmark="^GSPC",
+                                                     strategy="black_litterman", lookback=250, rebalance="quarterly",
+                                                     views=[{"type": "absolute", "asset": "T5", "return": 0.2}])
+            result = backtester.run()
+        self.assertEqual(result["failed_rebalances"], [])
+        for rebalance in result["rebalances"]:
+            self.assertAlmostEqual(sum(rebalance["weights"].values()), 1, places=3)
+        self.assertLess(result["performance"]["max_drawdown"], 0)
+
+    def test_black_litterman_views_on_late_listed_assets(self):
+        prices = _prices(drift=0.002)
+        views = [{"type": "absolute", "assets": ["T4", "T5"], "returns": [0.15, 0.2], "confidences": [0.5, 0.6]},
+                 {"type": "portfolio", "weights": {"T0": 0.5, "T5": 0.5}, "return": 0.1}]
+        backtester = Backtester(prices, strategy="black_litterman", lookback=250, rebalance="quarterly", views=views,
+                                market_prices=prices.iloc[:, :5].mean(axis=1))
+        result = backtester.run()
+        self.assertEqual(result["failed_rebalances"], [])
+        # T5 is not listed yet on the first rebalance date, where its views are left out rather than failing it
+        self.assertNotIn("T5", result["rebalances"][0]["weights"])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            Backtester(_prices(), strategy="unknown")
+        with self.assertRaises(ValueError):
+            Backtester(_prices(), strategy="black_litterman")
+        with self.assertRaises(ValueError):
+            Backtester(_prices(days=50), lookback=100).run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch
 import pandas as pd
 import numpy as np
-from PortfolioOptimizer.BlackLitterman import BlackLitterman
+import scipy.sparse
+from pypfopt import BlackLittermanModel
+from PortfolioOptimizer.BlackLitterman import BlackLitterman, black_litterman_posterior
 
 class TestBlackLitterman(unittest.TestCase):
     def setUp(self):
@@ -30,5 +32,83 @@ class TestBlackLitterman(unittest.TestCase):
         self.assertAlmostEqual(sum(cleaned_weights.values()), 1.0, places=4)
         self.assertIsInstance(exp_ret, float)
 
+    @patch("PortfolioOptimizer.BlackLitterman.CapmCalculator")
+    def test_omega_is_set(self, MockCapm):
+        MockCapm.return_value.calculate_expected_return.return_value = pd.Series([0.05, 0.06], index=self.tickers)
+        views = self.views + [{'type': 'relative', 'asset1': 'AAPL', 'asset2': 'GOOGL', 'difference': 0.01,
+                               'confidence': 0.5}]
+
+        bl = BlackLitterman(data=self.data, tickers=self.tickers, views=views, omega_tau=0.1)
+        variances = np.diag(bl.Sigma.to_numpy())
+        np.testing.assert_allclose(bl.omega[:2], 0.1 * variances)
+        # Idzorek: (1 - c) / c * tau * p' Sigma p with c = 0.5
+        p = np.array([1, -1])
+        self.assertAlmostEqual(bl.omega[2], 0.05 * p @ bl.Sigma.to_numpy() @ p)
+
+    @patch("PortfolioOptimizer.BlackLitterman.CapmCalculator")
+    def test_sensitivity_matches_single_models(self, MockCapm):
+        rng = np.random.default_rng(0)
+        tickers = [f"T{i}" for i in range(6)]
+        data = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0006, 0.01, (300, 6)), axis=0),
+                            index=pd.bdate_range("2022-01-03", periods=300), columns=tickers)
+        prior = pd.Series(np.linspace(0.05, 0.12, 6), index=tickers)
+        MockCapm.return_value.calculate_expected_return.side_effect = lambda *args, **kwargs: prior.copy()
+        MockCapm.return_value.market_inputs.market_risk_aversion = 2.5
+        MockCapm.return_value.market_inputs.risk_free_rate = 0.03
+        views = [{'type': 'absolute', 'asset': 'T0', 'return': 0.2},
+                 {'type': 'relative', 'asset1': 'T1', 'asset2': 'T5', 'difference': 0.05, 'confidence': 0.5}]
+
+        grid = BlackLitterman(data, tickers, views=views).sensitivity(
+            omega_taus=[0.01, 0.2], deltas=[1.0, 2.5, 5.0], confidences=[[None, 0.5], 0.9])
+        weights = np.array(grid["weights"], dtype=float)
+        self.assertEqual(weights.shape, (2, 3, 2, 6))
+        self.assertEqual(grid["confidences"], [[None, 0.5], [0.9, 0.9]])
+        np.testing.assert_allclose(weights.sum(axis=-1), 1, atol=1e-4)
+
+        # omega_tau 0.2, delta 5 and both views held with confidence 0.9, as a model of its own
+        confident_views = [dict(view, confidence=0.9) for view in views]
+        bl = BlackLitterman(data, tickers, views=confident_views, omega_tau=0.2)
+        bl.prior = 0.03 + (prior - 0.03) * 5.0 / 2.5
+        expected = bl.optimize_with_black_litterman()[0]
+        np.testing.assert_allclose(weights[1, 2, 1], list(expected.values()), atol=1e-4)
+        # The delta tilts the weights through the prior
+        self.assertGreater(np.abs(weights[0, 0, 0] - weights[0, 2, 0]).max(), 1e-3)
+
+    @patch("PortfolioOptimizer.BlackLitterman.CapmCalculator")
+    def test_sensitivity_with_negative_market_premium(self, MockCapm):
+        MockCapm.return_value.calculate_expected_return.return_value = pd.Series([0.05, 0.06], index=self.tickers)
+        MockCapm.return_value.market_inputs.market_risk_aversion = -1.5
+        MockCapm.return_value.market_inputs.risk_free_rate = 0.03
+        bl = BlackLitterman(data=self.data, tickers=self.tickers, views=self.views)
+
+        # A confidence sweep keeps the prior as it is
+        grid = bl.sensitivity(confidences=[0.2, 0.8])
+        self.assertEqual(grid["deltas"], [-1.5])
+        self.assertEqual(np.array(grid["weights"], dtype=float).shape, (1, 1, 2, 2))
+        # Scaling the prior to other deltas needs a positive market premium
+        with self.assertRaises(ValueError):
+            bl.sensitivity(deltas=[2.5])
+
+    def test_posterior_matches_pypfopt(self):
+        rng = np.random.default_rng(0)
+        # Fewer views than assets (views space) and more views than assets (assets space)
+        for assets, views in ((10, 3), (5, 12)):
+            B = rng.normal(0, 0.1, (assets, assets + 3))
+            Sigma = B @ B.T
+            pi = rng.uniform(0, 0.1, assets)
+            P = scipy.sparse.random(views, assets, density=0.4, random_state=1, format='csr')
+            Q = rng.normal(0, 0.05, views)
+            omega = rng.uniform(0.001, 0.01, views)
+
+            returns, covariance = black_litterman_posterior(pi, Sigma, P, Q, omega)
+            bl = BlackLittermanModel(Sigma, pi=pi, P=P.toarray(), Q=Q, omega=np.diag(omega))
+            np.testing.assert_allclose(returns, bl.bl_returns(), atol=1e-12)
+            np.testing.assert_allclose(covariance, bl.bl_cov(), atol=1e-12)
+
+        # Views of infinite variance are ignored
+        returns, covariance = black_litterman_posterior(pi, Sigma, P, Q, np.full(views, np.inf))
+        np.testing.assert_allclose(returns, pi)
+        np.testing.assert_allclose(covariance, 1.05 * Sigma)
+
 if __name__ == '__main__':
     unittest.main()
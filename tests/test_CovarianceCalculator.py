@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from pypfopt import EfficientFrontier, risk_models
+from sklearn.covariance import ledoit_wolf, oas
+
+from PortfolioOptimizer.CovarianceCalculator import (EWMACovarianceCalculator, LedoitWolfCovarianceCalculator,
+                                                     OASCovarianceCalculator, PCAFactorCovarianceCalculator,
+                                                     SampleCovarianceCalculator, get_covariance_calculator)
+from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator
+from PortfolioOptimizer.MarketState import MarketState
+
+
+def _prices(days=400, assets=12, seed=0):
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0, 0.01, (days, 2))
+    returns = factors @ rng.normal(0, 1, (2, assets)) + rng.normal(0.0005, 0.01, (days, assets))
+    return pd.DataFrame(100 * np.exp(np.cumsum(returns, axis=0)), index=pd.bdate_range("2021-01-04", periods=days),
+                        columns=[f"T{i}" for i in range(assets)])
+
+
+class TestCovarianceCalculators(unittest.TestCase):
+    def setUp(self):
+        self.prices = _prices()
+        self.returns = self.prices.pct_change().dropna()
+
+    def test_sample_uses_market_state(self):
+        state = MarketState(self.prices)
+        np.testing.assert_allclose(SampleCovarianceCalculator().calculate_covariance(self.prices, market_state=state),
+                                   risk_models.sample_cov(self.prices), atol=1e-14)
+
+    def test_shrinkage_estimators(self):
+        expected_lw, _ = ledoit_wolf(self.returns.to_numpy())
+        expected_oas, _ = oas(self.returns.to_numpy())
+        np.testing.assert_allclose(LedoitWolfCovarianceCalculator().calculate_covariance(self.prices),
+                                   expected_lw * 252, rtol=1e-10)
+        np.testing.assert_allclose(OASCovarianceCalculator().calculate_covariance(self.prices),
+                                   expected_oas * 252, rtol=1e-10)
+
+    def test_ewma_matches_pypfopt(self):
+        np.testing.assert_allclose(EWMACovarianceCalculator(span=60).calculate_covariance(self.prices),
+                                   risk_models.exp_cov(self.prices, span=60), atol=1e-14)
+
+    def test_pca_factor_model(self):
+        calculator = PCAFactorCovarianceCalculator(n_factors=2)
+        loadings, specific = calculator.calculate_factors(self.prices)
+        covariance = calculator.calculate_covariance(self.prices)
+        sample = risk_models.sample_cov(self.prices)
+
+        self.assertEqual(loadings.shape, (12, 2))
+        # Factors explain the co-movements, specific variances make up each asset's total variance
+        np.testing.assert_allclose(np.diag(covariance), np.diag(sample), rtol=1e-10)
+        self.assertGreater(np.linalg.eigvalsh(covariance).min(), 0)
+
+    def test_pca_factor_model_without_overlap(self):
+        prices = self.prices.copy()
+        prices.iloc[200:, 0] = np.nan
+        prices.iloc[:200, 1] = np.nan
+        with self.assertRaises(ValueError):
+            PCAFactorCovarianceCalculator().calculate_factors(prices, MarketState(prices, ffill=False))
+
+    def test_factored_optimization_matches_dense(self):
+        calculator = PCAFactorCovarianceCalculator(n_factors=2)
+        ef = EfficientFrontierCalculator(self.prices, mu="mean historical return", covariance_calculator=calculator)
+        weights = ef.calculate_efficient_frontier_weights(risk_free_rate=0.02)
+
+        dense = EfficientFrontier(ef._mu, calculator.calculate_covariance(self.prices))
+        dense.max_sharpe(risk_free_rate=0.02)
+        for ticker, weight in dense.clean_weights().items():
+            self.assertAlmostEqual(weights[ticker], weight, places=3)
+
+    def test_unknown_method(self):
+        self.assertIsInstance(get_covariance_calculator("oas"), OASCovarianceCalculator)
+        with self.assertRaises(ValueError):
+            get_covariance_calculator("unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.DataAlignment import (DataAlignment, FXRates, clear_aligned_prices_cache, currency_of,
+                                              get_aligned_prices)
+from PortfolioOptimizer.DataSource import ReplayDataSource
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+from PortfolioOptimizer.PricePanel import PricePanel
+
+NAN = np.nan
+
+
+def _prices():
+    # A London listing closed on the 3rd, a US one on the 4th, and a European one suspended from the 5th
+    dates = pd.to_datetime(["2023-01-02", "2023-01-03", "2023-01-04", "2023-01-05", "2023-01-06", "2023-01-09",
+                            "2023-01-10"])
+    return pd.DataFrame({
+        "AGED.L": [100.0, NAN, 102.0, 103.0, 104.0, 105.0, 106.0],
+        "GOOGL": [10.0, 11.0, NAN, 12.0, 13.0, 14.0, 15.0],
+        "VWCE.DE": [50.0, 51.0, 52.0, NAN, NAN, NAN, 53.0],
+    }, index=dates)
+
+
+class TestDataAlignment(unittest.TestCase):
+    def setUp(self):
+        clear_aligned_prices_cache()
+
+    def test_currency_of(self):
+        self.assertEqual(currency_of("AGED.L"), "GBp")
+        self.assertEqual(currency_of("VWCE.DE"), "EUR")
+        self.assertEqual(currency_of("NQ=F"), "USD")
+        self.assertEqual(currency_of("BRK.B"), "USD")
+
+    def test_union_fills_up_to_the_limit(self):
+        aligned = DataAlignment(ffill_limit=2).align(_prices())
+        prices = aligned.prices
+        self.assertEqual(prices.loc["2023-01-03", "AGED.L"], 100.0)
+        self.assertEqual(prices.loc["2023-01-04", "GOOGL"], 11.0)
+        np.testing.assert_array_equal(prices["VWCE.DE"], [50.0, 51.0, 52.0, 52.0, 52.0, NAN, 53.0])
+        self.assertEqual(aligned.report["filled"], {"AGED.L": 1, "GOOGL": 1, "VWCE.DE": 2})
+        self.assertEqual(aligned.report["dropped_dates"], 0)
+
+        # The suspension is left out of the statistics rather than being a flat price
+        returns = aligned.market_state.returns["VWCE.DE"]
+        self.assertTrue(np.isnan(returns.loc["2023-01-10"]))
+        self.assertEqual(aligned.market_state.counts["VWCE.DE"], 4)
+
+        unlimited = DataAlignment(ffill_limit=None).align(_prices()).prices
+        self.assertFalse(unlimited.isna().any().any())
+
+    def test_intersection_is_dropna(self):
+        aligned = DataAlignment(calendar="intersection").align(_prices())
+        pd.testing.assert_frame_equal(aligned.prices, _prices().dropna())
+        self.assertEqual(aligned.report["dropped_dates"], 5)
+        with self.assertRaises(ValueError):
+            DataAlignment(calendar="exchange")
+
+    def test_fx_conversion(self):
+        prices = _prices()
+        fx_dates = pd.bdate_range("2022-12-26", "2023-01-10")
+        source = ReplayDataSource(pd.DataFrame({"GBPUSD=X": 1.25, "EURUSD=X": np.linspace(1.05, 1.10, len(fx_dates))},
+                                               index=fx_dates))
+        fx = FXRates(MarketDataProvider(source))
+        alignment = DataAlignment(ffill_limit=None, base_currency="USD", fx=fx)
+
+        with patch.object(source, "download", wraps=source.download) as download:
+            aligned = alignment.align(PricePanel.from_frame(prices, dtype=np.float64))
+            alignment.align(prices)
+        self.assertEqual(download.call_count, 2)
+
+        euro = source.bars["Adj Close"]["EURUSD=X"].reindex(prices.index)
+        np.testing.assert_allclose(aligned.prices["AGED.L"], prices["AGED.L"].ffill() * 1.25 / 100)
+        np.testing.assert_allclose(aligned.prices["VWCE.DE"], prices["VWCE.DE"].ffill() * euro)
+        pd.testing.assert_series_equal(aligned.prices["GOOGL"], prices["GOOGL"].ffill(), check_index=False)
+        self.assertEqual(aligned.report["converted"], {"AGED.L": "GBp", "VWCE.DE": "EUR"})
+
+        with self.assertRaises(ValueError):
+            DataAlignment(base_currency="CHF", fx=fx).align(prices)
+
+    def test_aligned_prices_are_cached(self):
+        alignment = DataAlignment()
+        first = get_aligned_prices(_prices(), alignment)
+        self.assertIs(get_aligned_prices(_prices(), DataAlignment()), first)
+        self.assertIsNot(get_aligned_prices(_prices(), DataAlignment(calendar="intersection")), first)
+        changed = _prices()
+        changed.iloc[0, 0] = 99.0
+        self.assertIsNot(get_aligned_prices(changed, alignment), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
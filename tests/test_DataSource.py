@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.DataSource import (CompositeDataSource, LocalFileDataSource, ReplayDataSource,
+                                           YFinanceDataSource, data_source_from_env)
+from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+
+
+def _prices(tickers, days=30, start="2023-01-02", seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.01, (days, len(tickers)))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=pd.bdate_range(start, periods=days),
+                        columns=tickers)
+
+
+class TestDataSource(unittest.TestCase):
+    def test_local_files_round_trip(self):
+        prices = _prices(["AAPL", "^GSPC"])
+        for file_format in LocalFileDataSource.FORMATS:
+            with tempfile.TemporaryDirectory() as directory:
+                source = LocalFileDataSource(directory, file_format=file_format)
+                for ticker in prices.columns:
+                    source.write(ticker, pd.DataFrame({"Adj Close": prices[ticker], "Close": prices[ticker] + 1}))
+                self.assertTrue(os.path.exists(os.path.join(directory, f"%5EGSPC.{file_format}")))
+
+                data = source.download(["AAPL", "^GSPC", "MSFT"], "2023-01-03", "2023-01-06")
+                expected = prices.loc["2023-01-03":"2023-01-05"]
+                pd.testing.assert_frame_equal(data, expected, check_freq=False, check_names=False,
+                                              check_exact=False)
+                self.assertAlmostEqual(source.download(["AAPL"], field="Close")["AAPL"].iloc[0],
+                                       prices["AAPL"].iloc[0] + 1)
+                self.assertTrue(source.download(["MSFT"]).empty)
+
+    def test_replay_periods_end_on_the_data(self):
+        prices = _prices(["AAPL", "MSFT"], days=60)
+        source = ReplayDataSource(prices)
+        self.assertEqual(source.as_of, prices.index[-1].date())
+
+        data = source.download(["AAPL", "BAD"], period="1mo")
+        self.assertEqual(list(data.columns), ["AAPL"])
+        self.assertEqual(data.index[-1], prices.index[-1])
+        self.assertGreaterEqual(data.index[0], prices.index[-1] - pd.DateOffset(months=1))
+        self.assertTrue(source.download(["AAPL"], field="Volume").empty)
+
+    def test_record(self):
+        prices = _prices(["AAPL"])
+        recorded = ReplayDataSource.record(ReplayDataSource(prices), ["AAPL"], "2023-01-10", "2023-01-20")
+        self.assertEqual(recorded.as_of, date(2023, 1, 19))
+        pd.testing.assert_frame_equal(recorded.bars["Adj Close"], prices.loc["2023-01-10":"2023-01-19"],
+                                      check_freq=False)
+
+    def test_composite_falls_back(self):
+        prices = _prices(["AAPL", "MSFT"])
+        failing = MagicMock()
+        failing.download.side_effect = ConnectionError("down")
+        source = CompositeDataSource([failing, ReplayDataSource(prices[["AAPL"]]), ReplayDataSource(prices)])
+
+        data = source.download(["AAPL", "MSFT"], "2023-01-01", "2023-03-01")
+        pd.testing.assert_frame_equal(data, prices, check_freq=False)
+        with self.assertRaises(ConnectionError):
+            CompositeDataSource([failing]).download(["AAPL"])
+
+    @patch.dict(os.environ, {"MARKET_DATA_SOURCES": "csv, yfinance", "MARKET_DATA_DIR": "/tmp/bars"})
+    def test_from_env(self):
+        source = data_source_from_env()
+        self.assertIsInstance(source, CompositeDataSource)
+        self.assertEqual(source.sources[0].file_format, "csv")
+        self.assertIsInstance(source.sources[1], YFinanceDataSource)
+        with patch.dict(os.environ, {"MARKET_DATA_SOURCES": "bloomberg"}), self.assertRaises(ValueError):
+            data_source_from_env()
+
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download")
+    def test_injected_provider(self, mock_download):
+        prices = _prices(["AAPL", "^GSPC", "^IRX"], days=300, start="2022-01-03")
+        prices["^IRX"] = 4.0
+        provider = MarketDataProvider(ReplayDataSource(prices))
+
+        data, tickers = provider.get_data(["AAPL", "BAD"], "2022-01-01", "2023-03-01", return_updated_tickers=True)
+        self.assertEqual(tickers, ["AAPL"])
+        self.assertEqual(len(data), 300)
+
+        capm = CapmCalculator("2022-01-03", "2023-02-24", data_provider=provider)
+        self.assertAlmostEqual(capm.market_inputs.risk_free_rate, 0.04)
+        mock_download.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
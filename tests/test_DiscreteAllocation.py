@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from pypfopt.discrete_allocation import DiscreteAllocation
+
+from PortfolioOptimizer.DiscreteAllocation import DiscreteAllocator, latest_prices
+
+
+def _universe(assets=50, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = pd.Series(rng.uniform(5, 800, assets), index=[f"T{i}" for i in range(assets)])
+    weights = rng.dirichlet(np.ones(assets))
+    return prices, weights
+
+
+class TestDiscreteAllocation(unittest.TestCase):
+    def test_whole_shares_within_budget(self):
+        prices, weights = _universe()
+        allocator = DiscreteAllocator(prices)
+        shares, leftover = allocator.allocate_many(weights, 100000.0)
+        self.assertEqual(shares.dtype, np.int64)
+        self.assertTrue(np.all(shares >= 0))
+        self.assertAlmostEqual(shares[0] @ prices.to_numpy() + leftover[0], 100000.0, places=6)
+        # No asset short of its target is left that the cash could still pay for
+        shortfall = weights * 100000.0 - shares[0] * prices.to_numpy()
+        self.assertFalse(np.any((shortfall > 0) & (prices.to_numpy() <= leftover[0])))
+
+    def test_accounts_are_allocated_independently(self):
+        prices, _ = _universe()
+        rng = np.random.default_rng(1)
+        weights = rng.dirichlet(np.ones(len(prices)), size=20)
+        budgets = rng.uniform(1000, 1e6, 20)
+        allocator = DiscreteAllocator(prices)
+        shares, leftover = allocator.allocate_many(weights, budgets)
+        for account in range(20):
+            single, single_leftover = allocator.allocate_many(weights[account], budgets[account])
+            np.testing.assert_array_equal(shares[account], single[0])
+            self.assertAlmostEqual(leftover[account], single_leftover[0], places=6)
+
+    def test_milp_covers_at_least_the_greedy_shortfall(self):
+        prices, weights = _universe(assets=30, seed=2)
+        allocator = DiscreteAllocator(prices)
+        target = weights * 5000.0
+        greedy, _ = allocator.allocate_many(weights, 5000.0)
+        exact, leftover = allocator.allocate_many(weights, 5000.0, method="milp")
+        self.assertGreaterEqual(leftover[0], 0.0)
+        error = lambda shares: np.abs(target - shares[0] * prices.to_numpy()).sum()
+        self.assertLessEqual(error(exact), error(greedy) + 1e-9)
+
+    def test_less_leftover_than_pypfopt(self):
+        prices, weights = _universe(assets=100, seed=3)
+        ours = DiscreteAllocator(prices).allocate(dict(zip(prices.index, weights)), 1e6)
+        _, theirs = DiscreteAllocation(dict(zip(prices.index, weights)), prices,
+                                       total_portfolio_value=1e6).greedy_portfolio()
+        self.assertLessEqual(ours["leftover"], theirs)
+        self.assertLess(ours["leftover"], prices.min())
+
+    def test_tracking_error(self):
+        prices = pd.Series([100.0, 50.0], index=["A", "B"])
+        covariance = pd.DataFrame([[0.04, 0.0], [0.0, 0.09]], index=["A", "B"], columns=["A", "B"])
+        result = DiscreteAllocator(prices).allocate({"A": 0.5, "B": 0.5}, 1000.0, covariance=covariance)
+        self.assertEqual(result["shares"], {"A": 5, "B": 10})
+        self.assertEqual(result["leftover"], 0.0)
+        self.assertAlmostEqual(result["tracking_error"], 0.0)
+
+        result = DiscreteAllocator(prices).allocate({"A": 0.5, "B": 0.5}, 1040.0, covariance=covariance)
+        self.assertGreater(result["tracking_error"], 0.0)
+        self.assertIsNone(DiscreteAllocator(prices).allocate({"A": 1.0}, 1000.0)["tracking_error"])
+
+    def test_invalid_inputs(self):
+        allocator = DiscreteAllocator(pd.Series([100.0, np.nan], index=["A", "B"]))
+        with self.assertRaises(ValueError):
+            allocator.allocate({"A": 1.0}, 1000.0, method="round")
+        with self.assertRaises(ValueError):
+            allocator.allocate({"A": -0.5, "B": 1.5}, 1000.0)
+        with self.assertRaises(ValueError):
+            allocator.allocate({"B": 1.0}, 1000.0)
+        with self.assertRaises(ValueError):
+            allocator.allocate({"C": 1.0}, 1000.0)
+        # An asset without a price is fine as long as nothing is bought of it
+        self.assertEqual(allocator.allocate({"A": 1.0, "B": 0.0}, 1000.0)["shares"], {"A": 10})
+
+    def test_latest_prices(self):
+        prices = pd.DataFrame({"A": [1.0, 2.0, np.nan], "B": [3.0, 4.0, 5.0]})
+        pd.testing.assert_series_equal(latest_prices(prices), pd.Series({"A": 2.0, "B": 5.0}), check_names=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
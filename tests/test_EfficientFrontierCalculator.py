@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator, trade_list
+from PortfolioOptimizer.HRPCalculator import InfeasibleConstraintsError
+
+
+def _prices(days=400, assets=8, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0006, 0.012, (days, assets))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=pd.bdate_range("2021-01-04", periods=days),
+                        columns=[f"A{i}" for i in range(assets)])
+
+
+class TestRebalancing(unittest.TestCase):
+    def setUp(self):
+        self.ef = EfficientFrontierCalculator(_prices(), mu="mean historical return")
+        self.tickers = self.ef.get_data().columns
+        self.current = dict.fromkeys(self.tickers, 1 / len(self.tickers))
+
+    def test_without_costs_matches_optimizing_from_scratch(self):
+        weights = self.ef.calculate_rebalance_weights(self.current)
+        scratch = EfficientFrontierCalculator(_prices(), mu="mean historical return")
+        expected = scratch.calculate_efficient_frontier_weights()
+        np.testing.assert_allclose(list(weights.values()), list(expected.values()), atol=1e-3)
+        # The performance is the one of the rebalanced portfolio
+        self.assertAlmostEqual(self.ef.calculate_efficient_frontier_performance()[0],
+                               scratch.calculate_efficient_frontier_performance()[0], places=3)
+
+    def test_costs_and_limits_reduce_trading(self):
+        free = trade_list(self.current, self.ef.calculate_rebalance_weights(self.current), 10000)
+        for objective in ("max_sharpe", "min_volatility"):
+            limited = self.ef.calculate_rebalance_weights(self.current, objective=objective, max_turnover=0.1)
+            self.assertLessEqual(trade_list(self.current, limited, 10000)["turnover"], 0.1 + 1e-4)
+            self.assertAlmostEqual(sum(limited.values()), 1, places=3)
+
+            capped = self.ef.calculate_rebalance_weights(self.current, objective=objective, max_trade=0.02)
+            self.assertTrue(all(abs(capped[ticker] - self.current[ticker]) <= 0.02 + 1e-4 for ticker in capped))
+
+        costly = self.ef.calculate_rebalance_weights(self.current, proportional_cost=0.01)
+        self.assertLess(trade_list(self.current, costly, 10000)["turnover"], free["turnover"])
+
+        # A fixed cost prunes the small trades
+        fixed = trade_list(self.current, self.ef.calculate_rebalance_weights(self.current, fixed_cost=25.0), 10000,
+                           fixed_cost=25.0)
+        self.assertLess(len(fixed["trades"]), len(free["trades"]))
+
+    def test_accounts_are_rebalanced_as_if_alone(self):
+        rng = np.random.default_rng(1)
+        current = pd.DataFrame(rng.dirichlet(np.ones(len(self.tickers)), 5) * 0.95, columns=self.tickers)
+        self.ef.REBALANCE_ACCOUNTS_PER_SOLVE = 2
+        options = {"proportional_cost": 0.002, "fixed_cost": 5.0, "max_turnover": 0.3}
+        targets = self.ef.rebalance_accounts(current, portfolio_values=[1e4, 2e4, 5e4, 1e5, 1e6], **options)
+        # Three groups of two accounts, the last one padded
+        self.assertEqual(self.ef.solver_timing["cached"], self.ef.solver_timing["solves"] - 1)
+        for account, value in zip(range(5), [1e4, 2e4, 5e4, 1e5, 1e6]):
+            alone = self.ef.rebalance_accounts(current.iloc[[account]], portfolio_values=value, **options)
+            np.testing.assert_allclose(targets.iloc[account], alone.iloc[0], atol=1e-5)
+        self.assertTrue(np.all(np.abs(targets.to_numpy() - current.to_numpy()).sum(axis=1) <= 0.3 + 1e-5))
+
+    def test_positions_outside_the_universe_are_sold(self):
+        current = {**dict.fromkeys(self.tickers, 0.1), "OTHER": 0.2}
+        weights = self.ef.calculate_rebalance_weights(current, max_turnover=0.5)
+        trades = trade_list(current, weights, 10000)
+        self.assertEqual(trades["trades"][0], {"ticker": "OTHER", "action": "sell", "weight": -0.2,
+                                               "value": -2000.0})
+        self.assertLessEqual(trades["turnover"], 0.5 + 1e-4)
+        with self.assertRaises(InfeasibleConstraintsError):
+            self.ef.calculate_rebalance_weights(current, max_turnover=0.3)
+        with self.assertRaises(InfeasibleConstraintsError):
+            self.ef.calculate_rebalance_weights(dict.fromkeys(self.tickers, 0.05), max_trade=0.01)
+
+    def test_trade_list(self):
+        trades = trade_list({"A": 0.5, "B": 0.5}, {"A": 0.2, "B": 0.6, "C": 0.2}, 1000, proportional_cost=0.01,
+                            fixed_cost=1.0)
+        self.assertEqual([trade["ticker"] for trade in trades["trades"]], ["A", "C", "B"])
+        self.assertEqual(trades["trades"][0]["action"], "sell")
+        self.assertAlmostEqual(trades["turnover"], 0.6)
+        self.assertAlmostEqual(trades["transaction_cost"], 0.6 * 1000 * 0.01 + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
+import datetime
 import unittest
 from unittest.mock import MagicMock, patch
+import numpy as np
 import pandas as pd
-from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator, MeanHistoricalReturnCalculator
+from PortfolioOptimizer.ExpectedReturnCalculator import CapmCalculator, MarketInputs, \
+    MeanHistoricalReturnCalculator, clear_market_inputs_cache, get_market_inputs
 
 class TestMeanHistoricalReturnCalculator(unittest.TestCase):
     def test_calculate_expected_return(self):
@@ -17,6 +20,9 @@ class TestMeanHistoricalReturnCalculator(unittest.TestCase):
         self.assertEqual(len(result), 2)
 
 class TestCapmCalculator(unittest.TestCase):
+    def setUp(self):
+        clear_market_inputs_cache()
+
     @patch("PortfolioOptimizer.ExpectedReturnCalculator.md")
     def test_calculate_risk_free_rate(self, mock_md):
         # Mock get_data for ^IRX
@@ -35,5 +41,67 @@ class TestCapmCalculator(unittest.TestCase):
         mkt_ret = capm.calculate_market_return()
         self.assertIsInstance(mkt_ret, float)
 
+    @patch("PortfolioOptimizer.ExpectedReturnCalculator.md")
+    def test_calculate_beta_vectorized(self, mock_md):
+        dates = pd.bdate_range("2020-01-01", "2022-12-31")
+        rng = np.random.default_rng(0)
+        market = pd.Series(100 * np.cumprod(1 + rng.normal(0, 0.01, len(dates))), index=dates)
+        mock_md.get_data.return_value = market.to_frame("^GSPC")
+
+        market_returns = market.pct_change().fillna(0)
+        prices = pd.DataFrame({
+            "DOUBLE": 100 * np.cumprod(1 + 2 * market_returns),
+            "NOISY": 100 * np.cumprod(1 + rng.normal(0, 0.01, len(dates))),
+        }, index=dates)
+        # Ragged history: NOISY only starts trading in 2021
+        prices.loc[:"2020-12-31", "NOISY"] = np.nan
+
+        capm = CapmCalculator("2020-01-01", "2022-12-31")
+        betas = capm.calculate_beta(["DOUBLE", "NOISY", "MISSING"], prices=prices)
+
+        # Reference: one series at a time, as the original implementation did
+        monthly_market = market.resample('ME').last().pct_change().dropna()
+        monthly_noisy = prices["NOISY"].dropna().resample('ME').last().pct_change().dropna()
+        stock, mkt = monthly_noisy.align(monthly_market, join='inner')
+        expected_noisy = np.cov(stock, mkt)[0, 1] / np.var(mkt, ddof=1)
+
+        self.assertAlmostEqual(betas["NOISY"], expected_noisy, places=10)
+        self.assertAlmostEqual(betas["DOUBLE"], 2.0, places=1)
+        self.assertEqual(betas["MISSING"], 0.0)
+        mock_md.get_data.assert_called_once()
+
+    @patch("PortfolioOptimizer.ExpectedReturnCalculator.md")
+    def test_market_inputs_downloaded_once(self, mock_md):
+        def get_data(tickers, **kwargs):
+            if tickers == ['^IRX']:
+                return pd.Series([2.0], index=[pd.Timestamp("2023-01-02")])
+            dates = pd.bdate_range("2023-01-02", "2023-06-30")
+            trend = 100 + np.arange(len(dates), dtype=float)
+            return pd.DataFrame({ticker: trend * (i + 1) for i, ticker in enumerate(tickers)}, index=dates)
+        mock_md.get_data.side_effect = get_data
+
+        prices = get_data(["AAPL", "MSFT"])
+        CapmCalculator("2023-01-02", "2023-06-30").calculate_expected_return(["AAPL", "MSFT"], prices=prices)
+        CapmCalculator(pd.Timestamp("2023-01-02"), pd.Timestamp("2023-06-30")).calculate_expected_return(
+            ["AAPL", "MSFT"], prices=prices)
+
+        requested = [call.args[0] for call in mock_md.get_data.call_args_list]
+        self.assertEqual(sorted(requested), [['^GSPC'], ['^IRX']])
+
+    def test_market_inputs_refreshed_every_day(self):
+        with patch("PortfolioOptimizer.ExpectedReturnCalculator._today", return_value=datetime.date(2024, 3, 4)):
+            inputs = get_market_inputs("2023-01-02", "2024-03-04")
+            self.assertIs(get_market_inputs("2023-01-02", "2024-03-04"), inputs)
+        with patch("PortfolioOptimizer.ExpectedReturnCalculator._today", return_value=datetime.date(2024, 3, 5)):
+            self.assertIsNot(get_market_inputs("2023-01-02", "2024-03-04"), inputs)
+
+    def test_market_risk_aversion(self):
+        rng = np.random.default_rng(0)
+        dates = pd.bdate_range("2023-01-02", periods=500)
+        market_prices = pd.Series(100 * np.cumprod(1 + rng.normal(0.0005, 0.01, 500)), index=dates)
+        inputs = MarketInputs(dates[0], dates[-1], risk_free_rate=0.02, market_prices=market_prices)
+        variance = market_prices.pct_change().var() * 252
+        self.assertAlmostEqual(inputs.market_risk_aversion, (inputs.market_return - 0.02) / variance)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
 import numpy as np
+from pypfopt import HRPOpt
 from PortfolioOptimizer.HRPCalculator import HRPCalculator
 
 @pytest.fixture
@@ -30,3 +31,22 @@ def test_hrp_calculate_performance(mock_price_data):
     assert isinstance(exp_ret, float)
     assert isinstance(vol, float)
     assert isinstance(sharpe, float)
+
+@pytest.mark.parametrize("linkage_method", ["single", "ward", "average"])
+def test_hrp_matches_reference_implementation(linkage_method):
+    rng = np.random.default_rng(0)
+    factors = rng.normal(0, 0.01, (500, 3))
+    returns = pd.DataFrame(factors @ rng.normal(0, 1, (3, 30)) + rng.normal(0, 0.01, (500, 30)),
+                           columns=[f"T{i:02d}" for i in range(30)])
+
+    hrp = HRPCalculator(returns=returns, linkage_method=linkage_method)
+    weights = hrp.calculate_weights(cutoff=0, rounding=None)
+    expected = HRPOpt(returns=returns).optimize(linkage_method)
+
+    assert list(weights) == sorted(expected)
+    for ticker, weight in expected.items():
+        assert weights[ticker] == pytest.approx(weight, abs=1e-12)
+
+def test_hrp_invalid_linkage(mock_price_data):
+    with pytest.raises(ValueError):
+        HRPCalculator(mock_price_data, linkage_method="centroid")
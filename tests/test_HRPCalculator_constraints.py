@@ -1,7 +1,7 @@
 import unittest
 import pandas as pd
 import numpy as np
-from PortfolioOptimizer.HRPCalculator import HRPCalculator
+from PortfolioOptimizer.HRPCalculator import HRPCalculator, InfeasibleConstraintsError
 
 class TestHRPCalculatorConstraints(unittest.TestCase):
     def setUp(self):
@@ -53,16 +53,31 @@ class TestHRPCalculatorConstraints(unittest.TestCase):
 
     def test_impossible_constraints(self):
         # If constraints sum to < 1 (e.g. all max 0.1 for 4 assets = max 0.4 total)
-        # The algorithm should do its best (cap all at 0.1) and return sum < 1
+        # no fully invested portfolio satisfies them
         constraints = {"A": 0.1, "B": 0.1, "C": 0.1, "D": 0.1}
+        with self.assertRaises(InfeasibleConstraintsError):
+            self.hrp.calculate_weights(constraints=constraints)
+
+        with self.assertRaises(InfeasibleConstraintsError):
+            self.hrp.calculate_weights(min_weights={"A": 0.6, "B": 0.6})
+
+    def test_tight_constraints(self):
+        # Bounds that only allow a single portfolio
+        constraints = {"A": 0.1, "B": 0.3, "C": 0.3, "D": 0.3}
         weights = self.hrp.calculate_weights(constraints=constraints)
-        
-        self.assertLessEqual(weights["A"], 0.10001)
-        self.assertLessEqual(weights["B"], 0.10001)
-        self.assertLessEqual(weights["C"], 0.10001)
-        self.assertLessEqual(weights["D"], 0.10001)
-        # Sum should be approx 0.4
-        self.assertAlmostEqual(sum(weights.values()), 0.4, places=1)
+        self.assertEqual(weights, constraints)
+
+    def test_min_weights(self):
+        natural_weights = self.hrp.calculate_weights()
+        smallest = min(natural_weights, key=natural_weights.get)
+
+        weights = self.hrp.calculate_weights(min_weights={smallest: 0.4})
+        self.assertAlmostEqual(weights[smallest], 0.4, places=4)
+        self.assertAlmostEqual(sum(weights.values()), 1.0, places=4)
+        # The other assets keep their relative HRP weights
+        others = [ticker for ticker in weights if ticker != smallest]
+        ratios = [weights[ticker] / natural_weights[ticker] for ticker in others]
+        self.assertAlmostEqual(min(ratios), max(ratios), places=3)
 
     def test_zero_constraint(self):
         constraints = {"A": 0.0}
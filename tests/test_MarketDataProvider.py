@@ -33,5 +33,32 @@ class TestMarketDataProvider(unittest.TestCase):
         self.assertFalse(data.empty)
         self.assertEqual(tickers, ["AAPL"])
 
+        # Still callable on the class, with the process-wide source
+        data, tickers = MarketDataProvider.get_data(["AAPL"], "2023-01-01", "2023-01-02", return_updated_tickers=True)
+        self.assertEqual(tickers, ["AAPL"])
+
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.Ticker")
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download")
+    def test_get_data_validates_from_bulk_download(self, mock_download, mock_ticker):
+        MarketDataProvider.ticker_validity.clear()
+        end = pd.Timestamp.today().normalize()
+        dates = pd.bdate_range(end=end, periods=3)
+        columns = pd.MultiIndex.from_product([["Adj Close", "Close"], ["AAPL", "BAD"]])
+        mock_download.return_value = pd.DataFrame(
+            [[150.0, float("nan"), 150.0, float("nan")]] * 3, index=dates, columns=columns)
+
+        provider = MarketDataProvider()
+        data, tickers = provider.get_data(["AAPL", "BAD"], str(dates[0].date()), str(end.date()),
+                                          return_updated_tickers=True)
+
+        self.assertEqual(tickers, ["AAPL"])
+        self.assertEqual(list(data.columns), ["AAPL"])
+        mock_ticker.assert_not_called()
+        self.assertFalse(MarketDataProvider.ticker_validity.get("BAD"))
+
+        # Known-bad symbols are not requested again
+        provider.get_data(["AAPL", "BAD"], str(dates[0].date()), str(end.date()))
+        self.assertEqual(mock_download.call_args[0][0], ["AAPL"])
+
 if __name__ == '__main__':
     unittest.main()
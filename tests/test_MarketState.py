@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from pypfopt import expected_returns, risk_models
+
+from PortfolioOptimizer.MarketState import MarketState, clear_market_state_cache, get_market_state
+
+
+def _prices(days=300, assets=5, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, (days, assets)), axis=0)),
+                          index=pd.bdate_range("2022-01-03", periods=days),
+                          columns=[f"T{i}" for i in range(assets)])
+    # An asset listed later and a few missing days, as with assets traded on different exchanges
+    prices.iloc[:40, 1] = np.nan
+    prices.iloc[100:103, 2] = np.nan
+    return prices
+
+
+class TestMarketState(unittest.TestCase):
+    def setUp(self):
+        clear_market_state_cache()
+
+    def test_matches_pypfopt(self):
+        prices = _prices()
+        state = MarketState(prices)
+
+        np.testing.assert_allclose(state.covariance, risk_models.sample_cov(prices), atol=1e-14)
+        np.testing.assert_allclose(state.mean_historical_return(), expected_returns.mean_historical_return(prices),
+                                   atol=1e-14)
+        np.testing.assert_allclose(state.mean_historical_return(compounding=False),
+                                   expected_returns.mean_historical_return(prices, compounding=False), atol=1e-14)
+
+    def test_extended_matches_full_computation(self):
+        prices = _prices()
+        full = MarketState(prices)
+        # Starts before the late asset has any return
+        extended = MarketState(prices.iloc[:20]).extended(prices.iloc[20:200]).extended(prices.iloc[200:])
+
+        pd.testing.assert_frame_equal(extended.returns, full.returns)
+        np.testing.assert_allclose(extended.daily_covariance, full.daily_covariance, atol=1e-16)
+        np.testing.assert_allclose(extended.mean_historical_return(), full.mean_historical_return(), rtol=1e-12)
+        self.assertEqual(extended.counts.tolist(), full.counts.tolist())
+
+    def test_get_market_state_extends_cached_state(self):
+        prices = _prices()
+        first = get_market_state(prices.iloc[:250])
+        self.assertIs(get_market_state(prices.iloc[:250]), first)
+
+        second = get_market_state(prices)
+        self.assertEqual(len(second.returns), len(prices) - 1)
+        self.assertEqual(len(first.returns), 249)
+        np.testing.assert_allclose(second.covariance, MarketState(prices).covariance, atol=1e-14)
+
+        # Changed history: recomputed rather than extended
+        revised = prices.copy()
+        revised.iloc[10, 0] *= 1.1
+        np.testing.assert_allclose(get_market_state(revised).covariance, risk_models.sample_cov(revised), atol=1e-14)
+
+    def test_get_market_state_cache_is_bounded_in_bytes(self):
+        prices = _prices()
+        size = MarketState(prices).nbytes
+        with patch("PortfolioOptimizer.MarketState._MARKET_STATE_CACHE_MAX_BYTES", int(2.5 * size)):
+            states = [get_market_state(prices.iloc[start:]) for start in range(3)]
+            # The least recently used state was evicted to make room for the third one
+            self.assertIsNot(get_market_state(prices), states[0])
+            self.assertIs(get_market_state(prices.iloc[2:]), states[2])
+
+    def test_rolled_matches_full_computation(self):
+        returns = MarketState(_prices(days=1000)).returns
+        lookback = 120
+        state = MarketState(returns=returns.iloc[:lookback])
+        end = lookback
+        while end + 21 <= len(returns):
+            state = state.rolled(returns.iloc[end:end + 21], dropped=21)
+            end += 21
+        full = MarketState(returns=returns.iloc[end - lookback:end])
+
+        pd.testing.assert_frame_equal(state.returns, full.returns)
+        np.testing.assert_allclose(state.daily_covariance, full.daily_covariance, atol=1e-16)
+        np.testing.assert_allclose(state.mean_historical_return(), full.mean_historical_return(), rtol=1e-12)
+        self.assertEqual(state.counts.tolist(), full.counts.tolist())
+
+    def test_subset_matches_own_state(self):
+        prices = _prices()
+        union = MarketState(prices)
+        for tickers in (["T1", "T3"], ["T2", "T0", "T4"], ["T1"]):
+            subset = union.subset(tickers)
+            own = MarketState(prices[tickers].dropna(how="all"))
+            pd.testing.assert_frame_equal(subset.returns, own.returns)
+            np.testing.assert_allclose(subset.covariance, own.covariance, atol=1e-16)
+            np.testing.assert_allclose(subset.mean_historical_return(), own.mean_historical_return(), rtol=1e-12)
+
+        # A day where only the other assets have a price is not a flat day for the subset
+        prices.iloc[150, [0, 3]] = np.nan
+        subset = MarketState(prices).subset(["T0", "T3"])
+        own = MarketState(prices[["T0", "T3"]].dropna(how="all"))
+        self.assertEqual(len(subset.returns), len(own.returns))
+        np.testing.assert_allclose(subset.covariance, own.covariance, atol=1e-16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PortfolioOptimizer.MonteCarloSimulator import MonteCarloSimulator
 
 @pytest.fixture
@@ -25,3 +26,63 @@ def test_monte_carlo_simulate(mock_simulation_inputs):
     assert len(results["days"]) == 50 # 0 to 49
     assert len(results["p50"]) == 50
     assert results["p50"][0] == initial_value
+
+def test_monte_carlo_seed_is_reproducible(mock_simulation_inputs):
+    mu, S, weights, initial_value = mock_simulation_inputs
+    simulator = MonteCarloSimulator(mu, S, weights, initial_value)
+
+    first = simulator.simulate(num_simulations=500, time_horizon=30, seed=42, chunk_size=128)
+    second = simulator.simulate(num_simulations=500, time_horizon=30, seed=42, chunk_size=128)
+    # Everything but the measured throughput
+    first.pop("throughput")
+    second.pop("throughput")
+    assert first == second
+
+def test_monte_carlo_percentiles_match_reference(mock_simulation_inputs):
+    mu, S, weights, initial_value = mock_simulation_inputs
+    simulator = MonteCarloSimulator(mu, S, weights, initial_value)
+    # Small blocks so that paths are generated over several time blocks and chunks
+    simulator.BLOCK_SIZE = 2 ** 12
+    results = simulator.simulate(num_simulations=20000, time_horizon=100, seed=0, chunk_size=5000)
+
+    # Reference: buy and hold of correlated GBM assets, simulated directly
+    rng = np.random.default_rng(1)
+    w = np.array([weights["A"], weights["B"]])
+    L = np.linalg.cholesky(S.values / 252)
+    drift = (mu.values - 0.5 * np.diag(S.values)) / 252
+    log_prices = np.cumsum(rng.standard_normal((20000, 99, 2)) @ L.T + drift, axis=1)
+    values = initial_value * (np.exp(log_prices) @ w)
+
+    for q in (10, 50, 90):
+        assert results[f"p{q}"][-1] == pytest.approx(np.percentile(values[:, -1], q), rel=0.01)
+    assert results["final_mean"] == pytest.approx(values[:, -1].mean(), rel=0.01)
+    assert results["final_min"] <= results["p10"][-1] <= results["p90"][-1] <= results["final_max"]
+
+def test_monte_carlo_same_results_for_any_worker_count(mock_simulation_inputs):
+    mu, S, weights, initial_value = mock_simulation_inputs
+    simulator = MonteCarloSimulator(mu, S, weights, initial_value)
+
+    serial = simulator.simulate(num_simulations=1000, time_horizon=20, seed=7, chunk_size=100)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        parallel = simulator.simulate(num_simulations=1000, time_horizon=20, seed=7, chunk_size=100,
+                                      max_workers=3, executor=executor)
+
+    assert len(serial.pop("throughput")) == 1
+    throughput = parallel.pop("throughput")
+    assert [worker["paths"] for worker in throughput] == [300, 300, 400]
+    assert all(worker["paths_per_second"] > 0 for worker in throughput)
+    assert serial == parallel
+
+def test_monte_carlo_progressive_batches_merge_to_simulate(mock_simulation_inputs):
+    mu, S, weights, initial_value = mock_simulation_inputs
+    simulator = MonteCarloSimulator(mu, S, weights, initial_value)
+
+    batches = simulator.progressive_batches(num_simulations=5000, seed=7, chunk_size=512)
+    assert [sum(paths for _, paths in batch) for batch in batches] == [512, 512, 1024, 2048, 904]
+
+    statistics = simulator.simulate_batch(batches[0], time_horizon=30)
+    for batch in batches[1:]:
+        statistics.merge(simulator.simulate_batch(batch, time_horizon=30))
+    expected = simulator.simulate(num_simulations=5000, time_horizon=30, seed=7, chunk_size=512)
+    expected.pop("throughput")
+    assert statistics.to_dict() == expected
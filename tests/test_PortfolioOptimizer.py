@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import MagicMock
 import pandas as pd
 import numpy as np
+import cvxpy as cp
 from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator
 
 class TestPortfolioOptimizer(unittest.TestCase):
@@ -35,5 +36,40 @@ class TestPortfolioOptimizer(unittest.TestCase):
         performance = self.calculator.calculate_efficient_frontier_performance()
         self.assertEqual(len(performance), 3)
 
+class TestEfficientFrontierSweep(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        dates = pd.date_range(start="2020-01-01", periods=500)
+        returns = rng.normal(0.0005, 0.01, (500, 8)) + rng.normal(0, 0.01, (500, 1))
+        self.data = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates,
+                                 columns=[f"A{i}" for i in range(8)])
+        self.calculator = EfficientFrontierCalculator(self.data, mu="mean historical return")
+
+    def test_frontier_by_return(self):
+        frontier = self.calculator.calculate_frontier(n_points=20)
+        self.assertEqual(len(frontier["returns"]), 20)
+        self.assertTrue(np.all(np.diff(frontier["returns"]) > 0))
+        # Volatility increases along the efficient frontier
+        self.assertTrue(np.all(np.diff(frontier["volatilities"]) > -1e-9))
+        for weights in frontier["weights"]:
+            self.assertAlmostEqual(sum(weights), 1.0, places=4)
+            self.assertTrue(min(weights) >= 0)
+
+        # Every point is the minimum volatility portfolio for its target return
+        mu = self.calculator._mu.to_numpy()
+        Sigma = self.calculator._Sigma.to_numpy()
+        w = cp.Variable(len(mu))
+        for i in (3, 10, 17):
+            problem = cp.Problem(cp.Minimize(cp.quad_form(w, Sigma)),
+                                 [cp.sum(w) == 1, w >= 0, mu @ w >= frontier["returns"][i]])
+            problem.solve()
+            self.assertAlmostEqual(frontier["volatilities"][i], np.sqrt(problem.value), places=5)
+
+    def test_frontier_by_risk(self):
+        frontier = self.calculator.calculate_frontier(n_points=10, by="risk")
+        volatilities = frontier["volatilities"]
+        np.testing.assert_allclose(np.diff(volatilities), volatilities[1] - volatilities[0], rtol=1e-4)
+        self.assertTrue(np.all(np.diff(frontier["returns"]) > 0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator
+from PortfolioOptimizer.HRPCalculator import HRPCalculator
+from PortfolioOptimizer.MarketState import MarketState
+from PortfolioOptimizer.PricePanel import PricePanel
+
+
+def _prices(days=300, assets=5, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.01, (days, assets))
+    prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=pd.bdate_range("2022-01-03", periods=days),
+                          columns=list("ABCDE")[:assets])
+    prices.iloc[:20, 0] = np.nan
+    return prices
+
+
+class TestPricePanel(unittest.TestCase):
+    def test_frame_shares_the_array(self):
+        prices = _prices()
+        panel = PricePanel.from_frame(prices)
+        self.assertEqual(panel.dtype, np.float32)
+        self.assertTrue(panel.values.flags['C_CONTIGUOUS'])
+        self.assertEqual(panel.nbytes, prices.to_numpy().nbytes // 2)
+
+        frame = panel.to_frame()
+        self.assertTrue(np.shares_memory(frame.to_numpy(), panel.values))
+        self.assertEqual(list(frame.columns), list(prices.columns))
+        pd.testing.assert_frame_equal(frame, prices.astype(np.float32), check_freq=False, check_names=False)
+
+        self.assertIs(PricePanel(panel.values, panel.dates, panel.tickers).values, panel.values)
+        with self.assertRaises(ValueError):
+            PricePanel(panel.values, panel.dates, panel.tickers, dtype=np.int64)
+
+    def test_from_columns(self):
+        panel = PricePanel.from_columns({
+            "A": pd.Series([1.0, 2.0], index=pd.to_datetime(["2023-01-02", "2023-01-04"])),
+            "B": pd.Series([3.0, 4.0], index=pd.to_datetime(["2023-01-03", "2023-01-04"])),
+        }, dtype=np.float64)
+        expected = pd.DataFrame({"A": [1.0, np.nan, 2.0], "B": [np.nan, 3.0, 4.0]},
+                                index=pd.to_datetime(["2023-01-02", "2023-01-03", "2023-01-04"]))
+        pd.testing.assert_frame_equal(panel.to_frame(), expected, check_names=False)
+        self.assertTrue(PricePanel.from_columns({}).empty)
+
+    def test_subset_and_between(self):
+        prices = _prices()
+        panel = PricePanel.from_frame(prices)
+        window = panel.between("2022-02-01", "2022-03-01")
+        self.assertTrue(np.shares_memory(window.values, panel.values))
+        pd.testing.assert_frame_equal(window.to_frame(), prices.loc["2022-02-01":"2022-02-28"].astype(np.float32),
+                                      check_freq=False, check_names=False)
+        self.assertEqual(panel.subset(["C", "A"]).to_frame()["A"].iloc[-1], np.float32(prices["A"].iloc[-1]))
+        with self.assertRaises(ValueError):
+            panel.subset(["Z"])
+
+    def test_estimators_take_panels(self):
+        prices = _prices()
+        panel = PricePanel.from_frame(prices)
+        state = MarketState(panel)
+        expected = MarketState(prices)
+        self.assertEqual(state.returns.dtypes.unique().tolist(), [np.float64])
+        np.testing.assert_allclose(state.covariance, expected.covariance, rtol=1e-4, atol=1e-6)
+        np.testing.assert_allclose(state.mean_historical_return(), expected.mean_historical_return(), rtol=1e-4)
+
+        weights = HRPCalculator(panel).calculate_weights()
+        for ticker, weight in HRPCalculator(prices).calculate_weights().items():
+            self.assertAlmostEqual(weights[ticker], weight, places=4)
+
+        weights = EfficientFrontierCalculator(panel, mu="mean historical return").calculate_min_volatility_weights()
+        expected = EfficientFrontierCalculator(prices, mu="mean historical return").calculate_min_volatility_weights()
+        np.testing.assert_allclose(list(weights.values()), list(expected.values()), atol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
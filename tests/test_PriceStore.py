@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+import pandas as pd
+
+from PortfolioOptimizer.MarketDataProvider import MarketDataProvider
+from PortfolioOptimizer.PriceStore import PriceStore
+
+
+class _Monday(date):
+    @classmethod
+    def today(cls):
+        return cls(2024, 3, 4)
+
+
+def _download(tickers, start=None, end=None, period=None, auto_adjust=False):
+    # Fake yfinance multi-index frame with a constant price per ticker over the business days of the window,
+    # or over the last business days up to _Monday for a day period
+    if period:
+        dates = pd.bdate_range(end=_Monday.today(), periods=int(period[:-1]))
+    else:
+        dates = pd.bdate_range(start, end, inclusive='left')
+    columns = pd.MultiIndex.from_product([['Adj Close', 'Close'], tickers])
+    return pd.DataFrame(100.0, index=dates, columns=columns)
+
+
+class TestPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = PriceStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_missing_ranges(self):
+        series = pd.Series([1.0, 2.0], index=pd.to_datetime(["2023-01-03", "2023-01-04"]))
+        self.store.write("AAPL", "Adj Close", series, "2023-01-01", "2023-02-01")
+
+        self.assertEqual(self.store.missing_ranges("AAPL", "Adj Close", "2023-01-10", "2023-01-20"), [])
+        self.assertEqual(self.store.missing_ranges("AAPL", "Adj Close", "2022-12-01", "2023-03-01"),
+                         [(date(2022, 12, 1), date(2023, 1, 1)), (date(2023, 2, 1), date(2023, 3, 1))])
+        self.assertEqual(self.store.missing_ranges("MSFT", "Adj Close", "2023-01-01", "2023-02-01"),
+                         [(date(2023, 1, 1), date(2023, 2, 1))])
+
+    def test_write_overrides_and_read(self):
+        self.store.write("AAPL", "Adj Close", pd.Series([1.0, 2.0], index=pd.to_datetime(["2023-01-03", "2023-01-04"])),
+                         "2023-01-01", "2023-01-05")
+        self.store.write("AAPL", "Adj Close", pd.Series([3.0, 4.0], index=pd.to_datetime(["2023-01-04", "2023-01-05"])),
+                         "2023-01-04", "2023-01-06")
+
+        data = self.store.read(["AAPL", "MSFT"], "Adj Close", "2023-01-01", "2023-01-10")
+        self.assertEqual(list(data.columns), ["AAPL"])
+        self.assertEqual(data["AAPL"].tolist(), [1.0, 3.0, 4.0])
+        panel = self.store.read_panel(["AAPL", "MSFT"], "Adj Close", "2023-01-01", "2023-01-10")
+        self.assertEqual(panel.tickers, ["AAPL"])
+        self.assertEqual(panel.values[:, 0].tolist(), [1.0, 3.0, 4.0])
+
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download", side_effect=_download)
+    def test_get_data_only_fetches_gaps(self, mock_download):
+        provider = MarketDataProvider(price_store=self.store)
+        provider.get_data(["AAPL", "MSFT"], "2023-01-01", "2023-02-01")
+        data, tickers = provider.get_data(["AAPL", "MSFT"], "2023-01-15", "2023-03-01", return_updated_tickers=True)
+
+        self.assertEqual(mock_download.call_count, 2)
+        _, kwargs = mock_download.call_args
+        self.assertEqual((kwargs["start"], kwargs["end"]), ("2023-02-01", "2023-03-01"))
+        self.assertEqual(tickers, ["AAPL", "MSFT"])
+        self.assertEqual(data.index[0], pd.Timestamp("2023-01-16"))
+
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download", side_effect=_download)
+    def test_offline_replay(self, mock_download):
+        provider = MarketDataProvider(price_store=self.store)
+        provider.get_data(["AAPL"], "2023-01-01", "2023-02-01")
+        self.store.offline = True
+        data, tickers = provider.get_data(["AAPL", "MSFT"], "2022-01-01", "2023-03-01", return_updated_tickers=True)
+
+        self.assertEqual(mock_download.call_count, 1)
+        self.assertEqual(tickers, ["AAPL"])
+        self.assertFalse(data.empty)
+
+    @patch("PortfolioOptimizer.PriceStore.date", _Monday)
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download", side_effect=_download)
+    def test_day_periods_count_trading_days(self, mock_download):
+        # '5d' is the last 5 trading days for yfinance, over the week-end before _Monday
+        direct = MarketDataProvider().get_data(["AAPL"], period="5d")
+        stored = MarketDataProvider(price_store=self.store).get_data(["AAPL"], period="5d")
+
+        self.assertEqual(len(direct), 5)
+        self.assertEqual(list(stored.index), list(direct.index))
+        self.assertEqual(stored["AAPL"].tolist(), direct["AAPL"].tolist())
+
+    @patch("PortfolioOptimizer.MarketDataProvider.yf.download", side_effect=ConnectionError("offline"))
+    def test_failed_download_does_not_invalidate(self, mock_download):
+        MarketDataProvider.ticker_validity.clear()
+        provider = MarketDataProvider(price_store=self.store)
+        end = pd.Timestamp.today().normalize()
+        start = (end - pd.DateOffset(months=2)).date().isoformat()
+        data, tickers = provider.get_data(["AAPL"], start, end.date().isoformat(), return_updated_tickers=True)
+
+        self.assertEqual(tickers, [])
+        self.assertTrue(data.empty)
+        self.assertIsNone(MarketDataProvider.ticker_validity.get("AAPL"))
+
+
+if __name__ == '__main__':
+    unittest.main()
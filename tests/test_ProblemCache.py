@@ -0,0 +1,118 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from pypfopt import EfficientFrontier
+
+from PortfolioOptimizer.CovarianceCalculator import risk_factor
+from PortfolioOptimizer.EfficientFrontierCalculator import EfficientFrontierCalculator
+from PortfolioOptimizer.ProblemCache import PortfolioProblem, ProblemCache, problem_cache
+
+
+def _inputs(assets=8, seed=0):
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0, 0.1, (2, assets))
+    specific = rng.uniform(0.05, 0.2, assets)
+    Sigma = loadings.T @ loadings + np.diag(specific ** 2)
+    mu = rng.uniform(0.03, 0.15, assets)
+    return mu, Sigma, loadings, specific
+
+
+class TestProblemCache(unittest.TestCase):
+    def test_matches_pypfopt(self):
+        mu, Sigma, _, _ = _inputs()
+        cache = ProblemCache()
+        lower, upper = np.zeros(len(mu)), np.ones(len(mu))
+
+        weights, _ = cache.solve("max_sharpe", lower, upper, mu=mu - 0.02, G=risk_factor(Sigma))
+        expected = EfficientFrontier(mu, Sigma).max_sharpe(risk_free_rate=0.02)
+        np.testing.assert_allclose(weights, list(expected.values()), atol=1e-4)
+
+        weights, _ = cache.solve("min_volatility", lower, upper, G=risk_factor(Sigma))
+        expected = EfficientFrontier(mu, Sigma).min_volatility()
+        np.testing.assert_allclose(weights, list(expected.values()), atol=1e-4)
+
+    def test_second_solve_reuses_the_problem(self):
+        mu, Sigma, _, _ = _inputs()
+        cache = ProblemCache()
+        lower, upper = np.zeros(len(mu)), np.full(len(mu), 0.3)
+        _, first = cache.solve("max_sharpe", lower, upper, mu=mu - 0.02, G=risk_factor(Sigma))
+        other_mu, other_Sigma, _, _ = _inputs(seed=1)
+        weights, second = cache.solve("max_sharpe", lower, upper, mu=other_mu - 0.02, G=risk_factor(other_Sigma))
+
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual({key: cache.stats()[key] for key in ("problems", "hits", "misses")},
+                         {"problems": 1, "hits": 1, "misses": 1})
+        # The new inputs were used, not the ones the problem was compiled with
+        expected = EfficientFrontier(other_mu, other_Sigma, weight_bounds=(0, 0.3)).max_sharpe(risk_free_rate=0.02)
+        np.testing.assert_allclose(weights, list(expected.values()), atol=1e-4)
+
+    def test_factor_model_matches_dense(self):
+        mu, Sigma, loadings, specific = _inputs()
+        cache = ProblemCache()
+        lower, upper = np.zeros(len(mu)), np.ones(len(mu))
+        dense, _ = cache.solve("frontier_return", lower, upper, mu=mu, G=risk_factor(Sigma), target=0.1)
+        factored, _ = cache.solve("frontier_return", lower, upper, mu=mu, loadings=loadings, specific=specific,
+                                  target=0.1)
+        np.testing.assert_allclose(factored, dense, atol=1e-4)
+        self.assertEqual(cache.stats()["problems"], 2)
+
+    def test_large_dense_problems_are_not_kept(self):
+        mu, Sigma, _, _ = _inputs(assets=6)
+        cache = ProblemCache(max_dense_assets=5)
+        problem = cache.get("min_volatility", 6)
+        self.assertFalse(problem.parameterized)
+        weights, timing = cache.solve("min_volatility", np.zeros(6), np.ones(6), G=risk_factor(Sigma))
+        self.assertAlmostEqual(weights.sum(), 1, places=6)
+        self.assertFalse(timing["cached"])
+        self.assertEqual(cache.stats()["problems"], 0)
+
+    def test_least_recently_used_problems_are_evicted(self):
+        cache = ProblemCache(max_problems=2)
+        first = cache.get("min_volatility", 3)
+        cache.get("min_volatility", 4)
+        self.assertIs(cache.get("min_volatility", 3), first)
+        cache.get("min_volatility", 5)
+        self.assertEqual(cache.stats()["problems"], 2)
+        self.assertIs(cache.get("min_volatility", 3), first)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            PortfolioProblem("max_utility", 3)
+
+    def test_rebalance_solves_accounts_together(self):
+        mu, Sigma, loadings, specific = _inputs()
+        cache = ProblemCache()
+        n, accounts = len(mu), 3
+        current = np.random.default_rng(2).dirichlet(np.ones(n), accounts).T
+        inputs = {"lower": np.zeros((n, accounts)), "upper": np.ones((n, accounts)), "current": current,
+                  "costs": np.zeros((n, accounts)), "turnover": np.full(accounts, 2.0)}
+
+        # Without costs or limits, every account gets the portfolio of a plain solve
+        weights, _ = cache.solve("rebalance_max_sharpe", mu=mu - 0.02, G=risk_factor(Sigma), **inputs)
+        expected = EfficientFrontier(mu, Sigma).max_sharpe(risk_free_rate=0.02)
+        np.testing.assert_allclose(weights, np.repeat([list(expected.values())], accounts, axis=0).T, atol=1e-4)
+
+        inputs["turnover"] = np.array([0.1, 0.2, 2.0])
+        weights, _ = cache.solve("rebalance_min_volatility", loadings=loadings, specific=specific, **inputs)
+        np.testing.assert_allclose(weights.sum(axis=0), 1, atol=1e-4)
+        self.assertTrue(np.all(np.abs(weights - current).sum(axis=0) <= inputs["turnover"] + 1e-4))
+        self.assertEqual(cache.get("rebalance_min_volatility", n, 2, accounts=accounts).accounts, accounts)
+
+    def test_calculators_share_problems(self):
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0.0008, 0.01, (300, 5))
+        prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0),
+                              index=pd.bdate_range("2022-01-03", periods=300), columns=list("ABCDE"))
+        problem_cache.clear()
+        for data in (prices, prices * 1.5):
+            ef = EfficientFrontierCalculator(data, mu="mean historical return")
+            ef.calculate_efficient_frontier_weights()
+        self.assertEqual(ef.solver_timing["cached"], 1)
+        self.assertEqual(problem_cache.stats()["problems"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from PortfolioOptimizer.ResultCache import ResultCache
+
+
+def _request(**fields):
+    request = {"tickers": ["MSFT", "AAPL"], "start_date": "2023-01-01", "end_date": "2023-06-01",
+               "strategy": "max_sharpe", "risk_free_rate": 0.02, "views": None, "constraints": {"AAPL": 0.5, "MSFT": 0.6}}
+    request.update(fields)
+    return request
+
+
+class TestResultCache(unittest.TestCase):
+    def test_key_is_canonical(self):
+        key = ResultCache.key(_request())
+        self.assertEqual(ResultCache.key(_request(tickers=["AAPL", "MSFT", "AAPL"], start_date="2023-01-01T00:00:00",
+                                                  constraints={"MSFT": 0.6, "AAPL": 0.5})), key)
+        self.assertNotEqual(ResultCache.key(_request(strategy="hrp")), key)
+        self.assertNotEqual(ResultCache.key(_request(risk_free_rate=0.03)), key)
+
+    def test_hit_miss_and_byte_eviction(self):
+        cache = ResultCache(max_bytes=900)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"weights": {"AAPL": np.float64(0.5)}}, "2023-05-31", "2023-06-01")
+        self.assertEqual(cache.get("a"), {"weights": {"AAPL": 0.5}})
+
+        cache.put("b", {"payload": "x" * 300}, "2023-05-31", "2023-06-01")
+        cache.put("c", {"payload": "x" * 300}, "2023-05-31", "2023-06-01")
+        stats = cache.stats()
+        self.assertLessEqual(stats["bytes"], 900)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((stats["hits"], cache.stats()["misses"]), (1, 2))
+
+    def test_disk_tier_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ResultCache(directory=tmp).put("a", [1, 2, 3], "2023-05-31", "2023-06-01")
+            other = ResultCache(directory=tmp)
+            self.assertEqual(other.get("a"), [1, 2, 3])
+            self.assertEqual(other.stats()["disk_hits"], 1)
+            self.assertEqual(other.stats()["entries"], 1)
+
+    def test_stale_once_a_newer_bar_is_due(self):
+        cache = ResultCache()
+        # Window up to today: computed on Wednesday 2024-03-13 with Tuesday's bar
+        with patch.object(ResultCache, "_today", return_value=datetime.date(2024, 3, 13)):
+            cache.put("live", "result", "2024-03-12", "2024-12-31")
+            cache.put("past", "result", "2024-02-29", "2024-03-01")
+            self.assertEqual(cache.get("live"), "result")
+        # Thursday: Wednesday's bar is now available
+        with patch.object(ResultCache, "_today", return_value=datetime.date(2024, 3, 14)):
+            self.assertIsNone(cache.get("live"))
+            self.assertEqual(cache.get("past"), "result")
+            self.assertEqual(cache.stats()["stale"], 1)
+
+    def test_holiday_does_not_invalidate(self):
+        cache = ResultCache()
+        # Computed on Tuesday 2024-01-02: the data ends on Friday 2023-12-29, Monday was a holiday
+        with patch.object(ResultCache, "_today", return_value=datetime.date(2024, 1, 2)):
+            cache.put("live", "result", "2023-12-29", "2024-12-31")
+            self.assertEqual(cache.get("live"), "result")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import integrate
+from scipy.stats import norm
+
+from PortfolioOptimizer.RiskMetrics import RiskMetrics
+
+
+def _returns(days=750, seed=0):
+    # Fat tailed daily returns, with a few large losses
+    rng = np.random.default_rng(seed)
+    returns = 0.0004 + 0.01 * rng.standard_t(4, days) / np.sqrt(2)
+    returns[rng.random(days) < 0.02] -= 0.03
+    return pd.Series(returns, index=pd.bdate_range("2021-01-04", periods=days))
+
+
+class TestRiskMetrics(unittest.TestCase):
+    def setUp(self):
+        self.returns = _returns()
+        self.metrics = RiskMetrics(self.returns, expected_return=self.returns.mean() * 252,
+                                   volatility=self.returns.std() * np.sqrt(252))
+
+    def test_parametric_closed_form(self):
+        var, cvar = self.metrics.parametric([0.95, 0.99])
+        mu, sigma = self.returns.mean(), self.returns.std()
+        np.testing.assert_allclose(var, norm.ppf([0.05, 0.01], mu, sigma))
+        # Mean of the normal tail below the VaR
+        tail = [integrate.quad(lambda x: x * norm.pdf(x, mu, sigma), -np.inf, v)[0] / (1 - c)
+                for v, c in zip(var, [0.95, 0.99])]
+        np.testing.assert_allclose(cvar, tail, rtol=1e-7)
+
+    def test_historical(self):
+        var, cvar = self.metrics.historical([0.95, 0.99])
+        np.testing.assert_allclose(var, np.percentile(self.returns, [5, 1]))
+        for v, c in zip(var, cvar):
+            self.assertAlmostEqual(c, self.returns[self.returns <= v].mean(), places=14)
+
+    def test_cornish_fisher(self):
+        skewness, kurtosis = self.metrics._higher_moments()
+        self.assertAlmostEqual(skewness, self.returns.skew(), places=1)
+
+        var, cvar = self.metrics.cornish_fisher([0.95, 0.99])
+        # Fat tails: the 99% VaR is beyond the normal one
+        parametric_var, _ = self.metrics.parametric([0.95, 0.99])
+        self.assertLess(var[1], parametric_var[1])
+
+        # The CVaR is the mean of the Cornish-Fisher quantile over the tail
+        def quantile(u):
+            z = norm.ppf(u)
+            return self.metrics.mu + self.metrics.sigma * (
+                z + (z ** 2 - 1) * skewness / 6 + (z ** 3 - 3 * z) * kurtosis / 24
+                - (2 * z ** 3 - 5 * z) * skewness ** 2 / 36)
+        for level, c in zip([0.95, 0.99], cvar):
+            alpha = 1 - level
+            self.assertAlmostEqual(c, integrate.quad(quantile, 0, alpha)[0] / alpha, places=9)
+
+    def test_value_at_risk_is_deterministic(self):
+        rows = self.metrics.value_at_risk([0.95, 0.99])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows, self.metrics.value_at_risk([0.95, 0.99]))
+        self.assertEqual({row["method"] for row in rows}, set(RiskMetrics.METHODS))
+        for row in rows:
+            self.assertLessEqual(row["cvar"], row["var"])
+
+    def test_sortino_matches_downside_deviation(self):
+        downside = self.returns[self.returns < 0]
+        expected = (0.1 - 0.02) / (downside.std() * np.sqrt(252))
+        self.assertAlmostEqual(self.metrics.sortino_ratio(0.1, risk_free_rate=0.02), expected, places=12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+from pypfopt import BlackLittermanModel
+
+from PortfolioOptimizer.ViewCompiler import ViewCompiler, idzorek_omega, omega_proportional_to_prior
+
+
+class TestViewCompiler(unittest.TestCase):
+    def setUp(self):
+        self.compiler = ViewCompiler(["A", "B", "C", "D"])
+        rng = np.random.default_rng(0)
+        B = rng.normal(0, 0.1, (4, 6))
+        self.Sigma = B @ B.T
+
+    def test_compile(self):
+        P, Q, confidences = self.compiler.compile([
+            {'type': 'absolute', 'asset': 'B', 'return': 0.05},
+            {'type': 'relative', 'asset1': 'A', 'asset2': 'D', 'difference': 0.02, 'confidence': 0.7},
+            {'type': 'absolute', 'assets': ['C', 'A'], 'returns': [0.03, 0.04], 'confidences': [0.2, 0.9]},
+            {'type': 'portfolio', 'weights': {'A': 0.5, 'B': 0.5, 'C': -1}, 'return': 0.01},
+        ])
+        np.testing.assert_array_equal(P.toarray(), [[0, 1, 0, 0], [1, 0, 0, -1], [0, 0, 1, 0], [1, 0, 0, 0],
+                                                    [0.5, 0.5, -1, 0]])
+        np.testing.assert_array_equal(Q, [0.05, 0.02, 0.03, 0.04, 0.01])
+        np.testing.assert_array_equal(confidences, [np.nan, 0.7, 0.2, 0.9, np.nan])
+
+    def test_invalid_views(self):
+        with self.assertRaisesRegex(ValueError, "unknown assets: X"):
+            self.compiler.compile([{'type': 'absolute', 'asset': 'X', 'return': 0.05}])
+        with self.assertRaises(ValueError):
+            self.compiler.compile([{'type': 'ranking', 'assets': ['A', 'B']}])
+        with self.assertRaises(ValueError):
+            self.compiler.compile([{'type': 'absolute', 'asset': 'A', 'return': 0.05, 'confidence': 1.5}])
+        with self.assertRaisesRegex(ValueError, "one confidence per asset"):
+            self.compiler.compile([{'type': 'absolute', 'assets': ['A', 'B'], 'returns': [0.05, 0.06],
+                                    'confidences': [0.5]}])
+
+    def test_restrict(self):
+        views = [
+            {'type': 'absolute', 'asset': 'X', 'return': 0.05},
+            {'type': 'relative', 'asset1': 'A', 'asset2': 'D', 'difference': 0.02},
+            {'type': 'absolute', 'assets': ['X', 'A'], 'returns': [0.03, 0.04], 'confidences': [0.2, 0.9]},
+            {'type': 'portfolio', 'weights': {'A': 0.5, 'X': 0.5}, 'return': 0.01},
+        ]
+        self.assertEqual(self.compiler.restrict(views), [
+            views[1], {'type': 'absolute', 'assets': ['A'], 'returns': [0.04], 'confidences': [0.9]}])
+        self.compiler.compile(self.compiler.restrict(views))
+
+    def test_no_views(self):
+        P, Q, confidences = self.compiler.compile([])
+        self.assertEqual(P.shape, (0, 4))
+        self.assertEqual(len(Q), 0)
+
+    def test_omega(self):
+        P, Q, _ = self.compiler.compile([
+            {'type': 'absolute', 'asset': 'B', 'return': 0.05},
+            {'type': 'relative', 'asset1': 'A', 'asset2': 'D', 'difference': 0.02},
+        ])
+        dense = P.toarray()
+        np.testing.assert_allclose(omega_proportional_to_prior(P, self.Sigma, tau=0.1),
+                                   np.diag(dense @ np.diag(np.diag(self.Sigma)) @ dense.T) * 0.1)
+
+        confidences = np.array([0.3, 0.8])
+        expected = BlackLittermanModel.idzorek_method(confidences, self.Sigma, np.zeros(4), Q, dense, 0.05)
+        np.testing.assert_allclose(idzorek_omega(P, self.Sigma, confidences), np.diag(expected))
+        np.testing.assert_array_equal(idzorek_omega(P, self.Sigma, np.array([0.0, 1.0])), [np.inf, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
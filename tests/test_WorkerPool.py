@@ -0,0 +1,32 @@
+import unittest
+
+from PortfolioOptimizer.WorkerPool import WorkerPool
+
+
+def _inverse(x):
+    return 1 / x
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool("test", max_workers=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_tracked_executor_counts_tasks(self):
+        executor = self.pool.tracked_executor
+        self.assertEqual(list(executor.map(_inverse, [1, 2, 4])), [1, 0.5, 0.25])
+        with self.assertRaises(ZeroDivisionError):
+            executor.submit(_inverse, 0).result()
+        # Tasks are counted by their done callbacks, run by the workers once the results are set
+        self.pool.executor.shutdown(wait=True)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["completed"], 4)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
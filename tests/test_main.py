@@ -1,8 +1,12 @@
+import base64
+import json
 import pytest
+import numpy as np
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 import pandas as pd
-from main import app
+from main import app, result_cache
+from PortfolioOptimizer.PricePanel import PricePanel
 
 client = TestClient(app)
 
@@ -10,7 +14,9 @@ client = TestClient(app)
 def mock_market_data():
     with patch("main.MarketDataProvider") as MockProvider, \
          patch("main.EfficientFrontierCalculator") as MockEF, \
-         patch("main.BlackLitterman") as MockBL:
+         patch("main.BlackLitterman") as MockBL, \
+         patch("main.get_market_inputs"):
+        result_cache.clear()
         
         # Mock Market Data
         instance = MockProvider.return_value
@@ -31,10 +37,17 @@ def mock_market_data():
         ef_instance = MockEF.return_value
         ef_instance.calculate_efficient_frontier_weights.return_value = {"AAPL": 0.6, "MSFT": 0.4}
         ef_instance.calculate_efficient_frontier_performance.return_value = (0.1, 0.2, 1.5)
+        ef_instance.calculate_frontier.return_value = {
+            "tickers": ["AAPL", "MSFT"], "returns": [0.1, 0.2], "volatilities": [0.15, 0.25],
+            "sharpe_ratios": [0.53, 0.72], "weights": [[0.7, 0.3], [0.0, 1.0]]
+        }
+        ef_instance.solver_timing = {"solves": 1, "cached": 0, "compile_seconds": 0.01, "solve_seconds": 0.002}
 
         # Mock Black Litterman
         bl_instance = MockBL.return_value
         bl_instance.optimize_with_black_litterman.return_value = ({"AAPL": 0.5, "MSFT": 0.5}, 0.1, 0.15, 1.2)
+        bl_instance.solver_timing = {"problem": "max_sharpe", "assets": 2, "cached": True, "compile_seconds": 0.0,
+                                     "solve_seconds": 0.002}
         
         yield instance
 
@@ -49,6 +62,17 @@ def test_analyze_max_sharpe(mock_market_data):
     data = response.json()
     assert "weights" in data
     assert "performance" in data
+    # Parametric VaR of the mocked performance: 0.1 annual return, 0.2 annual volatility
+    assert data["performance"]["var_95"] == pytest.approx(0.1 / 252 - 1.6448536 * 0.2 / np.sqrt(252))
+    assert {row["method"] for row in data["performance"]["value_at_risk"]} == {"parametric", "historical", "cornish_fisher"}
+    assert data["solver_timing"]["solves"] == 1
+    allocation = data["discrete_allocation"]
+    assert sum(allocation["values"].values()) + allocation["leftover"] == pytest.approx(10000)
+    assert allocation["leftover"] < 102
+
+    response = client.post("/api/analyze", json={"tickers": ["AAPL", "MSFT"], "start_date": "2023-01-01",
+                                                 "end_date": "2023-01-03", "allocation_method": "round"})
+    assert response.status_code == 400
 
 def test_analyze_hrp(mock_market_data):
     response = client.post("/api/analyze", json={
@@ -61,6 +85,91 @@ def test_analyze_hrp(mock_market_data):
     data = response.json()
     assert "weights" in data
 
+def test_analyze_aligned(mock_market_data):
+    rng = np.random.default_rng(0)
+    prices = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0005, 0.01, (40, 2)), axis=0),
+                          index=pd.bdate_range("2023-01-02", periods=40), columns=["AAPL", "MSFT"])
+    prices.iloc[[3, 10], 0] = np.nan
+    prices.iloc[5, 1] = np.nan
+    mock_market_data.get_data.side_effect = lambda *args, **kwargs: (prices, ["AAPL", "MSFT"])
+    request = {"tickers": ["AAPL", "MSFT"], "start_date": "2023-01-01", "end_date": "2023-03-01", "strategy": "hrp"}
+
+    response = client.post("/api/analyze", json={**request, "calendar": "union"})
+    assert response.status_code == 200
+    assert response.json()["alignment"]["filled"] == {"AAPL": 2, "MSFT": 1}
+
+    response = client.post("/api/analyze", json={**request, "calendar": "intersection"})
+    assert response.status_code == 200
+    assert response.json()["alignment"]["dropped_dates"] == 3
+
+    response = client.post("/api/analyze", json={**request, "calendar": "exchange"})
+    assert response.status_code == 400
+
+    # Assets that share no day of returns after the alignment have no covariance
+    prices.iloc[20:, 0] = np.nan
+    prices.iloc[:20, 1] = np.nan
+    response = client.post("/api/analyze", json={**request, "calendar": "union", "ffill_limit": 0})
+    assert response.status_code == 400
+    assert "fewer than 2 days" in response.json()["detail"]
+
+def test_analyze_no_data(mock_market_data):
+    mock_market_data.get_data.side_effect = lambda *args, **kwargs: (pd.DataFrame(), [])
+    response = client.post("/api/analyze", json={
+        "tickers": ["UNKNOWN"],
+        "start_date": "2023-01-01",
+        "end_date": "2023-01-03"
+    })
+    assert response.status_code == 400
+
+def test_metrics(mock_market_data):
+    client.post("/api/analyze", json={
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2023-01-01",
+        "end_date": "2023-01-03"
+    })
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["requests"]["in_flight"] == 0
+    assert data["cpu_pool"]["completed"] >= 1
+    assert data["io_pool"]["queued"] == 0
+    assert "hits" in data["problem_cache"]
+
+def test_frontier(mock_market_data):
+    response = client.post("/api/frontier", json={
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2023-01-01",
+        "end_date": "2023-01-03",
+        "n_points": 2
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["returns"]) == 2
+    assert len(data["weights"][0]) == 2
+
+def test_black_litterman_sensitivity(mock_market_data):
+    grid = {"tickers": ["AAPL", "MSFT"], "omega_taus": [0.05], "deltas": [1.0, 2.0], "confidences": [None, 0.5],
+            "weights": [[[[0.5, 0.5], [0.6, 0.4]], [[0.5, 0.5], None]]]}
+    with patch("main.BlackLitterman") as MockBL:
+        MockBL.return_value.sensitivity.return_value = grid
+        response = client.post("/api/black_litterman/sensitivity", json={
+            "tickers": ["AAPL", "MSFT"],
+            "start_date": "2023-01-01",
+            "end_date": "2023-01-03",
+            "views": [{"type": "absolute", "asset": "AAPL", "return": 0.1}],
+            "deltas": [1.0, 2.0],
+            "confidences": [[None], 0.5]
+        })
+        assert response.status_code == 200
+        assert response.json() == grid
+        assert MockBL.return_value.sensitivity.call_args.kwargs["confidences"] == [[None], 0.5]
+
+    response = client.post("/api/black_litterman/sensitivity", json={
+        "tickers": ["AAPL"], "start_date": "2023-01-01", "end_date": "2023-01-03", "views": [],
+        "omega_taus": [0.01] * 1001
+    })
+    assert response.status_code == 400
+
 def test_analyze_black_litterman(mock_market_data):
     response = client.post("/api/analyze", json={
         "tickers": ["AAPL", "MSFT"],
@@ -74,12 +183,11 @@ def test_analyze_black_litterman(mock_market_data):
     assert "weights" in data
 
 def test_simulate(mock_market_data):
-    # Mocking MeanHistoricalReturnCalculator and SampleCovarianceCalculator inside main
-    with patch("main.MeanHistoricalReturnCalculator") as MockMean, \
-         patch("main.SampleCovarianceCalculator") as MockCov:
-        
-        MockMean.return_value.calculate_expected_return.return_value = pd.Series([0.1, 0.1], index=["AAPL", "MSFT"])
-        MockCov.return_value.calculate_covariance.return_value = pd.DataFrame([[0.04, 0], [0, 0.04]], index=["AAPL", "MSFT"], columns=["AAPL", "MSFT"])
+    # Mocking the mean returns and covariance of the MarketState inside main
+    with patch("main.get_market_state") as MockState:
+
+        MockState.return_value.mean_historical_return.return_value = pd.Series([0.1, 0.1], index=["AAPL", "MSFT"])
+        MockState.return_value.covariance = pd.DataFrame([[0.04, 0], [0, 0.04]], index=["AAPL", "MSFT"], columns=["AAPL", "MSFT"])
 
         response = client.post("/api/simulate", json={
             "tickers": ["AAPL", "MSFT"],
@@ -90,3 +198,180 @@ def test_simulate(mock_market_data):
         assert response.status_code == 200
         data = response.json()
         assert "p50" in data
+
+def test_simulate_stream(mock_market_data):
+    with patch("main.get_market_state") as MockState:
+
+        MockState.return_value.mean_historical_return.return_value = pd.Series([0.1, 0.1], index=["AAPL", "MSFT"])
+        MockState.return_value.covariance = pd.DataFrame([[0.04, 0], [0, 0.04]], index=["AAPL", "MSFT"], columns=["AAPL", "MSFT"])
+
+        request = {
+            "tickers": ["AAPL", "MSFT"],
+            "weights": {"AAPL": 0.5, "MSFT": 0.5},
+            "start_date": "2023-01-01",
+            "end_date": "2023-01-03",
+            "num_simulations": 5000,
+            "time_horizon": 20,
+            "seed": 1
+        }
+        response = client.post("/api/simulate/stream", json=request)
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        # Bands refined as paths complete, the last one covering every path
+        assert [line["paths"] for line in lines] == [1024, 2048, 4096, 5000]
+        assert [line["done"] for line in lines] == [False, False, False, True]
+        p50 = np.frombuffer(base64.b64decode(lines[-1]["p50"]), dtype="<f4")
+        assert len(p50) == 20
+        assert p50[0] == 10000
+
+def test_analyze_unknown_covariance_method(mock_market_data):
+    response = client.post("/api/analyze", json={
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2023-01-01",
+        "end_date": "2023-01-03",
+        "covariance_method": "unknown"
+    })
+    assert response.status_code == 400
+
+def test_analyze_served_from_cache(mock_market_data):
+    request = {
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2023-01-01",
+        "end_date": "2023-01-03",
+        "strategy": "max_sharpe"
+    }
+    first = client.post("/api/analyze", json=request)
+    second = client.post("/api/analyze", json={**request, "tickers": ["MSFT", "AAPL"]})
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert mock_market_data.get_data.call_count == 1
+    cache_stats = client.get("/api/metrics").json()["result_cache"]
+    assert (cache_stats["hits"], cache_stats["misses"]) == (1, 1)
+
+def test_analyze_batch(mock_market_data):
+    job = {"tickers": ["AAPL", "MSFT"], "start_date": "2023-01-01", "end_date": "2023-01-03"}
+    response = client.post("/api/analyze/batch", json={"jobs": [
+        {**job, "strategy": "max_sharpe"},
+        {**job, "tickers": ["MSFT"], "strategy": "hrp"},
+        {**job, "covariance_method": "unknown"},
+    ]})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    jobs = {line["job"]: line for line in lines[:-1]}
+
+    assert jobs[0]["result"]["weights"] == {"AAPL": 0.6, "MSFT": 0.4}
+    assert jobs[1]["result"]["weights"] == {"MSFT": 1.0}
+    assert jobs[2]["status_code"] == 400
+    assert lines[-1] == {"done": True, "jobs": 3, "failed": 1}
+    # The tickers of the window are downloaded once for every job
+    mock_market_data.get_data.assert_called_once()
+    assert mock_market_data.get_data.call_args.kwargs["tickers"] == ["AAPL", "MSFT"]
+
+def test_backtest(mock_market_data):
+    dates = pd.bdate_range("2022-01-03", periods=120)
+    rng = np.random.default_rng(0)
+    prices = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0005, 0.01, (120, 2)), axis=0),
+                          index=dates, columns=["AAPL", "MSFT"])
+    mock_market_data.get_panel.side_effect = lambda *args, **kwargs: (PricePanel.from_frame(prices), ["AAPL", "MSFT"])
+
+    response = client.post("/api/backtest", json={
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2022-01-01",
+        "end_date": "2022-07-01",
+        "strategy": "hrp",
+        "lookback": 40
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rebalances"][0]["date"] == "2022-02-28"
+    assert len(data["values"]) == len(data["dates"])
+    assert "max_drawdown" in data["performance"]
+
+    response = client.post("/api/backtest", json={
+        "tickers": ["AAPL", "MSFT"],
+        "start_date": "2022-01-01",
+        "end_date": "2022-07-01",
+        "lookback": 500
+    })
+    assert response.status_code == 400
+
+def test_allocate(mock_market_data):
+    response = client.post("/api/allocate", json={
+        "weights": [{"AAPL": 0.6, "MSFT": 0.4}],
+        "budgets": [1000, 50000],
+        "method": "milp"
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["prices"] == {"AAPL": 102.0, "MSFT": 204.0}
+    assert len(data["accounts"]) == 2
+    for account, budget in zip(data["accounts"], [1000, 50000]):
+        assert sum(account["values"].values()) + account["leftover"] == pytest.approx(budget)
+        assert account["leftover"] < 102
+
+    response = client.post("/api/allocate", json={
+        "weights": [{"AAPL": 1.0}, {"MSFT": 1.0}],
+        "budgets": [1000, 1000, 1000],
+        "prices": {"AAPL": 100, "MSFT": 200}
+    })
+    assert response.status_code == 400
+
+    response = client.post("/api/allocate", json={
+        "weights": [{"AAPL": 1.0}, {"TSLA": 1.0}],
+        "budgets": [1000, 1000],
+        "prices": {"AAPL": 100, "MSFT": 200}
+    })
+    assert response.status_code == 400
+
+def test_analyze_rebalance(mock_market_data):
+    request = {"tickers": ["AAPL", "MSFT"], "start_date": "2023-01-01", "end_date": "2023-01-03",
+               "current_weights": {"AAPL": 0.3, "MSFT": 0.6}, "proportional_cost": 0.001, "fixed_cost": 1.0}
+    with patch("main.EfficientFrontierCalculator") as MockEF:
+        ef_instance = MockEF.return_value
+        ef_instance.calculate_rebalance_weights.return_value = {"AAPL": 0.4, "MSFT": 0.6}
+        ef_instance.calculate_efficient_frontier_performance.return_value = (0.1, 0.2, 1.5)
+        ef_instance.solver_timing = {"solves": 1, "cached": 0, "compile_seconds": 0.01, "solve_seconds": 0.002}
+        response = client.post("/api/analyze", json={**request, "max_turnover": 0.2})
+    assert response.status_code == 200
+    assert ef_instance.calculate_rebalance_weights.call_args.kwargs["max_turnover"] == 0.2
+    rebalance = response.json()["rebalance"]
+    assert rebalance["trades"] == [{"ticker": "AAPL", "action": "buy", "weight": 0.1, "value": pytest.approx(1000)}]
+    assert rebalance["transaction_cost"] == pytest.approx(2.0)
+
+    response = client.post("/api/analyze", json={**request, "strategy": "hrp", "max_turnover": 0.2})
+    assert response.status_code == 400
+    response = client.post("/api/analyze", json={**request, "current_weights": {"AAPL": 0.7, "MSFT": 0.6}})
+    assert response.status_code == 400
+    response = client.post("/api/analyze", json={**request, "current_weights": None, "max_trade": 0.1})
+    assert response.status_code == 400
+
+def test_rebalance(mock_market_data):
+    with patch("main.EfficientFrontierCalculator") as MockEF:
+        ef_instance = MockEF.return_value
+        ef_instance.rebalance_accounts.return_value = pd.DataFrame([[0.5, 0.5], [0.2, 0.8]],
+                                                                   columns=["AAPL", "MSFT"])
+        ef_instance.solver_timing = {"solves": 1, "cached": 0, "compile_seconds": 0.01, "solve_seconds": 0.002}
+        response = client.post("/api/rebalance", json={
+            "tickers": ["AAPL", "MSFT"],
+            "start_date": "2023-01-01",
+            "end_date": "2023-01-03",
+            "accounts": [{"current_weights": {"AAPL": 0.5, "MSFT": 0.5}},
+                         {"current_weights": {"AAPL": 0.5, "MSFT": 0.5}, "portfolio_value": 50000}],
+            "max_turnover": 0.6
+        })
+    assert response.status_code == 200
+    assert ef_instance.rebalance_accounts.call_args.kwargs["portfolio_values"] == [10000.0, 50000]
+    accounts = response.json()["accounts"]
+    assert accounts[0]["trades"] == []
+    assert accounts[1]["weights"] == {"AAPL": 0.2, "MSFT": 0.8}
+    trades = {trade["ticker"]: trade for trade in accounts[1]["trades"]}
+    assert trades["AAPL"]["value"] == pytest.approx(-15000)
+    assert trades["MSFT"]["action"] == "buy"
+
+    response = client.post("/api/rebalance", json={
+        "tickers": ["AAPL", "MSFT"], "start_date": "2023-01-01", "end_date": "2023-01-03",
+        "accounts": [{"current_weights": {"AAPL": 1.0}}], "strategy": "hrp"
+    })
+    assert response.status_code == 400
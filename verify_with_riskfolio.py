@@ -29,3 +29,15 @@ w_rp = port.optimization(model='HRP', codependence='pearson', rm='MV', rf=0.02,
 
 print("\nRiskfolio-Lib Weights:")
 print(w_rp.sort_values(by='weights', ascending=False))
+
+# 3. Native HRP with the same settings (riskfolio orders the dendrogram leaves optimally by default)
+from PortfolioOptimizer.HRPCalculator import HRPCalculator
+
+hrp = HRPCalculator(returns=data.pct_change().dropna(), linkage_method='single', optimal_ordering=True)
+w_native = pd.Series(hrp.calculate_weights(cutoff=0, rounding=None), name='native')
+
+comparison = pd.concat([w_rp['weights'].rename('riskfolio'), w_native], axis=1)
+comparison['difference'] = comparison['native'] - comparison['riskfolio']
+print("\nNative HRP vs Riskfolio-Lib:")
+print(comparison.sort_values(by='riskfolio', ascending=False))
+print(f"\nMax absolute difference: {comparison['difference'].abs().max():.2e}")